@@ -8,6 +8,7 @@ from pathlib import Path
 
 import jeolm
 import jeolm.project
+import jeolm.records
 import jeolm.target
 import jeolm.commands
 import jeolm.logging
@@ -48,6 +49,15 @@ def _jobs_arg(arg):
         raise argparse.ArgumentTypeError("positive integer expected")
     return jobs
 
+def _bundle_arg(arg):
+    from jeolm.node_factory.target import TargetNodeFactory
+    bundle = Path(arg)
+    try:
+        TargetNodeFactory.get_bundle_node_class(bundle)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from error
+    return bundle
+
 def main(args):
     jeolm.logging.setup_logging(level=args.log_level, colour=args.colour)
     nice_level = os.nice(args.nice)
@@ -87,6 +97,10 @@ def _add_build_arg_subparser(subparsers):
     parser.add_argument( '-D', '--no-delegate',
         help="ignore the possibility of delegating targets",
         action='store_false', dest='delegate' )
+    parser.add_argument( '-r', '--review-stale',
+        help="review source files changed since they were reviewed "
+            "before building",
+        action='store_true' )
     archive_group = parser.add_mutually_exclusive_group()
     archive_group.add_argument( '-z', '--sources-zip',
         help="pack source files in a ZIP archive for each target built",
@@ -94,9 +108,31 @@ def _add_build_arg_subparser(subparsers):
     archive_group.add_argument( '-s', '--sources-tar-gz',
         help="pack source files in a .tar.gz archive for each target built",
         action='store_const', dest='archive', const='tgz' )
+    archive_group.add_argument( '--sources-tar-xz',
+        help="pack source files in a .tar.xz archive for each target built "
+            "(requires xz)",
+        action='store_const', dest='archive', const='txz' )
+    archive_group.add_argument( '--sources-tar-zst',
+        help="pack source files in a .tar.zst archive for each target built "
+            "(requires zstd)",
+        action='store_const', dest='archive', const='tzst' )
+    parser.add_argument( '-b', '--sources-bundle',
+        help="pack source files of all targets built in a single archive, "
+            "storing each distinct file once; "
+            "archive format is chosen by suffix "
+            "(.zip, .tgz, .tar.xz or .tar.zst); "
+            "path is relative to the project root",
+        metavar='ARCHIVE', dest='bundle', type=_bundle_arg )
     parser.add_argument( '-j', '--jobs',
-        help="number of parallel jobs",
+        help="number of parallel jobs "
+            "(also used for producing document recipes)",
         type=_jobs_arg, default=1 )
+    parser.add_argument( '--profile-driver',
+        help="profile production of document recipes "
+            "(with recipe cache bypassed and no parallel production), "
+            "print a report and write collapsed stacks "
+            "(for flamegraph.pl) to build/driver.profile.folded",
+        action='store_true' )
     parser.set_defaults(command_func=main_build, force=None, archive=None)
 
 def main_build(args, *, project):
@@ -107,21 +143,52 @@ def main_build(args, *, project):
         logger.warning("No-op: no targets for building")
     PathNode.root = project.root
     node_updater = _build_get_node_updater(args.jobs)
-    driver = jeolm.commands.simple_load_driver(project)
-
-    target_node_factory = TargetNodeFactory(project=project, driver=driver)
-    target_node = target_node_factory( args.targets,
-        delegate=args.delegate, archive=args.archive )
+    driver = jeolm.commands.simple_load_driver( project,
+        review_stale=args.review_stale )
+
+    profiler = None
+    if args.profile_driver:
+        from jeolm.driver.profiling import DriverProfiler
+        profiler = DriverProfiler()
+    target_node_factory = TargetNodeFactory( project=project, driver=driver,
+        persistent_recipes=profiler is None )
+    # Building starts as soon as the first documents are constructed
+    nodes = target_node_factory.generate_nodes( args.targets,
+        delegate=args.delegate, archive=args.archive,
+        bundle=( None if args.bundle is None
+            else project.root / args.bundle ),
+        jobs=args.jobs if profiler is None else 1 )
     if args.force is None:
         pass
     elif args.force == 'latex':
-        _build_force_latex(target_node)
+        nodes = _build_forcing(nodes, _build_force_latex)
     elif args.force == 'generate':
-        _build_force_generate(target_node)
+        nodes = _build_forcing(nodes, _build_force_generate)
     else:
         raise RuntimeError(args.force)
-    with suppress(NodeErrorReported):
-        node_updater.update(target_node)
+    if profiler is None:
+        with suppress(NodeErrorReported):
+            node_updater.update_stream(nodes)
+        return
+    try:
+        with suppress(NodeErrorReported), profiler.profiling():
+            node_updater.update_stream(nodes)
+    finally:
+        _build_report_profile(profiler, project=project)
+
+def _build_report_profile(profiler, *, project):
+    print(profiler.format_report())
+    collapsed_path = project.build_dir / 'driver.profile.folded'
+    with collapsed_path.open('w') as collapsed_file:
+        profiler.write_collapsed(collapsed_file)
+    logger.info(
+        "Driver profile stacks are written to <CYAN>%(path)s<NOCOLOUR>",
+        dict(path=collapsed_path.relative_to(project.root)) )
+
+def _build_forcing(nodes, force_function):
+    for node in nodes:
+        force_function(node)
+        yield node
 
 def _build_force_latex(target_node):
     from jeolm.node.latex import LaTeXNode
@@ -177,6 +244,9 @@ def _add_review_arg_subparser(subparsers):
         help="review given infiles" )
     parser.add_argument( 'inpaths',
         nargs='*', metavar='INPATH' )
+    parser.add_argument( '-j', '--jobs',
+        help="number of parallel processes querying source files",
+        type=_jobs_arg, default=1 )
     parser.set_defaults(command_func=main_review)
 
 def main_review(args, *, project):
@@ -188,7 +258,8 @@ def main_review(args, *, project):
     metadata.load_metadata_cache()
     with log_metadata_diff(metadata, logger=logger):
         review( args.inpaths,
-            viewpoint=Path.cwd(), project=project, metadata=metadata )
+            viewpoint=Path.cwd(), project=project, metadata=metadata,
+            jobs=args.jobs )
     metadata.dump_metadata_cache()
 
 
@@ -248,6 +319,30 @@ def main_list(args, *, project):
     for path in paths:
         print(path)
 
+####################
+# query
+
+def _add_query_arg_subparser(subparsers):
+    parser = subparsers.add_parser( 'query',
+        help="list records having all given attributes" )
+    parser.add_argument( 'stems',
+        nargs='+', metavar='ATTRIBUTE',
+        help="attribute key stem, like $figure$able "
+            "(leading $ may be omitted)" )
+    parser.add_argument( '-p', '--path',
+        help="only list records under this path",
+        type=jeolm.records.RecordPath )
+    parser.set_defaults(command_func=main_query)
+
+def main_query(args, *, project):
+    driver = jeolm.commands.simple_load_driver(project)
+    stems = [
+        stem if stem.startswith('$') else '$' + stem
+        for stem in args.stems ]
+    for path in driver.query(*stems, path=args.path):
+        print(path)
+
+
 ####################
 # spell
 
@@ -345,6 +440,7 @@ def _get_arg_parser():
     _add_review_arg_subparser(subparsers)
     _add_init_arg_subparser(subparsers)
     _add_list_arg_subparser(subparsers)
+    _add_query_arg_subparser(subparsers)
     _add_spell_arg_subparser(subparsers)
     _add_makefile_arg_subparser(subparsers)
     _add_clean_arg_subparser(subparsers)
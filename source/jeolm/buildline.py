@@ -42,6 +42,10 @@ class BuildLine:
         self.metadata.review(PurePosixPath())
         self.driver = (self.project.driver_class)()
         self.metadata.feed_metadata(self.driver)
+        # nodes are kept between builds
+        self.target_node_factory = \
+            jeolm.node_factory.target.TargetNodeFactory(
+                project=self.project, driver=self.driver, )
         self.history_filename = str(self.project.build_dir/'buildline.history')
 
     @contextmanager
@@ -72,7 +76,9 @@ class BuildLine:
         if not review_list:
             return
 
-        with log_metadata_diff(self.metadata, logger=logger):
+        # driver records are fed again on exit
+        with log_metadata_diff( self.metadata, logger=logger,
+                fed_records=self.driver ):
             for review_path in review_list:
                 inpath, = jeolm.commands.review.resolve_inpaths(
                     [review_path], source_dir=self.project.source_dir )
@@ -83,8 +89,6 @@ class BuildLine:
                         "Error occured while reviewing "
                             "<RED>%(inpath)s<NOCOLOUR>",
                         dict(inpath=inpath) )
-        self.driver.clear()
-        self.metadata.feed_metadata(self.driver)
 
     def main(self):
         try:
@@ -137,8 +141,8 @@ class BuildLine:
         return targets
 
     def build(self, targets):
-        target_node_factory = jeolm.node_factory.target.TargetNodeFactory(
-            project=self.project, driver=self.driver, )
+        target_node_factory = self.target_node_factory
+        target_node_factory.refresh()
         target_node = target_node_factory(targets, delegate=True)
         with suppress(NodeErrorReported):
             self.node_updater.update(target_node)
@@ -4,10 +4,20 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def simple_load_driver(project=None):
+def simple_load_driver(project=None, *, review_stale=False):
+    """
+    Load metadata cache and feed it to a new driver.
+
+    Fed records are reused from the previous run, if the cache is unchanged.
+
+    If review_stale is set, source files changed since they were reviewed
+    are reviewed first (and the cache is updated).
+    """
     if project is None:
         project = jeolm.project.Project()
     metadata = (project.metadata_class)(project=project)
     metadata.load_metadata_cache()
-    return metadata.feed_metadata((project.driver_class)())
+    if review_stale and metadata.review_stale():
+        metadata.dump_metadata_cache()
+    return metadata.load_fed_driver(project.driver_class)
 
@@ -25,17 +25,37 @@ def _dump(data, Dumper=_Dumper, default_flow_style=False, **kwargs):
         Dumper=Dumper, default_flow_style=default_flow_style, **kwargs )
 
 @contextmanager
-def log_metadata_diff(metadata, logger=logger):
+def log_metadata_diff(metadata, logger=logger, *, fed_records=None):
+    """
+    Log changes of fed records, made by metadata changes in the context.
+
+    fed_records (e.g. a driver) must be fed with the metadata, and are
+    updated on exit.  Only subtrees fed from changed metadata are copied
+    beforehand and compared, and digests of unchanged parts of these
+    subtrees are kept by fed_records between calls.
+    """
+    if fed_records is None:
+        fed_records = DriverRecords()
+        metadata.feed_metadata(fed_records)
+
+    with metadata.tracking_changes() as changed_paths:
+        yield
+
+    record_paths = metadata.get_refed_record_paths(fed_records, changed_paths)
     old_metarecords = DriverRecords()
-    metadata.feed_metadata(old_metarecords)
+    for record_path in record_paths:
+        old_metarecords.absorb(
+            fed_records.get(record_path, original=True), record_path )
+    metadata.refeed_records(fed_records, record_paths)
 
-    yield
-
-    new_metarecords = DriverRecords()
-    metadata.feed_metadata(new_metarecords)
+    for record_path in record_paths:
+        _log_records_diff( old_metarecords, fed_records, record_path,
+            logger=logger )
 
+def _log_records_diff(old_metarecords, new_metarecords, path, *, logger):
     comparing_iterator = DriverRecords.compare_items(
-        old_metarecords, new_metarecords, original=True )
+        old_metarecords, new_metarecords, path,
+        original=True, skip_equal=True )
     for inpath, old_record, new_record in comparing_iterator:
         old_record = old_record.copy() if old_record is not None else None
         new_record = new_record.copy() if new_record is not None else None
@@ -4,11 +4,11 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def review(paths, *, project, metadata, viewpoint=None):
+def review(paths, *, project, metadata, viewpoint=None, jobs=1):
     inpaths = resolve_inpaths(paths,
         source_dir=project.source_dir, viewpoint=viewpoint )
     for inpath in inpaths:
-        metadata.review(inpath)
+        metadata.review(inpath, jobs=jobs)
 
 def resolve_inpaths(paths, *, source_dir, viewpoint=None):
     if viewpoint is not None:
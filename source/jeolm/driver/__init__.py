@@ -7,11 +7,13 @@ import re
 from pathlib import PurePosixPath
 
 from jeolm.records import ( RecordPath, RecordError, Record, Records,
-    NAME_PATTERN, RELATIVE_NAME_PATTERN )
+    DerivedRecord, NAME_PATTERN, RELATIVE_NAME_PATTERN )
 from jeolm.target import ( Flag, FlagContainer, Target,
     FlagError, TargetError,
     RELATIVE_FLAGS_PATTERN_TIGHT )
 
+from . import profiling
+
 import logging
 logger = logging.getLogger(__name__)
 
@@ -82,13 +84,25 @@ class DriverRecords(Records):
             key, value, path, record,
             overwrite=overwrite )
 
+    @classmethod
+    def _get_attribute_stem(cls, key: str) -> str:
+        match = cls._attribute_key_regex.fullmatch(key)
+        if match is None:
+            return key
+        return match.group('stem')
+
     @classmethod
     def select_flagged_item( cls,
         mapping: Mapping[str, T],
         key_stem: str, flags: FlagContainer,
         *, required_flags: Collection[Flag] = frozenset()
     ) -> Tuple[Optional[str], Optional[T]]:
-        """Return (key, value) from mapping."""
+        """
+        Return (key, value) from mapping.
+
+        Keys of a frozen derived record are parsed only once, and the
+        result is kept in the record's frozen_cache.
+        """
         if not isinstance(key_stem, str):
             raise TypeError(type(key_stem))
         if not key_stem.startswith('$'):
@@ -96,24 +110,94 @@ class DriverRecords(Records):
         if not isinstance(flags, FlagContainer):
             raise TypeError(type(flags))
 
+        stem_flag_set_map, stem_clashes = cls._get_flag_set_map(
+            mapping, key_stem, type(flags) )
+        for flag_set, (key, other_key) in stem_clashes.items():
+            if flag_set.issuperset(required_flags):
+                raise RecordError("Clashing keys '{}' and '{}'"
+                    .format(key, other_key) )
         flag_set_map: Dict[
             FrozenSet[Flag],
             Tuple[Optional[str], Optional[T]]
-        ] = dict()
+        ] = {
+            flag_set: item
+            for flag_set, item in stem_flag_set_map.items()
+            if flag_set.issuperset(required_flags) }
+        flag_set_map.setdefault(frozenset(), (None, None))
+        return flags.select_matching_value(flag_set_map)
+
+    @classmethod
+    def _get_flag_set_map( cls,
+        mapping: Mapping[str, T], key_stem: str,
+        flags_class: Type[FlagContainer],
+    ) -> Tuple[
+        Dict[FrozenSet[Flag], Tuple[str, T]],
+        Dict[FrozenSet[Flag], Tuple[str, str]]
+    ]:
+        """
+        Return ({flag_set: (key, value)}, {flag_set: (key, other_key)})
+        for keys of mapping with given stem.
+
+        The second dictionary contains keys clashing with the earlier
+        ones (which are in the first dictionary).
+        """
+        frozen_cache = None
+        if isinstance(mapping, DerivedRecord):
+            frozen_cache = mapping.frozen_cache
+        if frozen_cache is None:
+            stem_items = [
+                (flags_string, key, value)
+                for stem, flags_string, key, value
+                in cls._generate_flagged_items(mapping)
+                if stem == key_stem ]
+            return cls._make_flag_set_map(stem_items, flags_class)
+        stem_index_key = ('stem_index', cls._attribute_key_regex)
+        try:
+            stem_index = frozen_cache[stem_index_key]
+        except KeyError:
+            stem_index = frozen_cache[stem_index_key] = {}
+            for stem, flags_string, key, value in \
+                    cls._generate_flagged_items(mapping):
+                stem_index.setdefault(stem, []).append(
+                    (flags_string, key, value) )
+        flag_set_map_key = ( 'flag_set_map', cls._attribute_key_regex,
+            flags_class, key_stem )
+        try:
+            return frozen_cache[flag_set_map_key]
+        except KeyError:
+            pass
+        result = frozen_cache[flag_set_map_key] = cls._make_flag_set_map(
+            stem_index.get(key_stem, ()), flags_class )
+        return result
+
+    @classmethod
+    def _generate_flagged_items( cls, mapping: Mapping[str, T],
+    ) -> Iterator[Tuple[str, Optional[str], str, T]]:
+        """Yield (stem, flags_string, key, value) for attribute keys."""
         for key, value in mapping.items():
             match = cls._attribute_key_regex.fullmatch(key)
-            if match is None or match.group('stem') != key_stem:
-                continue
-            flags_string = match.group('flags')
-            flag_set = frozenset(flags.split_flags_string(flags_string))
-            if not flag_set.issuperset(required_flags):
+            if match is None:
                 continue
+            yield match.group('stem'), match.group('flags'), key, value
+
+    @staticmethod
+    def _make_flag_set_map(
+        stem_items: Iterable[Tuple[Optional[str], str, T]],
+        flags_class: Type[FlagContainer],
+    ) -> Tuple[
+        Dict[FrozenSet[Flag], Tuple[str, T]],
+        Dict[FrozenSet[Flag], Tuple[str, str]]
+    ]:
+        flag_set_map: Dict[FrozenSet[Flag], Tuple[str, T]] = {}
+        clashes: Dict[FrozenSet[Flag], Tuple[str, str]] = {}
+        for flags_string, key, value in stem_items:
+            flag_set = frozenset(flags_class.split_flags_string(flags_string))
             if flag_set in flag_set_map:
-                raise RecordError("Clashing keys '{}' and '{}'"
-                    .format(key, flag_set_map[flag_set][0]) )
+                clashes.setdefault( flag_set,
+                    (key, flag_set_map[flag_set][0]) )
+                continue
             flag_set_map[flag_set] = (key, value)
-        flag_set_map.setdefault(frozenset(), (None, None))
-        return flags.select_matching_value(flag_set_map)
+        return flag_set_map, clashes
 
 
 class DocumentTemplate:
@@ -460,13 +544,26 @@ class SeenItems(Set[K]):
         finally:
             self.discard(item)
 
+@contextmanager
+def _wrapping_aspect_errors( target: Union[Target, RecordPath], aspect: str,
+) -> Generator[None, None, None]:
+    try:
+        yield
+    except _DRIVER_ERRORS as error:
+        raise DriverError(f"{target} {aspect}") from error
+
 @contextmanager
 def process_target_aspect( target: Union[Target, RecordPath], aspect: str,
 ) -> Generator[None, None, None]:
+    profiler = profiling.active_profiler
+    frame = None if profiler is None else profiler.enter(target, aspect)
     try:
         yield
     except _DRIVER_ERRORS as error:
         raise DriverError(f"{target} {aspect}") from error
+    finally:
+        if profiler is not None and frame is not None:
+            profiler.exit(frame)
 
 @contextmanager
 def process_target_key( target: Union[Target, RecordPath], key: str,
@@ -491,10 +588,10 @@ def processing_target(method: C) -> C:
         def wrapper_g( self: Any, target: Target,
             *args: Any, **kwargs: Any
         ) -> Any:
-            with process_target_aspect(target, aspect=aspect):
-                return ( yield from
-                    method(self, target, *args, **kwargs)
-                )
+            with _wrapping_aspect_errors(target, aspect=aspect):
+                return ( yield from profiling.profiled(
+                    method(self, target, *args, **kwargs),
+                    target, aspect ))
         return wrapper_g # type: ignore
 
 def processing_package_path(method: C) -> C:
@@ -513,21 +610,21 @@ def processing_package_path(method: C) -> C:
         def wrapper_g( self: Any, package_path: RecordPath,
             *args: Any, **kwargs: Any
         ) -> Any:
-            with process_target_aspect(package_path, aspect=aspect):
-                return ( yield from
-                    method(self, package_path, *args, **kwargs)
-                )
+            with _wrapping_aspect_errors(package_path, aspect=aspect):
+                return ( yield from profiling.profiled(
+                    method(self, package_path, *args, **kwargs),
+                    package_path, aspect ))
         return wrapper_g # type: ignore
 
 def processing_figure_path(method: C) -> C:
     """Decorator."""
+    aspect = method.__qualname__
     if not isgeneratorfunction(method):
         @wraps(method)
         def wrapper( self: Any, figure_path: RecordPath,
             *args: Any, **kwargs: Any
         ) -> Any:
-            with process_target_aspect( figure_path,
-                    aspect=method.__qualname__ ):
+            with process_target_aspect(figure_path, aspect=aspect):
                 return method(self, figure_path, *args, **kwargs)
         return wrapper # type: ignore
     else:
@@ -535,10 +632,9 @@ def processing_figure_path(method: C) -> C:
         def wrapper_g( self: Any, figure_path: RecordPath,
             *args: Any, **kwargs: Any
         ) -> Any:
-            with process_target_aspect( figure_path,
-                    aspect=method.__qualname__ ):
-                return ( yield from
-                    method(self, figure_path, *args, **kwargs)
-                )
+            with _wrapping_aspect_errors(figure_path, aspect=aspect):
+                return ( yield from profiling.profiled(
+                    method(self, figure_path, *args, **kwargs),
+                    figure_path, aspect ))
         return wrapper_g # type: ignore
 
@@ -47,9 +47,11 @@ class GroupsDriver(RegularDriver):
         super().__init__()
         self._groups = None
 
-    def _clear_cache(self) -> None:
-        self._groups = None
-        super()._clear_cache()
+    def _clear_cache(self, path: Optional[RecordPath] = None) -> None:
+        # depends only on the root record
+        if path is None or path.is_root():
+            self._groups = None
+        super()._clear_cache(path)
 
     @property
     def groups(self):
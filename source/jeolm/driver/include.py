@@ -2,18 +2,51 @@
 Keys recognized in metarecords:
   $include
     list of subpaths for direct metadata inclusion.
+
+Paths of included records (with all their subrecords) are reported to
+tracking_reads() whenever a record including them is read, so that
+caches depending on read records notice changes of included ones.
 """
 
-from jeolm.records import RecordPath, Records, RecordError
+from collections.abc import Mapping
+
+from jeolm.records import RecordPath, Records, RecordError, DerivedRecord
 
 class IncludingRecords(Records):
 
+    def __init__(self):
+        super().__init__()
+        # { path : paths of records included while deriving path }
+        self._include_read_paths = {}
+
+    def _clear_cache(self, path=None):
+        # Included records may come from anywhere in the tree,
+        # so a change at any path may affect any derived record.
+        super()._clear_cache()
+        self._include_read_paths.clear()
+
+    def get(self, path, *, original=False):
+        record = super().get(path, original=original)
+        if self._read_paths is not None and not original:
+            # derived record may be taken from cache, and it also
+            # depends on records included by its ancestors
+            for ancestor in path.ancestry:
+                include_read_paths = self._include_read_paths.get(ancestor)
+                if include_read_paths is not None:
+                    self._read_paths.update(include_read_paths)
+        return record
+
     def _derive_record(self, parent_record, child_record, path):
         super()._derive_record(parent_record, child_record, path)
-        for include_name in child_record.pop('$include', ()):
-            include_path = RecordPath(path, include_name)
-            include_record = self._get_include_record(include_path)
-            self._merge_include_record(child_record, include_record)
+        include_names = child_record.pop('$include', ())
+        if not include_names:
+            return
+        with self.tracking_reads() as include_read_paths:
+            for include_name in include_names:
+                include_path = RecordPath(path, include_name)
+                include_record = self._get_include_record(include_path)
+                self._merge_include_record(child_record, include_record)
+        self._include_read_paths[path] = frozenset(include_read_paths)
 
     def _get_include_record(self, include_path, *,
         _seen_paths=None
@@ -25,7 +58,7 @@ class IncludingRecords(Records):
                 .format(include_path) )
         _seen_paths.add(include_path)
 
-        include_record = self.get(include_path, original=True).copy()
+        include_record = DerivedRecord(self.get(include_path, original=True))
         self._fix_include_record( include_path, include_record,
             _seen_paths=_seen_paths )
 
@@ -40,11 +73,13 @@ class IncludingRecords(Records):
             subinclude_record = self._get_include_record( subinclude_path,
                 _seen_paths=_seen_paths )
             self._merge_include_record(include_record, subinclude_record)
-        for key in include_record:
+        for key in list(include_record):
             if key.startswith('$'):
                 continue
+            # subrecords are not read with get(), report them explicitly
+            self._read_paths.add(include_path/key)
             include_record[key] = include_subrecord = \
-                include_record[key].copy()
+                DerivedRecord(include_record[key])
             self._fix_include_record( include_path/key, include_subrecord,
                 _seen_paths=_seen_paths )
 
@@ -60,7 +95,6 @@ class IncludingRecords(Records):
                 continue
             else:
                 # recursive merge
-                dest_dict[key] = dest_value = dest_value.copy()
-                assert isinstance(dest_value, dict)
-                assert isinstance(source_value, dict)
+                dest_dict[key] = dest_value = DerivedRecord(dest_value)
+                assert isinstance(source_value, Mapping)
                 cls._merge_include_record(dest_value, source_value)
@@ -0,0 +1,241 @@
+"""
+Profiling of driver methods.
+
+While a DriverProfiler is active (see DriverProfiler.profiling()), every
+aspect of target processing (methods decorated with processing_target,
+processing_package_path and processing_figure_path, and attribute keys
+processed in process_target_key) is timed.
+
+Time is accounted by events: whenever an aspect is entered or left,
+time elapsed since the previous event is charged to the innermost
+aspect (exclusive time) and to the current stack of aspects.  Generator
+aspects are paused while suspended, together with all aspects entered
+inside them.
+"""
+
+import time
+from contextlib import contextmanager
+from collections import defaultdict
+
+from typing import ( Any, Union, Optional, Callable,
+    Iterator, Generator, Tuple, List, Dict, TextIO )
+
+from jeolm.records import RecordPath
+from jeolm.target import Target
+
+# pylint: disable=invalid-name
+Subject = Union[Target, RecordPath]
+# pylint: enable=invalid-name
+
+
+class ProfileStats:
+    __slots__ = ['calls', 'inclusive', 'exclusive', 'depth']
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        # number of frames of these stats currently on the stack
+        self.depth = 0
+
+
+class _Frame:
+    __slots__ = [ 'aspect_stats', 'subject_stats', 'stack',
+        'outermost', 'resumed' ]
+
+    aspect_stats: ProfileStats
+    subject_stats: ProfileStats
+    stack: Tuple[str, ...]
+    outermost: Tuple[bool, bool]
+    resumed: float
+
+
+class DriverProfiler:
+
+    aspect_stats: Dict[str, ProfileStats]
+    subject_stats: Dict[Tuple[str, Subject], ProfileStats]
+    stack_times: Dict[Tuple[str, ...], float]
+
+    def __init__(self, *, timer: Callable[[], float] = time.perf_counter
+    ) -> None:
+        self.timer = timer
+        self.aspect_stats = defaultdict(ProfileStats)
+        self.subject_stats = defaultdict(ProfileStats)
+        self.stack_times = defaultdict(float)
+        self._stack: List[_Frame] = []
+        self._last_event = 0.0
+
+    @contextmanager
+    def profiling(self) -> Iterator['DriverProfiler']:
+        """Make the profiler active for the duration of the context."""
+        global active_profiler # pylint: disable=global-statement
+        outer_profiler = active_profiler
+        active_profiler = self
+        try:
+            yield self
+        finally:
+            active_profiler = outer_profiler
+
+    def _charge(self) -> float:
+        """Charge time elapsed since the last event to the stack top."""
+        now = self.timer()
+        if self._stack:
+            elapsed = now - self._last_event
+            top = self._stack[-1]
+            top.aspect_stats.exclusive += elapsed
+            top.subject_stats.exclusive += elapsed
+            self.stack_times[top.stack] += elapsed
+        self._last_event = now
+        return now
+
+    def _push(self, frame: _Frame, now: float) -> None:
+        frame.outermost = (
+            frame.aspect_stats.depth == 0,
+            frame.subject_stats.depth == 0 )
+        frame.aspect_stats.depth += 1
+        frame.subject_stats.depth += 1
+        frame.resumed = now
+        self._stack.append(frame)
+
+    def _pop(self, frame: _Frame, now: float) -> None:
+        if self._stack and self._stack[-1] is frame:
+            self._stack.pop()
+        else:
+            # aspect was left out of order (e.g. a key processed across
+            # yields of an unprofiled generator)
+            self._stack.remove(frame)
+        frame.aspect_stats.depth -= 1
+        frame.subject_stats.depth -= 1
+        # recursive aspects are counted once in inclusive time
+        aspect_outermost, subject_outermost = frame.outermost
+        if aspect_outermost:
+            frame.aspect_stats.inclusive += now - frame.resumed
+        if subject_outermost:
+            frame.subject_stats.inclusive += now - frame.resumed
+
+    def enter(self, subject: Subject, aspect: str) -> _Frame:
+        now = self._charge()
+        frame = _Frame()
+        frame.aspect_stats = self.aspect_stats[aspect]
+        frame.subject_stats = self.subject_stats[aspect, subject]
+        frame.aspect_stats.calls += 1
+        frame.subject_stats.calls += 1
+        parent_stack = self._stack[-1].stack if self._stack else ()
+        frame.stack = parent_stack + (f'{subject} {aspect}',)
+        self._push(frame, now)
+        return frame
+
+    def exit(self, frame: _Frame) -> None:
+        if frame not in self._stack:
+            return
+        self._pop(frame, self._charge())
+
+    def _suspend(self, frame: _Frame) -> List[_Frame]:
+        """Remove frame and all frames above it from the stack."""
+        now = self._charge()
+        try:
+            index = self._stack.index(frame)
+        except ValueError:
+            return []
+        suspended = self._stack[index:]
+        for suspended_frame in reversed(suspended):
+            self._pop(suspended_frame, now)
+        return suspended
+
+    def _resume(self, suspended: List[_Frame]) -> None:
+        now = self._charge()
+        for frame in suspended:
+            self._push(frame, now)
+
+    def profile_generator( self, generator: Generator[Any, Any, Any],
+        subject: Subject, aspect: str,
+    ) -> Generator[Any, Any, Any]:
+        """
+        Yield from generator, accounting time spent while it runs.
+
+        Exceptions thrown in and values sent to the resulting generator
+        are passed to the original one.
+        """
+        frame = self.enter(subject, aspect)
+        suspended = self._suspend(frame)
+        send_value: Any = None
+        thrown: Optional[BaseException] = None
+        while True:
+            self._resume(suspended)
+            try:
+                if thrown is not None:
+                    item = generator.throw(thrown)
+                else:
+                    item = generator.send(send_value)
+            except StopIteration as stop:
+                self.exit(frame)
+                return stop.value
+            except BaseException:
+                self.exit(frame)
+                raise
+            suspended = self._suspend(frame)
+            send_value, thrown = None, None
+            try:
+                send_value = yield item
+            except GeneratorExit:
+                self._resume(suspended)
+                try:
+                    generator.close()
+                finally:
+                    self.exit(frame)
+                raise
+            except BaseException as exception: # pylint: disable=broad-except
+                thrown = exception
+
+    def format_report(self, *, limit: Optional[int] = 40) -> str:
+        """Return tables of aspects and targets sorted by exclusive time."""
+        lines = ["Driver profile (times in seconds)"]
+        def append_table( title: str, column: str,
+            items: List[Tuple[str, ProfileStats]]
+        ) -> None:
+            items.sort(key=lambda item: item[1].exclusive, reverse=True)
+            lines.append('')
+            lines.append(title)
+            lines.append( '{:>9} {:>10} {:>10}  {}'
+                .format('calls', 'inclusive', 'exclusive', column) )
+            for name, stats in items[:limit]:
+                lines.append( '{:>9} {:10.4f} {:10.4f}  {}'.format(
+                    stats.calls, stats.inclusive, stats.exclusive, name ))
+            if limit is not None and len(items) > limit:
+                lines.append( '{:>9} ({} more)'
+                    .format('...', len(items) - limit) )
+        append_table( "By aspect:", 'aspect',
+            list(self.aspect_stats.items()) )
+        append_table( "By target:", 'target aspect',
+            [ (f'{subject} {aspect}', stats)
+                for (aspect, subject), stats
+                in self.subject_stats.items() ] )
+        return '\n'.join(lines)
+
+    def write_collapsed(self, stream: TextIO) -> None:
+        """
+        Write stacks in the collapsed format of flamegraph.pl.
+
+        Each line is a stack of frames separated by semicolons, followed
+        by exclusive time in microseconds.
+        """
+        for stack, elapsed in sorted(self.stack_times.items()):
+            microseconds = round(elapsed * 1e6)
+            if microseconds <= 0:
+                continue
+            stream.write('{} {}\n'.format(
+                ';'.join(frame.replace(';', ',') for frame in stack),
+                microseconds ))
+
+
+# Profiler that driver methods report to, if any
+active_profiler: Optional[DriverProfiler] = None
+
+def profiled( generator: Generator[Any, Any, Any],
+    subject: Subject, aspect: str,
+) -> Generator[Any, Any, Any]:
+    """Wrap generator with the active profiler, if there is one."""
+    profiler = active_profiler
+    if profiler is None:
+        return generator
+    return profiler.profile_generator(generator, subject, aspect)
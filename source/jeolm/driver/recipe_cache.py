@@ -0,0 +1,270 @@
+"""
+Persistent cache of document recipes.
+
+Each recipe is stored along with fingerprints of the driver records it
+depends on: records read while the recipe was produced, and all their
+ancestors (since derived records inherit attributes from ancestors).
+A stored recipe is returned while none of these fingerprints change.
+
+The cache is discarded as a whole if the driver class, or any module
+defining the driver class or its bases, changes.  So are modules defining
+records, targets and YAML loading, which recipes depend on as well.
+
+Node factories use the same fingerprints to find nodes, that were made
+from records changed since (see record_dependencies()).
+
+Missing recipes may be produced in advance by a pool of processes forked
+from the current one, so that the driver is shared with them (read-only)
+and only targets and resulting recipes are passed around.  Processes are
+only forked while no other threads are running.
+"""
+
+import os
+import pickle
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import OrderedDict
+from pathlib import PosixPath
+
+import jeolm.records
+import jeolm.target
+import jeolm.yaml
+from jeolm.records import RecordPath, RecordError
+from jeolm.target import Target
+from jeolm.utils.atomic_write import write_atomically
+from jeolm.utils.code_version import get_code_version
+
+from . import Driver, DocumentRecipe, DriverError
+
+import logging
+logger = logging.getLogger(__name__)
+
+from typing import ( Any, Optional, Union, Iterable, Iterator,
+    Tuple, Set, Type )
+
+# pylint: disable=invalid-name
+Dependencies = Tuple[Tuple[RecordPath, bytes], ...]
+# pylint: enable=invalid-name
+
+
+class RecipeCache:
+    format_version = 1
+    max_entries = 4096
+    # modules, that recipes depend on besides the driver class
+    _dependency_modules = (jeolm.records, jeolm.target, jeolm.yaml)
+
+    path: Optional[PosixPath]
+    driver: Driver
+    _entries: 'OrderedDict[str, Tuple[Dependencies, DocumentRecipe]]'
+    _checked_keys: Set[str]
+    _modified: bool
+
+    def __init__( self, driver: Driver, path: Optional[PosixPath] = None
+    ) -> None:
+        self.driver = driver
+        self.path = path
+        self._entries = OrderedDict()
+        # entries known to be valid (until the driver records change, see
+        # expire_checks())
+        self._checked_keys = set()
+        self._modified = False
+        self._driver_key = self.get_driver_key(type(driver))
+        if path is not None:
+            self._load()
+
+    @classmethod
+    def get_driver_key(cls, driver_class: Type[Driver]) -> Any:
+        """Return key identifying code, that recipes depend on."""
+        return get_code_version(driver_class, cls._dependency_modules)
+
+    def _load(self) -> None:
+        assert self.path is not None
+        try:
+            with self.path.open('rb') as cache_file:
+                format_version, driver_key, entries = \
+                    pickle.load(cache_file)
+        except FileNotFoundError:
+            return
+        except (pickle.UnpicklingError, EOFError, ValueError) as error:
+            logger.debug("Recipe cache is broken: %s", error)
+            return
+        if format_version != self.format_version:
+            return
+        if driver_key != self._driver_key:
+            logger.debug("Driver changed, recipe cache discarded")
+            return
+        self._entries = entries
+
+    def save(self) -> None:
+        if self.path is None or not self._modified:
+            return
+        write_atomically( self.path, pickle.dumps(
+            (self.format_version, self._driver_key, self._entries) ))
+        self._modified = False
+
+    def expire_checks(self) -> None:
+        """Make entries checked again, since driver records have changed."""
+        self._checked_keys.clear()
+
+    def produce_document_recipe(self, target: Target) -> DocumentRecipe:
+        key = str(target)
+        recipe = self._lookup(key)
+        if recipe is None:
+            recipe, dependencies = _produce_recipe(self.driver, target)
+            self._store(key, recipe, dependencies)
+        return recipe
+
+    def get_dependencies(self, target: Target) -> Dependencies:
+        """Return dependencies of the recipe of target, if produced."""
+        dependencies, unused = self._entries[str(target)]
+        return dependencies
+
+    def prefetch_document_recipes( self, targets: Iterable[Target],
+        *, jobs: int = 1
+    ) -> Iterator[Target]:
+        """
+        Yield targets as soon as their recipes are in the cache.
+
+        If jobs is greater than one, missing recipes are produced by
+        a pool of that many forked processes (but not more than there
+        are CPUs), and targets are yielded in the order of completion.
+        Targets, for which the production failed, are yielded as well,
+        so that produce_document_recipe() reproduces the error.
+
+        All processes are forked before the first target is yielded,
+        so that the caller may start threads after that.  If other
+        threads are already running, no processes are forked.
+        """
+        cached_targets = []
+        missing_targets = []
+        for target in targets:
+            if self._lookup(str(target)) is not None:
+                cached_targets.append(target)
+            else:
+                missing_targets.append(target)
+        workers = min(jobs, len(missing_targets), os.cpu_count() or 1)
+        if workers > 1 and threading.active_count() > 1:
+            # a forked process only gets the current thread, and locks
+            # held by other threads stay locked in it forever
+            logger.debug( "Other threads are running, recipes are not "
+                "produced in parallel" )
+            workers = 1
+        if workers <= 1:
+            yield from cached_targets
+            yield from missing_targets
+            return
+        global _worker_driver # pylint: disable=global-statement
+        _worker_driver = self.driver
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('fork'),
+            ) as executor:
+                # with the fork context, all workers are started
+                # by the first submit()
+                futures = {
+                    executor.submit(_produce_recipe_in_worker, target): target
+                    for target in missing_targets }
+                _worker_driver = None
+                yield from cached_targets
+                for future in as_completed(futures):
+                    target = futures[future]
+                    try:
+                        result = future.result()
+                    except ( pickle.PicklingError,
+                            TypeError, AttributeError ) as error:
+                        # recipe was produced, but cannot be passed
+                        # from the worker process
+                        logger.debug( "Recipe of %s was not received "
+                            "from a worker process: %s", target, error )
+                    else:
+                        if isinstance(result, _WorkerFailure):
+                            result.log(target)
+                        else:
+                            self._store(str(target), *result)
+                    yield target
+        finally:
+            _worker_driver = None
+
+    def _lookup(self, key: str) -> Optional[DocumentRecipe]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        dependencies, recipe = entry
+        if key not in self._checked_keys:
+            if not dependencies_hold(self.driver, dependencies):
+                return None
+            self._checked_keys.add(key)
+            self._entries.move_to_end(key)
+        return recipe
+
+    def _store( self, key: str, recipe: DocumentRecipe,
+        dependencies: Dependencies
+    ) -> None:
+        self._entries[key] = (dependencies, recipe)
+        self._entries.move_to_end(key)
+        self._checked_keys.add(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._modified = True
+
+
+def _produce_recipe( driver: Driver, target: Target,
+) -> Tuple[DocumentRecipe, Dependencies]:
+    with driver.tracking_reads() as read_paths:
+        recipe = driver.produce_document_recipe(target)
+    return recipe, record_dependencies(driver, read_paths)
+
+def record_dependencies( driver: Driver, read_paths: Iterable[RecordPath],
+) -> Dependencies:
+    """Return fingerprints of records read and all their ancestors."""
+    dependency_paths: Set[RecordPath] = set()
+    for path in read_paths:
+        if path in dependency_paths:
+            continue
+        dependency_paths.update(path.ancestry)
+    fingerprint = driver.fingerprint
+    return tuple(
+        (path, fingerprint(path)) for path in sorted(dependency_paths) )
+
+def dependencies_hold(driver: Driver, dependencies: Dependencies) -> bool:
+    """Return True if none of the fingerprints changed."""
+    fingerprint = driver.fingerprint
+    return all( fingerprint(path) == path_fingerprint
+        for path, path_fingerprint in dependencies )
+
+# Driver inherited by forked workers of prefetch_document_recipes()
+_worker_driver: Optional[Driver] = None
+
+class _WorkerFailure:
+    """
+    Error that occurred while producing a recipe in a worker process.
+
+    The main process produces the recipe again, reproducing the error.
+    Errors in the metadata are reported there, and other errors are
+    logged when received, since they may be specific to the worker.
+    """
+
+    def __init__(self, error: str, *, expected: bool) -> None:
+        self.error = error
+        self.expected = expected
+
+    def log(self, target: Target) -> None:
+        if self.expected:
+            logger.debug( "Recipe of %s failed in a worker process:\n%s",
+                target, self.error )
+        else:
+            logger.warning( "Recipe of %s failed in a worker process:\n%s",
+                target, self.error )
+
+def _produce_recipe_in_worker( target: Target,
+) -> Union[Tuple[DocumentRecipe, Dependencies], _WorkerFailure]:
+    assert _worker_driver is not None
+    try:
+        return _produce_recipe(_worker_driver, target)
+    except (DriverError, RecordError):
+        return _WorkerFailure(traceback.format_exc(), expected=True)
+    except Exception: # pylint: disable=broad-except
+        return _WorkerFailure(traceback.format_exc(), expected=False)
@@ -351,9 +351,35 @@ class RegularDriver(Driver): # {{{1
     @folding_driver_errors
     def produce_document_asy_context( self, target: Target,
     ) -> Tuple[Compiler, str]:
-        """Return (latex_compiler, latex_preamble)."""
+        """
+        Return (latex_compiler, latex_preamble).
+
+        Results are memoised per attuned target, and equal results are
+        returned as the same object.
+        """
         record = self.get(target.path)
         document_target = self._get_attuned_target(target, record)
+        cache_key = ( document_target.path,
+            document_target.flags.as_frozenset )
+        try:
+            asy_context, read_paths = self._asy_context_cache[cache_key]
+        except KeyError:
+            pass
+        else:
+            if self._read_paths is not None:
+                self._read_paths.update(read_paths)
+            return asy_context
+        with self.tracking_reads() as read_paths:
+            read_paths.add(target.path)
+            asy_context = self._produce_asy_context(document_target, record)
+        asy_context = self._asy_contexts.setdefault(asy_context, asy_context)
+        self._asy_context_cache[cache_key] = (
+            asy_context, frozenset(read_paths) )
+        self._cache_is_clear = False
+        return asy_context
+
+    def _produce_asy_context( self, document_target: Target, record: Record,
+    ) -> Tuple[Compiler, str]:
         asy_latex_compilers: List[Compiler] = []
         asy_latex_preamble = list(self._generate_asy_preamble_document(
             document_target, record,
@@ -390,6 +416,66 @@ class RegularDriver(Driver): # {{{1
     ##########
     # Record extension {{{2
 
+    _delegated_targets_cache: Dict[
+        Tuple[RecordPath, FrozenSet[Flag]],
+        Tuple[
+            Tuple[Tuple[RecordPath, FrozenSet[Flag]], ...],
+            FrozenSet[RecordPath] ]
+    ]
+    _asy_preamble_cache: Dict[
+        Tuple[RecordPath, FrozenSet[Flag]],
+        Tuple[
+            Tuple[
+                Tuple['RegularDriver.PreambleItem', ...],
+                Tuple[Compiler, ...] ],
+            FrozenSet[RecordPath] ]
+    ]
+    _asy_context_cache: Dict[
+        Tuple[RecordPath, FrozenSet[Flag]],
+        Tuple[Tuple[Compiler, str], FrozenSet[RecordPath]]
+    ]
+    _asy_contexts: Dict[Tuple[Compiler, str], Tuple[Compiler, str]]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._delegated_targets_cache = {}
+        self._asy_preamble_cache = {}
+        self._asy_context_cache = {}
+        self._asy_contexts = {}
+
+    def _clear_cache(self, path: Optional[RecordPath] = None) -> None:
+        # memoised results depend on the records read while producing them
+        self._clear_memo(self._delegated_targets_cache, path)
+        self._clear_memo(self._asy_preamble_cache, path)
+        self._clear_memo(self._asy_context_cache, path)
+        if not self._asy_context_cache:
+            self._asy_contexts.clear()
+        super()._clear_cache(path)
+
+    @staticmethod
+    def _clear_memo(
+        cache: Dict[Any, Tuple[Any, FrozenSet[RecordPath]]],
+        path: Optional[RecordPath],
+    ) -> None:
+        """
+        Drop entries, which read records that may be affected by a change
+        at path.
+        """
+        if path is None or path.is_root():
+            cache.clear()
+            return
+        ancestry = frozenset(path.parent.ancestry)
+        parts = path.parts
+        depth = len(parts)
+        stale_keys = [
+            key for key, (unused, read_paths) in cache.items()
+            if any(
+                read_path in ancestry or read_path.parts[:depth] == parts
+                for read_path in read_paths )
+        ]
+        for key in stale_keys:
+            del cache[key]
+
     def _derive_record( self,
         parent_record: Record, child_record: Record, path: RecordPath,
     ) -> None:
@@ -417,16 +503,9 @@ class RegularDriver(Driver): # {{{1
     def _generate_targetable_paths( self, path: RecordPath = None,
     ) -> Iterable[RecordPath]:
         """Yield targetable paths."""
-        if path is None:
-            path = RecordPath()
-        record = self.get(path)
-        if record.get('$delegate$able', True):
-            yield path
-        for key in record:
-            if key.startswith('$'):
-                continue
-            assert '/' not in key
-            yield from self._generate_targetable_paths(path=path/key)
+        for subpath, record in self.walk(path):
+            if record.get('$delegate$able', True):
+                yield subpath
 
     @classmethod
     def get_dropped_keys(cls) -> Dict[str, str]:
@@ -468,6 +547,41 @@ class RegularDriver(Driver): # {{{1
     def _generate_targets( self,
         target: Target, record: Optional[Record] = None,
         *, _seen_targets: Optional[SeenItems[Target]] = None,
+    ) -> Iterable[Target]:
+        """
+        Yield targets delegated by target.
+
+        Expansion is memoised per (path, flags), until any of the
+        records read during it change.  Memoised targets are yielded
+        as new Target instances.
+        """
+        cache_key = (target.path, target.flags.as_frozenset)
+        try:
+            delegated, read_paths = self._delegated_targets_cache[cache_key]
+        except KeyError:
+            pass
+        else:
+            if self._read_paths is not None:
+                self._read_paths.update(read_paths)
+            origin = f'delegate {target}'
+            for path, flags in delegated:
+                yield Target(path, flags, origin=origin)
+            return
+        with self.tracking_reads() as read_paths:
+            read_paths.add(target.path)
+            delegated_targets = list(self._generate_targets_uncached(
+                target, record, _seen_targets=_seen_targets ))
+        self._delegated_targets_cache[cache_key] = (
+            tuple(
+                (delegated_target.path, delegated_target.flags.as_frozenset)
+                for delegated_target in delegated_targets ),
+            frozenset(read_paths) )
+        self._cache_is_clear = False
+        yield from delegated_targets
+
+    def _generate_targets_uncached( self,
+        target: Target, record: Optional[Record] = None,
+        *, _seen_targets: Optional[SeenItems[Target]] = None,
     ) -> Iterable[Target]:
         if record is None:
             record = self.get(target.path)
@@ -1161,6 +1275,40 @@ class RegularDriver(Driver): # {{{1
         target: Target, record: Optional[Record] = None,
         *, compilers: List[Compiler],
         _seen_targets: SeenItems[Target],
+    ) -> Iterable[PreambleItem]:
+        """
+        Yield asy preamble items of target, appending its compilers.
+
+        Results are memoised per (path, flags), until any of the records
+        read while producing them change.  Documents inheriting their
+        asy style share the results for their common ancestors.
+        """
+        cache_key = (target.path, target.flags.as_frozenset)
+        cached = self._asy_preamble_cache.get(cache_key)
+        # a memoised target on the stack is a cycle, to be reported
+        if cached is not None and target not in _seen_targets:
+            (preamble, preamble_compilers), read_paths = cached
+            if self._read_paths is not None:
+                self._read_paths.update(read_paths)
+            compilers.extend(preamble_compilers)
+            yield from preamble
+            return
+        target_compilers: List[Compiler] = []
+        with self.tracking_reads() as read_paths:
+            read_paths.add(target.path)
+            preamble = tuple(self._generate_asy_preamble_uncached(
+                target, record,
+                compilers=target_compilers, _seen_targets=_seen_targets ))
+        self._asy_preamble_cache[cache_key] = (
+            (preamble, tuple(target_compilers)), frozenset(read_paths) )
+        self._cache_is_clear = False
+        compilers.extend(target_compilers)
+        yield from preamble
+
+    def _generate_asy_preamble_uncached( self,
+        target: Target, record: Optional[Record] = None,
+        *, compilers: List[Compiler],
+        _seen_targets: SeenItems[Target],
     ) -> Iterable[PreambleItem]:
         if record is None:
             record = self.get(target.path)
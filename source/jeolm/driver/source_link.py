@@ -38,9 +38,11 @@ class SourceLinkDriver(RegularDriver):
         super().__init__()
         self._source_link_root = None
 
-    def _clear_cache(self) -> None:
-        self._source_link_root = None
-        super()._clear_cache()
+    def _clear_cache(self, path: Optional[RecordPath] = None) -> None:
+        # depends only on the root record
+        if path is None or path.is_root():
+            self._source_link_root = None
+        super()._clear_cache(path)
 
     @property
     def source_link_root(self) -> str:
@@ -1,19 +1,27 @@
 from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import os
-import io
+from stat import S_ISDIR
 import re
 import pickle
+import hashlib
 
 from collections import OrderedDict
+from contextlib import contextmanager, suppress
 
 from pathlib import PurePosixPath
 
 import jeolm.yaml
+import jeolm.driver
 
 from jeolm.utils.ordering import filename_keyfunc
-from jeolm.records import ( RecordPath, Records,
-    NAME_PATTERN, RELATIVE_NAME_PATTERN )
+from jeolm.utils.atomic_write import write_atomically
+from jeolm.utils.code_version import get_code_version
+from jeolm.records import ( RecordPath, Records, DerivedRecord,
+    RecordNotFoundError, NAME_PATTERN, RELATIVE_NAME_PATTERN )
 from jeolm.driver import ATTRIBUTE_KEY_PATTERN, FIGURE_REF_PATTERN
+from jeolm.driver.recipe_cache import RecipeCache
+from jeolm.metadata_store import MetadataStore
 
 import logging
 logger = logging.getLogger(__name__)
@@ -56,12 +64,12 @@ class MetadataPath(RecordPath):
             self.parent,
             name[:self._suffix_pos(name)] + suffix )
 
-    def sorting_key(self, keyfunc=filename_keyfunc):
-        return super().sorting_key(keyfunc=keyfunc)
+    _sorting_keyfunc = filename_keyfunc
 
 
 class Metadata(Records):
     _Dict = dict
+    _DerivedRecord = DerivedRecord
     _Path = MetadataPath
     dir_name_regex = re.compile(DIR_NAME_PATTERN)
     file_name_regex = re.compile(FILE_NAME_PATTERN)
@@ -86,58 +94,282 @@ class Metadata(Records):
 
     def __init__(self, *, project):
         self.project = project
+        self._prequeried = {}
+        self._changed_paths = set()
+        # see tracking_changes()
+        self._tracked_changed_paths = None
+        self._query_version = self._get_query_version()
+        self._metadata_store = MetadataStore(self._metadata_cache_path)
+        self._yaml_cache = jeolm.yaml.LoadCache(
+            self.project.build_dir / 'yaml.cache.pickle' )
         super().__init__()
 
     def load_metadata_cache(self):
+        records = self._metadata_store.load()
+        if records is not None:
+            self._load_records(records)
+            return
+        # Either no cache at all, or a cache of older jeolm version
         try:
-            with self._metadata_cache_path.open('rb') as cache_file:
+            with self._legacy_metadata_cache_path.open('rb') as cache_file:
                 pickled_cache = cache_file.read()
         except FileNotFoundError:
             cache = {}
         else:
             cache = pickle.loads(pickled_cache)
         self.absorb(cache)
+        # make sure the store gets written completely
+        self._changed_paths.add(self._Path())
+
+    def _load_records(self, records, attribute_index=None):
+        super()._load_records(records, attribute_index)
+        self._changed_paths.clear()
 
     def dump_metadata_cache(self):
-        pickled_cache = pickle.dumps(self._records)
-        new_path = self.project.build_dir / '.metadata.cache.pickle.new'
-        with new_path.open('wb') as cache_file:
-            cache_file.write(pickled_cache)
-        new_path.rename(self._metadata_cache_path)
+        self._metadata_store.save( self._records,
+            (path.parts for path in self._changed_paths) )
+        self._changed_paths.clear()
+        with suppress(FileNotFoundError):
+            self._legacy_metadata_cache_path.unlink()
+        self._yaml_cache.save()
 
     @property
     def _metadata_cache_path(self):
         return self.project.build_dir / self._metadata_cache_name
 
-    _metadata_cache_name = 'metadata.cache.pickle'
+    _metadata_cache_name = 'metadata.cache'
+
+    @property
+    def _legacy_metadata_cache_path(self):
+        return self.project.build_dir / 'metadata.cache.pickle'
+
+    def absorb(self, data, path=None, *, overwrite=True):
+        if path is None:
+            path = self._Path()
+        if data is not None or path not in self:
+            self._note_change(path)
+        super().absorb(data, path, overwrite=overwrite)
+
+    def clear(self, path=None):
+        if path is None:
+            path = self._Path()
+        self._note_change(path)
+        super().clear(path)
+
+    def delete(self, path):
+        self._note_change(path)
+        super().delete(path)
+
+    def _note_change(self, path):
+        self._changed_paths.add(path)
+        if self._tracked_changed_paths is not None:
+            self._tracked_changed_paths.add(path)
+
+    @contextmanager
+    def tracking_changes(self):
+        """
+        Return a context manager collecting paths of changed records.
+
+        The yielded set is filled with metadata paths of records that
+        were changed, added or deleted while the context is active.
+        """
+        outer_changed_paths = self._tracked_changed_paths
+        changed_paths = set()
+        self._tracked_changed_paths = changed_paths
+        try:
+            yield changed_paths
+        finally:
+            self._tracked_changed_paths = outer_changed_paths
+            if outer_changed_paths is not None:
+                outer_changed_paths.update(changed_paths)
 
     def feed_metadata(self, records):
+        for record_path, metadata in self._generate_fed_metadata():
+            records.absorb(metadata, record_path, overwrite=False)
+        return records
+
+    def load_fed_driver(self, driver_class):
+        """
+        Return a new driver fed with metadata.
+
+        Fed records are saved in the build directory along with the
+        version of metadata cache, and are reused as long as the cache
+        (and metadata and driver classes, with modules defining them)
+        stay the same.
+        """
+        driver = driver_class()
+        snapshot_key = self._get_fed_snapshot_key(driver_class)
+        if snapshot_key is None:
+            return self.feed_metadata(driver)
+        try:
+            with self._fed_snapshot_path.open('rb') as snapshot_file:
+                format_version, key, records, attribute_index = \
+                    pickle.load(snapshot_file)
+        except FileNotFoundError:
+            pass
+        except (pickle.UnpicklingError, EOFError, ValueError) as error:
+            logger.debug("Fed driver snapshot is broken: %s", error)
+        else:
+            if ( format_version == self._fed_snapshot_format_version and
+                    key == snapshot_key ):
+                # pylint: disable=protected-access
+                driver._load_records(records, attribute_index)
+                # pylint: enable=protected-access
+                return driver
+        self.feed_metadata(driver)
+        # pylint: disable=protected-access
+        snapshot = pickle.dumps(( self._fed_snapshot_format_version,
+            snapshot_key, driver._records, driver._attribute_index ))
+        # pylint: enable=protected-access
+        write_atomically(self._fed_snapshot_path, snapshot)
+        return driver
+
+    _fed_snapshot_format_version = 1
+
+    @property
+    def _fed_snapshot_path(self):
+        return self.project.build_dir / 'driver.cache.pickle'
+
+    def _get_fed_snapshot_key(self, driver_class):
+        """
+        Return key identifying fed records, or None.
+
+        None means that records differ from the saved metadata cache.
+        """
+        store_version = self._metadata_store.version
+        if store_version is None or self._changed_paths:
+            return None
+        local_module_path = self.project.jeolm_dir / 'local.py'
+        try:
+            stat = local_module_path.stat()
+        except FileNotFoundError:
+            local_module_version = None
+        else:
+            local_module_version = (stat.st_size, stat.st_mtime_ns)
+        # same as the recipe cache, so that both are discarded
+        # together when jeolm code changes
+        return ( store_version, local_module_version,
+            get_code_version(type(self)),
+            RecipeCache.get_driver_key(driver_class) )
+
+    def refeed_metadata(self, records, source_paths):
+        """
+        Update records fed with metadata after source_paths were reviewed.
+
+        The result is the same as of records.clear() followed by
+        feed_metadata(records), but only the affected subtrees of records
+        are cleared and fed again, so that cached records elsewhere survive.
+        """
+        return self.refeed_records( records,
+            self.get_refed_record_paths( records,
+                ( MetadataPath.from_source_path(source_path)
+                    for source_path in source_paths ) ))
+
+    def refeed_records(self, records, record_paths):
+        """
+        Clear and feed again subtrees of records at record_paths.
+
+        record_paths are as returned by get_refed_record_paths().
+        """
+        for record_path in record_paths:
+            self._refeed_record(records, record_path)
+        return records
+
+    def get_refed_record_paths(self, records, metadata_paths):
+        """
+        Return paths of records fed with metadata of metadata_paths.
+
+        These are the subtrees of records, that are fed again by
+        refeed_metadata(); none of them is a descendant of another.
+        Paths are sorted.
+        """
+        record_paths = set()
+        for metadata_path in metadata_paths:
+            record_path = self._get_fed_record_path(metadata_path)
+            # New record must be inserted among its siblings in the order
+            # of feeding, so the parent is to be fed again.
+            while record_path not in records:
+                record_path = record_path.parent
+            record_paths.add(record_path)
+        return sorted(
+            record_path for record_path in record_paths
+            if record_path.is_root() or not any(
+                ancestor in record_paths
+                for ancestor in record_path.parent.ancestry )
+        )
+
+    def _refeed_record(self, records, record_path):
+        if record_path.is_root():
+            records.clear()
+            self.feed_metadata(records)
+            return
+        records.clear(record_path)
+        parts = record_path.parts
+        fed = False
+        for fed_path, metadata in self._generate_fed_metadata():
+            fed_parts = fed_path.parts
+            if fed_parts[:len(parts)] == parts:
+                records.absorb(metadata, fed_path, overwrite=False)
+                fed = True
+            elif parts[:len(fed_parts)] == fed_parts:
+                # metadata of an ancestor may contain subrecords
+                for part in parts[len(fed_parts):]:
+                    if not isinstance(metadata, dict) or part not in metadata:
+                        break
+                    metadata = metadata[part]
+                else:
+                    records.absorb(metadata, record_path, overwrite=False)
+                    fed = True
+        if not fed:
+            records.delete(record_path)
+
+    def _generate_fed_metadata(self):
+        """Yield (record_path, metadata) pairs in the order of feeding."""
         for metadata_path, record in self.items():
             if metadata_path.is_root() or metadata_path.suffix == '':
                 assert '$metadata' not in record
                 continue
-            elif metadata_path.suffix == '.yaml':
-                record_path = metadata_path.parent
-            else:
-                record_path = metadata_path.with_suffix('')
-            metadata = record.get('$metadata')
-            records.absorb(metadata, record_path, overwrite=False)
-        return records
+            yield ( self._get_fed_record_path(metadata_path),
+                record.get('$metadata') )
 
-    def review(self, source_path):
+    @staticmethod
+    def _get_fed_record_path(metadata_path):
+        if metadata_path.suffix == '':
+            return metadata_path
+        elif metadata_path.suffix == '.yaml':
+            return metadata_path.parent
+        else:
+            return metadata_path.with_suffix('')
+
+    def review(self, source_path, *, jobs=1):
+        """
+        Update metadata of source_path (file or directory).
+
+        Files are queried again only if their fingerprint (size,
+        modification time and inode, and version of the query code) has
+        changed since the last review.
+        If jobs is greater than one, files inside a reviewed directory
+        are queried in a pool of that many processes beforehand.
+        The result does not depend on the number of jobs.
+        """
         if not isinstance(source_path, PurePosixPath):
             raise TypeError(type(source_path))
         if source_path.is_absolute():
             raise ValueError(source_path)
         if '..' in source_path.parts:
             raise ValueError(source_path)
+        try:
+            stat = (self.project.source_dir/source_path).stat()
+        except FileNotFoundError:
+            stat = None
+        self._review(source_path, stat, jobs=jobs)
+
+    def _review(self, source_path, stat, *, jobs=1):
         metadata_path = MetadataPath.from_source_path(source_path)
         #inpath = metadata_path.as_inpath()
-        path = self.project.source_dir/source_path
 
-        exists = path.exists()
         recorded = metadata_path in self
-        if not exists:
+        if stat is None:
             assert not metadata_path.is_root()
             if recorded:
                 self.delete(metadata_path)
@@ -149,16 +381,95 @@ class Metadata(Records):
             return
         # path exists
 
-        is_dir = path.is_dir()
+        is_dir = S_ISDIR(stat.st_mode)
         self._check_source_path(source_path, is_dir=is_dir)
-        if is_dir and recorded:
-            self.clear(metadata_path)
         if is_dir:
-            self._review_subpaths(source_path)
+            if recorded and \
+                    '$metadata' in self.get(metadata_path, original=True):
+                # file was replaced with a directory
+                self.clear(metadata_path)
+            if jobs > 1 and not self._prequeried:
+                self._prequery_subpaths(source_path, jobs=jobs)
+                try:
+                    self._review_subpaths(source_path)
+                finally:
+                    self._prequeried.clear()
+            else:
+                self._review_subpaths(source_path)
             self.absorb(None, metadata_path)
             return
-        metadata = self._query_file(source_path)
-        self.absorb({'$metadata' : metadata}, metadata_path, overwrite=True)
+        fingerprint = self._get_fingerprint(stat)
+        if recorded:
+            record = self.get(metadata_path, original=True)
+            if record.get('$fingerprint') == fingerprint:
+                return
+            if any(not key.startswith('$') for key in record):
+                # directory was replaced with a file
+                self.clear(metadata_path)
+        try:
+            metadata = self._prequeried.pop(source_path)
+        except KeyError:
+            metadata = self._query_file(source_path)
+        self.absorb(
+            {'$metadata' : metadata, '$fingerprint' : fingerprint},
+            metadata_path, overwrite=True )
+
+    def find_stale_paths(self):
+        """
+        Return source paths of files changed since they were reviewed.
+
+        Only recorded files are checked (one stat per file), including
+        those that no longer exist; new files are not detected.
+        """
+        source_dir = self.project.source_dir
+        stale_paths = []
+        for metadata_path, record in self.walk(original=True):
+            if '$metadata' not in record:
+                continue
+            source_path = metadata_path.as_source_path()
+            try:
+                stat = (source_dir/source_path).stat()
+            except FileNotFoundError:
+                stale_paths.append(source_path)
+                continue
+            if record.get('$fingerprint') != self._get_fingerprint(stat):
+                stale_paths.append(source_path)
+        return stale_paths
+
+    def review_stale(self):
+        """Review files changed since they were reviewed; return them."""
+        stale_paths = self.find_stale_paths()
+        for source_path in stale_paths:
+            logger.info(
+                "Source file <MAGENTA>%(path)s<NOCOLOUR> changed "
+                "since it was reviewed",
+                dict(path=source_path) )
+            self.review(source_path)
+        return stale_paths
+
+    def _get_fingerprint(self, stat):
+        return ( stat.st_size, stat.st_mtime_ns, stat.st_ino,
+            self._query_version )
+
+    def _get_query_version(self):
+        """
+        Return short digest of the code, that files are queried with.
+
+        It is a part of file fingerprints, so that files are queried
+        again when the query code (e.g. local.py) changes.
+        """
+        code_version = get_code_version( type(self),
+            (jeolm.yaml, jeolm.driver) )
+        return hashlib.sha256(repr(code_version).encode()).hexdigest()[:16]
+
+    def _is_reviewed(self, source_path, stat):
+        """Check if file fingerprint is unchanged since the last review."""
+        metadata_path = MetadataPath.from_source_path(source_path)
+        try:
+            record = self.get(metadata_path, original=True)
+        except RecordNotFoundError:
+            return False
+        return record.get('$fingerprint') == self._get_fingerprint(stat)
 
     @classmethod
     def _check_source_path(cls, source_path, *, is_dir):
@@ -180,34 +491,106 @@ class Metadata(Records):
                     f"{source_path}" )
 
     def _review_subpaths(self, source_path):
+        metadata_path = MetadataPath.from_source_path(source_path)
+        subnames = set()
+        for sub_source_path, stat in self._generate_subpaths(source_path):
+            subnames.add(sub_source_path.name)
+            self._review(sub_source_path, stat)
+        if metadata_path not in self:
+            return
+        for subname in [
+            key for key in self.get(metadata_path, original=True)
+            if not key.startswith('$') and key not in subnames
+        ]:
+            # source was removed (or became nonconforming)
+            self.delete(metadata_path/subname)
+
+    def _generate_subpaths(self, source_path, *, warn=True):
+        """
+        Yield (sub_source_path, stat) pairs to review.
+
+        Stat is None for dangling symbolic links.
+        """
         # XXX symlinked directories and files
-        for subname in os.listdir(str(self.project.source_dir/source_path)):
+        with os.scandir(str(self.project.source_dir/source_path)) \
+                as scanned_entries:
+            entries = list(scanned_entries)
+        for entry in entries:
+            subname = entry.name
             if subname.startswith('.'):
                 continue
             sub_source_path = source_path/subname
-            subpath = self.project.source_dir/sub_source_path
-            if subpath.is_dir():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and S_ISDIR(stat.st_mode):
                 if not self.dir_name_regex.fullmatch(subname):
-                    logger.warning(
-                        "Nonconforming directory name "
-                            "<YELLOW>%(path)s<NOCOLOUR>",
-                        dict(path=sub_source_path) )
+                    if warn:
+                        logger.warning(
+                            "Nonconforming directory name "
+                                "<YELLOW>%(path)s<NOCOLOUR>",
+                            dict(path=sub_source_path) )
                     continue
             else:
                 if not self.file_name_regex.fullmatch(subname):
-                    logger.warning(
-                        "Nonconforming file name "
-                            "<YELLOW>%(path)s<NOCOLOUR>",
-                        dict(path=sub_source_path) )
+                    if warn:
+                        logger.warning(
+                            "Nonconforming file name "
+                                "<YELLOW>%(path)s<NOCOLOUR>",
+                            dict(path=sub_source_path) )
                     continue
                 subsuffix = sub_source_path.suffix
                 if subsuffix not in self.source_types:
-                    logger.warning(
-                        "Unknown suffix in file name "
-                            "<YELLOW>%(path)s<NOCOLOUR>",
-                        dict(path=sub_source_path) )
+                    if warn:
+                        logger.warning(
+                            "Unknown suffix in file name "
+                                "<YELLOW>%(path)s<NOCOLOUR>",
+                            dict(path=sub_source_path) )
                     continue
-            self.review(sub_source_path)
+            yield sub_source_path, stat
+
+    def _generate_subfiles(self, source_path):
+        """Yield files inside source_path that need to be queried."""
+        for sub_source_path, stat in self._generate_subpaths(
+                source_path, warn=False ):
+            if stat is None:
+                # dangling symlinks are left to review()
+                continue
+            if S_ISDIR(stat.st_mode):
+                yield from self._generate_subfiles(sub_source_path)
+            elif not self._is_reviewed(sub_source_path, stat):
+                yield sub_source_path
+
+    def _prequery_subpaths(self, source_path, *, jobs):
+        """
+        Query files inside source_path in a process pool.
+
+        Results are stored to be picked up by the subsequent sequential
+        review, which absorbs them in the usual order.
+        """
+        source_paths = list(self._generate_subfiles(source_path))
+        total = len(source_paths)
+        if total < 2:
+            return
+        logger.info(
+            "Querying <BOLD>%(total)d<REGULAR> source files "
+            "in %(jobs)d processes",
+            dict(total=total, jobs=jobs) )
+        reported = 0
+        with ProcessPoolExecutor( max_workers=jobs,
+            initializer=_init_query_worker, initargs=(self.project.root,)
+        ) as executor:
+            results = executor.map( _query_file_in_worker, source_paths,
+                chunksize=max(1, min(64, total // (jobs * 8))) )
+            for count, (sub_source_path, metadata) in enumerate(
+                    zip(source_paths, results), start=1 ):
+                self._prequeried[sub_source_path] = metadata
+                if count * 10 // total > reported:
+                    reported = count * 10 // total
+                    logger.info(
+                        "Queried %(count)d of %(total)d source files",
+                        dict(count=count, total=total) )
 
     def _query_file(self, source_path):
         filetype = source_path.suffix
@@ -221,7 +604,8 @@ class Metadata(Records):
 
     def _query_yaml_file(self, source_path):
         with self._open_source_path(source_path) as yaml_file:
-            metadata = jeolm.yaml.load(yaml_file)
+            metadata = self._yaml_cache.load(
+                yaml_file.read(), name=str(source_path) )
         if not isinstance(metadata, dict):
             raise TypeError(
                 f"Metadata in {source_path} is of type {type(metadata)}, "
@@ -239,97 +623,119 @@ class Metadata(Records):
         return metadata
 
     def _query_tex_content(self, source_path, tex_content):
+        figure_refs, includegraphics, sections, metadata_pieces = \
+            self._scan_tex_content(tex_content)
         metadata = OrderedDict()
-        filtered_tex_content = self._filter_tex_comments(tex_content)
-        metadata.update(
-            self._query_tex_figures(source_path, filtered_tex_content) )
+        metadata.update( self._query_tex_figures( source_path, figure_refs,
+            includegraphics=includegraphics ))
         metadata.update(
-            self._query_tex_sections(source_path, filtered_tex_content) )
+            self._query_tex_sections(source_path, sections) )
         metadata.update(
-            self._query_tex_metadata(source_path, tex_content) )
+            self._query_tex_metadata(source_path, metadata_pieces) )
         return metadata
 
+    @classmethod
+    def _scan_tex_content(cls, tex_content):
+        r"""
+        Scan tex_content in one pass.
+
+        Return (figure_refs, includegraphics, sections, metadata_pieces),
+        where figure_refs contain None for unparsable \jeolmfigure
+        commands and metadata_pieces are (extend, piece) pairs.
+        Commands in comments are ignored.
+        """
+        figure_refs = []
+        includegraphics = False
+        sections = []
+        metadata_pieces = []
+        for match in cls._tex_scanner_regex.finditer(tex_content):
+            kind = match.lastgroup
+            if kind == 'tex_comment':
+                continue
+            if kind == 'tex_metadata':
+                metadata_pieces.append((
+                    match.group('extend') is not None,
+                    cls._tex_piece_prefix_regex.sub(
+                        '', match.group('metadata_piece') ) ))
+            elif kind == 'tex_figure':
+                figure_refs.append(match.group('figure_ref'))
+            elif kind == 'tex_section':
+                section = match.group('section_title')
+                if '%' in section:
+                    section = cls._filter_tex_comments(section)
+                sections.append(section)
+            elif kind == 'tex_includegraphics':
+                includegraphics = True
+            else:
+                raise RuntimeError(kind)
+        return figure_refs, includegraphics, sections, metadata_pieces
+
     @classmethod
     def _filter_tex_comments(cls, tex_content):
         return cls._tex_comment_regex.sub('', tex_content)
 
-    _tex_comment_regex = re.compile( r'(?m)'
-        r'(?!<\\)%.*\n\s*'
-    )
+    _tex_comment_pattern = r'%.*\n\s*'
+    _tex_comment_regex = re.compile(_tex_comment_pattern)
+    # whitespace, possibly with comments
+    _tex_space_pattern = r'(?:\s|%.*\n)*'
 
-    def _query_tex_figures(self, source_path, tex_content):
-        if self._tex_includegraphics_regex.search(tex_content) is not None:
+    def _query_tex_figures( self, source_path, figure_refs,
+        *, includegraphics=False
+    ):
+        if includegraphics:
             logger.warning(
                 "Source file <MAGENTA>%(path)s<NOCOLOUR>: "
                 r"<YELLOW>\includegraphics<NOCOLOUR> command found",
                 dict(path=source_path) )
-        figure_refs = list()
-        figure_refs_set = set()
-        for match in self._tex_figure_regex.finditer(tex_content):
-            figure_ref = match.group('figure_ref')
-            if figure_ref in figure_refs_set:
-                continue
-            figure_refs_set.add(figure_ref)
-            if figure_ref is None:
-                continue
-            figure_refs.append(figure_ref)
-        if None in figure_refs_set:
+        if None in figure_refs:
             logger.warning(
                 "Source file <MAGENTA>%(path)s<NOCOLOUR>: "
                 "unable to parse some of the "
                 r"<YELLOW>\jeolmfigure<NOCOLOUR> commands",
                 dict(path=source_path) )
+        figure_refs = [
+            figure_ref for figure_ref in OrderedDict.fromkeys(figure_refs)
+            if figure_ref is not None ]
         if figure_refs:
             return {'$source$figures' : figure_refs}
         else:
             return {}
 
-    _tex_figure_regex = re.compile( r'(?m)'
-        r'\\jeolmfigure(?:\s*'
+    # pattern follows the backslash
+    _tex_figure_pattern = (
+        r'jeolmfigure(?:' + _tex_space_pattern +
             r'(?:\['
-                r'[\w\s.,=\\]*?'
-            r'\])?'
-        r'\s*'
-            r'\{'
+                r'(?:[\w\s.,=\\]|%.*\n)*?'
+            r'\])?' +
+        _tex_space_pattern +
+            r'\{(?:' + _tex_comment_pattern + r')*'
                 r'(?P<figure_ref>' + FIGURE_REF_PATTERN + r')'
-            r'\}'
-        r')?')
-    _tex_includegraphics_regex = re.compile(
-        r'\\includegraphics')
+            r'(?:' + _tex_comment_pattern + r')*\}'
+        r')?' )
     # XXX Add \lazyfigure similarly
 
     # pylint: disable=unused-argument
 
-    def _query_tex_sections(self, source_path, tex_content):
-        sections = [
-            match.group('section')
-            for match in self._tex_section_regex.finditer(tex_content) ]
+    def _query_tex_sections(self, source_path, sections):
         return {'$source$sections' : sections} if sections else {}
 
-    _tex_section_regex = re.compile( r'(?m)'
-        r'\\(?:section|worksheet)\*?\s*'
+    # pattern follows the backslash
+    _tex_section_pattern = (
+        r'(?:section|worksheet)\*?' + _tex_space_pattern +
             r'\{\s*'
-                r'(?P<section>(?:[^\{\}%]|\{[^\{\}%]*\})*)'
+                r'(?P<section_title>(?:'
+                    r'[^\{\}%]|%.*\n|'
+                    r'\{(?:[^\{\}%]|%.*\n)*\}'
+                r')*)'
             r'(?:\s|%.*$)*\}' )
 
     # pylint: enable=unused-argument
 
-    def _query_tex_metadata(self, source_path, tex_content):
+    def _query_tex_metadata(self, source_path, metadata_pieces):
         metadata = OrderedDict()
-        for match in self._tex_metadata_regex.finditer(tex_content):
-            piece_lines = match.group(0).splitlines(keepends=True)
-            assert all(line.startswith('% ') for line in piece_lines)
-            piece_lines = [line[2:] for line in piece_lines]
-            if match.group('extend') is not None:
-                assert len(match.group('extend')) == 3
-                piece_lines[0] = piece_lines[0][3:]
-                extend = True
-            else:
-                extend = False
-            piece = ''.join(piece_lines)
-            piece_io = io.StringIO(piece)
-            piece_io.name = source_path
-            piece = jeolm.yaml.load(piece_io)
+        pieces = self._load_tex_metadata_pieces(
+            source_path, [piece for extend, piece in metadata_pieces] )
+        for (extend, _text), piece in zip(metadata_pieces, pieces):
             if not isinstance(piece, dict) or len(piece) != 1:
                 logger.error(
                     "Source file <MAGENTA>%(path)s<NOCOLOUR>: "
@@ -352,12 +758,59 @@ class Metadata(Records):
                 metadata[key] = value
         return metadata
 
-    _tex_metadata_regex = re.compile( r'(?m)'
-        r'^% (?P<extend>>> )?'
-            '(?:' + ATTRIBUTE_KEY_PATTERN + ')'
-            r':.*\n'
-        r'(?:% [ \-#].+\n)*'
-    )
+    def _load_tex_metadata_pieces(self, source_path, pieces):
+        """
+        Parse metadata pieces as YAML.
+
+        All pieces are loaded at once, as items of a single YAML sequence.
+        If that fails, they are loaded one by one, so that the error
+        points to the offending piece.  Pieces possibly containing
+        aliases are also loaded one by one, since aliases must not
+        refer to other pieces.
+        """
+        if not pieces:
+            return []
+        name = str(source_path)
+        document = ''.join(self._tex_piece_as_item(piece) for piece in pieces)
+        if '*' not in document:
+            try:
+                loaded_pieces = self._yaml_cache.load(document, name=name)
+            except jeolm.yaml.YAMLError:
+                loaded_pieces = None
+            if isinstance(loaded_pieces, list) and \
+                    len(loaded_pieces) == len(pieces):
+                return loaded_pieces
+        return [
+            self._yaml_cache.load(piece, name=name)
+            for piece in pieces ]
+
+    @staticmethod
+    def _tex_piece_as_item(piece):
+        first_line, *lines = piece.splitlines(keepends=True)
+        return ''.join(['- ', first_line, *('  ' + line for line in lines)])
+
+    # pattern follows the percent sign
+    _tex_metadata_pattern = (
+        r' (?P<extend>>> )?'
+            r'(?P<metadata_piece>'
+                '(?:' + ATTRIBUTE_KEY_PATTERN + ')'
+                r':.*\n'
+            r'(?:% [ \-#].+\n)*'
+            r')' )
+    _tex_piece_prefix_regex = re.compile(r'(?m)^% ')
+
+    # Every branch starts with a literal character, which allows the
+    # regex engine to skip quickly over plain text.
+    _tex_scanner_regex = re.compile( r'(?m)'
+        r'%(?:'
+            r'(?<=^%)(?P<tex_metadata>' + _tex_metadata_pattern + r')|'
+            r'(?P<tex_comment>.*\n\s*)'
+        r')|'
+        r'\\(?:'
+            r'(?P<tex_figure>' + _tex_figure_pattern + r')|'
+            r'(?P<tex_section>' + _tex_section_pattern + r')|'
+            r'(?P<tex_includegraphics>includegraphics)'
+        r')' )
 
     def _query_dtx_file(self, source_path):
         with self._open_source_path(source_path) as dtx_file:
@@ -467,3 +920,16 @@ class Metadata(Records):
 
     # pylint: enable=no-self-use,unused-argument
 
+
+_worker_metadata = None
+
+def _init_query_worker(root):
+    # pylint: disable=global-statement
+    global _worker_metadata
+    import jeolm.project
+    project = jeolm.project.Project(root=root)
+    _worker_metadata = project.metadata_class(project=project)
+
+def _query_file_in_worker(source_path):
+    # pylint: disable=protected-access
+    return _worker_metadata._query_file(source_path)
@@ -0,0 +1,372 @@
+"""
+On-disk storage of metadata cache.
+
+The cache is kept in a directory:
+
+  current
+    format version and name of the current generation directory; the
+    store is ignored if the format does not match.
+  lock
+    advisory lock, held exclusively by writers.
+  gen-<N>/root.pickle
+    attributes of the root record.
+  gen-<N>/shards/<name>.pickle
+    record of toplevel entry <name> (with all its subrecords).
+  gen-<N>/journal.pickle
+    sequence of pickled (path parts, record or None) entries, which
+    are applied on top of the shards in order.  Each entry is preceded
+    by its length and CRC32, so that an incomplete entry is detected.
+
+Saving appends changed subtrees to the journal of the current generation.
+Once the journal grows beyond journal_size_limit, a new generation is
+made with shards mentioned in the journal rewritten and other shards
+hard-linked, and then `current` is atomically replaced (compaction).
+
+Writers hold the lock, and only write subtrees they have changed, so
+concurrent writers merge their changes (the last one wins for the same
+path).  Readers do not lock: generations are never modified except for
+appending to the journal, and an incomplete last journal entry is
+ignored; if the generation is replaced while being read, reading starts
+over.  A replaced generation is renamed away as a whole before it is
+removed, so that a reader never sees some of its files missing.
+An incomplete entry left by an interrupted writer is cut off by
+the next writer, before it appends anything.
+"""
+
+import os
+import fcntl
+import pickle
+import shutil
+import struct
+import zlib
+from contextlib import contextmanager, suppress
+from pathlib import PosixPath
+
+from jeolm.utils.atomic_write import write_atomically
+
+import logging
+logger = logging.getLogger(__name__)
+
+from typing import ( Any, Optional, Iterable, Iterator, Tuple, List,
+    Dict, Set, BinaryIO )
+
+# pylint: disable=invalid-name
+RecordParts = Tuple[str, ...]
+# pylint: enable=invalid-name
+
+
+class MetadataStore:
+    format_version = 3
+    journal_size_limit = 1 << 20
+    # length and CRC32 of the journal entry
+    journal_header = struct.Struct('<II')
+    load_attempts = 3
+
+    path: PosixPath
+    version: Optional[Tuple[str, int]]
+
+    def __init__(self, path: PosixPath) -> None:
+        self.path = path
+        self.version = None
+
+    @property
+    def _current_path(self) -> PosixPath:
+        return self.path / 'current'
+
+    @property
+    def _lock_path(self) -> PosixPath:
+        return self.path / 'lock'
+
+    def _root_path(self, generation: str) -> PosixPath:
+        return self.path / generation / 'root.pickle'
+
+    def _shards_path(self, generation: str) -> PosixPath:
+        return self.path / generation / 'shards'
+
+    def _shard_path(self, generation: str, name: str) -> PosixPath:
+        return self._shards_path(generation) / (name + '.pickle')
+
+    def _journal_path(self, generation: str) -> PosixPath:
+        return self.path / generation / 'journal.pickle'
+
+    def _read_current(self) -> Optional[str]:
+        """Return name of the current generation, if the store is valid."""
+        try:
+            current = self._current_path.read_text().split()
+        except FileNotFoundError:
+            return None
+        if len(current) != 2 or current[0] != str(self.format_version):
+            return None
+        return current[1]
+
+    @contextmanager
+    def _locked(self, *, shared: bool = False) -> Iterator[None]:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock_path.open('a') as lock_file:
+            fcntl.flock( lock_file.fileno(),
+                fcntl.LOCK_SH if shared else fcntl.LOCK_EX )
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        Return the root record, or None if the store is absent or stale.
+
+        Records are returned as they were saved, without any validation.
+        On success, version identifies the loaded state of the store.
+        """
+        self.version = None
+        for attempt in range(self.load_attempts):
+            generation = self._read_current()
+            if generation is None:
+                return None
+            try:
+                records, unused, journal_end = \
+                    self._load_generation(generation)
+            except FileNotFoundError:
+                # generation was replaced by a concurrent writer
+                logger.debug( "Metadata cache generation %s vanished "
+                    "while loading (attempt %d)", generation, attempt )
+                continue
+            self.version = (generation, journal_end)
+            return records
+        with self._locked(shared=True):
+            generation = self._read_current()
+            if generation is None:
+                return None
+            try:
+                records, unused, journal_end = \
+                    self._load_generation(generation)
+            except FileNotFoundError:
+                logger.warning( "Metadata cache generation %s is broken, "
+                    "ignoring the cache", generation )
+                return None
+            self.version = (generation, journal_end)
+            return records
+
+    def _load_generation( self, generation: str
+    ) -> Tuple[Dict[str, Any], Set[str], int]:
+        """
+        Return root record, toplevel names mentioned in journal and
+        the journal offset, up to which entries were applied.
+        """
+        with self._root_path(generation).open('rb') as root_file:
+            records = pickle.load(root_file)
+        with os.scandir(str(self._shards_path(generation))) as entries:
+            shard_entries = [
+                entry for entry in entries
+                if entry.name.endswith('.pickle') ]
+        for entry in shard_entries:
+            with open(entry.path, 'rb') as shard_file:
+                records[entry.name[:-len('.pickle')]] = \
+                    pickle.load(shard_file)
+        journal_names = set()
+        journal_end = 0
+        for parts, record, journal_end in self._read_journal(generation):
+            journal_names.add(parts[0])
+            self._apply_entry(records, parts, record)
+        return records, journal_names, journal_end
+
+    def _read_journal( self, generation: str
+    ) -> Iterable[Tuple[RecordParts, Any, int]]:
+        """
+        Yield (parts, record, offset of the entry end) triples.
+
+        Raise FileNotFoundError if the journal is missing (which means
+        that the generation was removed).
+        """
+        with self._journal_path(generation).open('rb') as journal_file:
+            for data, offset in self._scan_journal(journal_file):
+                parts, record = pickle.loads(data)
+                yield parts, record, offset
+
+    @classmethod
+    def _scan_journal( cls, journal_file: BinaryIO
+    ) -> Iterator[Tuple[bytes, int]]:
+        """
+        Yield (pickled entry, offset of the entry end) pairs.
+
+        Stop at the end of file, or at the first incomplete entry,
+        which is either being written right now or was left by an
+        interrupted writer.
+        """
+        header_size = cls.journal_header.size
+        offset = journal_file.tell()
+        while True:
+            header = journal_file.read(header_size)
+            if not header:
+                return
+            if len(header) == header_size:
+                length, checksum = cls.journal_header.unpack(header)
+                data = journal_file.read(length)
+                if len(data) == length and zlib.crc32(data) == checksum:
+                    offset += header_size + length
+                    yield data, offset
+                    continue
+            logger.debug( "Incomplete metadata cache journal entry "
+                "at offset %d", offset )
+            return
+
+    @classmethod
+    def _format_journal_entry(cls, parts: RecordParts, record: Any) -> bytes:
+        data = pickle.dumps((parts, record))
+        return cls.journal_header.pack(len(data), zlib.crc32(data)) + data
+
+    @staticmethod
+    def _apply_entry( records: Dict[str, Any],
+        parts: RecordParts, record: Any
+    ) -> None:
+        parent = records
+        for part in parts[:-1]:
+            parent = parent.setdefault(part, {})
+        if record is None:
+            parent.pop(parts[-1], None)
+        else:
+            parent[parts[-1]] = record
+
+    def save( self, records: Dict[str, Any],
+        changed_parts: Iterable[RecordParts]
+    ) -> None:
+        """
+        Save changes of records to the store.
+
+        changed_parts are paths (as tuples of names) of subrecords that
+        were changed, added or deleted since the last load or save.
+        Only these subrecords are written, merging with changes made
+        by other writers in the meantime.  If the root is among them,
+        records replace the store content completely.
+        """
+        changed_parts = sorted(set(changed_parts), key=len)
+        minimal_parts: List[RecordParts] = []
+        for parts in changed_parts:
+            if any( parts[:len(other_parts)] == other_parts
+                    for other_parts in minimal_parts ):
+                continue
+            minimal_parts.append(parts)
+        if not minimal_parts:
+            return
+        # the store no longer matches any loaded state
+        self.version = None
+        with self._locked():
+            generation = self._read_current()
+            if generation is None or minimal_parts == [()]:
+                self._write_generation(records, set(records), base=None)
+                return
+            journal_path = self._journal_path(generation)
+            try:
+                journal_file = journal_path.open('r+b')
+            except FileNotFoundError:
+                logger.warning( "Metadata cache generation %s is broken, "
+                    "rewriting the cache", generation )
+                self._write_generation(records, set(records), base=None)
+                return
+            with journal_file:
+                self._repair_journal(journal_file, generation)
+                for parts in minimal_parts:
+                    journal_file.write(self._format_journal_entry(
+                        parts, self._get_subrecord(records, parts) ))
+                journal_size = journal_file.tell()
+            if journal_size > self.journal_size_limit:
+                merged_records, journal_names, unused = \
+                    self._load_generation(generation)
+                self._write_generation( merged_records, journal_names,
+                    base=generation )
+        self._touch()
+
+    def _repair_journal( self, journal_file: BinaryIO, generation: str
+    ) -> None:
+        """
+        Cut off an incomplete entry at the end of journal, and leave
+        the file positioned at the end.  Must be called with the lock held.
+        """
+        valid_end = 0
+        for unused, valid_end in self._scan_journal(journal_file):
+            pass
+        journal_end = journal_file.seek(0, os.SEEK_END)
+        if journal_end != valid_end:
+            logger.warning( "Metadata cache journal of %s has an incomplete "
+                "entry (left by an interrupted writer?), discarding "
+                "%d bytes at offset %d",
+                generation, journal_end - valid_end, valid_end )
+            journal_file.truncate(valid_end)
+            journal_file.seek(valid_end)
+
+    @staticmethod
+    def _get_subrecord(records: Dict[str, Any], parts: RecordParts) -> Any:
+        record = records
+        for part in parts:
+            try:
+                record = record[part]
+            except KeyError:
+                return None
+        return record
+
+    def _write_generation( self, records: Dict[str, Any],
+        changed_names: Set[str], *, base: Optional[str]
+    ) -> None:
+        """
+        Write records as a new generation and make it current.
+
+        Shards not in changed_names are hard-linked from the base
+        generation.  Must be called with the lock held.
+        """
+        generation = self._next_generation()
+        self._shards_path(generation).mkdir(parents=True)
+        root_record = {}
+        for key, value in records.items():
+            if key.startswith('$'):
+                root_record[key] = value
+                continue
+            shard_path = self._shard_path(generation, key)
+            if base is not None and key not in changed_names:
+                with suppress(FileNotFoundError):
+                    os.link( str(self._shard_path(base, key)),
+                        str(shard_path) )
+                    continue
+            with shard_path.open('wb') as shard_file:
+                pickle.dump(value, shard_file)
+        with self._root_path(generation).open('wb') as root_file:
+            pickle.dump(root_record, root_file)
+        self._journal_path(generation).touch()
+        write_atomically( self._current_path,
+            '{} {}\n'.format(self.format_version, generation).encode() )
+        self._remove_stale_entries(keep=generation)
+        self._touch()
+
+    def _next_generation(self) -> str:
+        numbers = [0]
+        with os.scandir(str(self.path)) as entries:
+            for entry in entries:
+                if entry.name.startswith('gen-'):
+                    with suppress(ValueError):
+                        numbers.append(int(entry.name[len('gen-'):]))
+        return 'gen-{}'.format(max(numbers) + 1)
+
+    def _remove_stale_entries(self, *, keep: str) -> None:
+        with os.scandir(str(self.path)) as entries:
+            stale_entries = [
+                entry for entry in entries
+                if entry.name not in {keep, 'current', 'lock'} ]
+        for entry in stale_entries:
+            if entry.is_dir(follow_symlinks=False):
+                stale_path = entry.path
+                if not entry.name.startswith('.'):
+                    # readers of the generation fail to find any file in
+                    # it from now on, instead of losing files one by one
+                    stale_path = os.path.join( str(self.path),
+                        '.{}.{}.stale'.format(entry.name, os.getpid()) )
+                    try:
+                        os.rename(entry.path, stale_path)
+                    except FileNotFoundError:
+                        continue
+                shutil.rmtree(stale_path, ignore_errors=True)
+            else:
+                with suppress(FileNotFoundError):
+                    os.unlink(entry.path)
+
+    def _touch(self) -> None:
+        # modification time of the store directory signals changes
+        # (used by shell completion)
+        os.utime(str(self.path))
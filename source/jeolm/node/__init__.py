@@ -23,7 +23,7 @@ logger = logging.getLogger(__name__)
 
 import typing
 from typing import ( ClassVar, Any, Union, Optional,
-    Iterable, Sequence,
+    Callable, Iterable, Sequence,
     Tuple, List, Set, Dict,
     Coroutine, Generator )
 if typing.TYPE_CHECKING:
@@ -94,6 +94,14 @@ class Node: # {{{1
     async def update_self(self) -> None:
         self.updated = True
 
+    def reset(self) -> None:
+        """
+        Forget the result of update, so that the node may be updated
+        again (e.g. by the next build).  Needs are not reset.
+        """
+        self.updated = False
+        self.modified = False
+
     def append_needs(self, node: 'Node') -> None:
         """
         Append a node to the needs list.
@@ -198,6 +206,10 @@ class BuildableNode(Node): # {{{1
         """Make the node unconditionally need to be rebuilt."""
         self._forced = True
 
+    def reset(self) -> None:
+        super().reset()
+        self._forced = False
+
     async def _run_command(self) -> None:
         if self.command is None:
             raise ValueError(
@@ -320,6 +332,25 @@ class SubprocessCommand(Command): # {{{1
             self.callargs[0], output )
 
 
+class BackgroundCall: # {{{1
+    """
+    A function call, that is run by the node updater in a separate
+    thread (in parallel with other jobs) instead of blocking the updater
+    loop.  Node coroutines await run_in_background(), which yields it.
+    """
+
+    function: Callable[[], Any]
+
+    def __init__(self, function: Callable[[], Any]) -> None:
+        self.function = function
+
+@coroutine # type: ignore
+def run_in_background( function: Callable[[], Any]
+) -> Generator[BackgroundCall, Any, Any]:
+    """Call function in a background thread, and return the result."""
+    return (yield BackgroundCall(function))
+
+
 class DatedNode(Node): # {{{1
     """
     Represents something that has a modification time.
@@ -342,6 +373,10 @@ class DatedNode(Node): # {{{1
         self._load_mtime()
         self.updated = True
 
+    def reset(self) -> None:
+        super().reset()
+        self.mtime = None
+
     def _load_mtime(self) -> None:
         """
         Set self.mtime attribute to appropriate value.
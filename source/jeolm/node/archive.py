@@ -1,6 +1,10 @@
 import io
-import datetime
+import os
 import time
+import shutil
+import hashlib
+import gzip
+from functools import partial, lru_cache
 from pathlib import PurePosixPath, PosixPath
 
 from stat import S_ISREG as stat_is_regular_file
@@ -13,16 +17,72 @@ from jeolm.node.text import TextNode, VarTextNode, SimpleTextNode
 from jeolm.node.cyclic import AutowrittenNeed
 from jeolm.node.symlink import ProxyNode
 
-from . import Command
+from . import Command, SubprocessCommand, run_in_background
+
+import logging
+logger = logging.getLogger(__name__)
 
 from typing import ( cast, ClassVar, Type, Any, Union, Optional,
-    Callable, Iterable,
+    Callable, Iterable, Sequence,
     Dict,
     BinaryIO )
 # pylint: disable=invalid-name
 ArchiveMTime = Union[int, float]
+ArchiveManifest = Dict[PurePosixPath, str]
 # pylint: enable=invalid-name
 
+# The earliest date representable in ZIP (1980-01-01).
+ZIP_MIN_MTIME = 315532800
+
+# Member mtimes are clamped to this value, unless overridden by
+# SOURCE_DATE_EPOCH environment variable
+# (see https://reproducible-builds.org/specs/).
+DEFAULT_MTIME_CLAMP = ZIP_MIN_MTIME
+
+def _get_mtime_clamp() -> int:
+    source_date_epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if not source_date_epoch:
+        return DEFAULT_MTIME_CLAMP
+    return _parse_source_date_epoch(source_date_epoch)
+
+@lru_cache(maxsize=None) # warn once per value
+def _parse_source_date_epoch(source_date_epoch: str) -> int:
+    try:
+        mtime_clamp = int(source_date_epoch)
+        if mtime_clamp < 0:
+            raise ValueError(mtime_clamp)
+    except ValueError:
+        logger.warning(
+            "Malformed SOURCE_DATE_EPOCH <YELLOW>%(value)s<NOCOLOUR>, "
+            "using default",
+            dict(value=source_date_epoch) )
+        return DEFAULT_MTIME_CLAMP
+    return mtime_clamp
+
+def node_digest(node: FilelikeNode) -> str:
+    """Return sha256 hex digest of the archived content of node."""
+    if isinstance(node, (TextNode, SimpleTextNode)):
+        return hashlib.sha256(node.text.encode('utf-8')).hexdigest()
+    digest = hashlib.sha256()
+    chunk_size = _BaseArchiveCommand.Archiver.chunk_size
+    with node.path.open(mode='rb') as content_stream:
+        for chunk in iter(lambda: content_stream.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def format_manifest(manifest: ArchiveManifest) -> str:
+    # compatible with sha256sum(1)
+    return ''.join(
+        f'{digest}  {path}\n'
+        for path, digest in manifest.items() )
+
+def _format_sidecar_header(mtime_clamp: int) -> str:
+    return f'# mtime clamp: {mtime_clamp}\n'
+
+def _format_sidecar(manifest: ArchiveManifest, mtime_clamp: int) -> str:
+    # mtimes of members depend on the clamp as well as on the content
+    return _format_sidecar_header(mtime_clamp) + format_manifest(manifest)
+
 
 class _BaseArchiveCommand(Command):
 
@@ -33,23 +93,84 @@ class _BaseArchiveCommand(Command):
         super().__init__(node)
 
     async def run(self) -> None:
-        self.logger.debug(
-            "create archive <ITALIC>%(path)s<UPRIGHT>",
-            dict(path=self.node.relative_path)
-        )
-        with self.node.path.open('wb') as archive_file:
-            with self.Archiver(cast(BinaryIO, archive_file)) \
-                    as archiver:
-                for path, node in self.node.archive_content.items():
-                    archiver.add_member_node(path, node)
+        mtime_clamp = _get_mtime_clamp()
+        # hashing and writing of members are run in background, since
+        # they may take long for large source trees
+        manifest = await run_in_background(self._compute_manifest)
+        sidecar_text = _format_sidecar(manifest, mtime_clamp)
+        if self._check_sidecar(sidecar_text):
+            self.logger.debug(
+                "archive <ITALIC>%(path)s<UPRIGHT> content is unchanged",
+                dict(path=self.node.relative_path)
+            )
+            self.node.touch()
+        else:
+            self.logger.debug(
+                "create archive <ITALIC>%(path)s<UPRIGHT>",
+                dict(path=self.node.relative_path)
+            )
+            if os.path.lexists(str(self.node.manifest_path)):
+                self.node.manifest_path.unlink()
+            await self._create_archive(mtime_clamp)
+            self._write_sidecar(sidecar_text)
         self.node.updated = True
 
+    async def _create_archive(self, mtime_clamp: int) -> None:
+        await run_in_background( partial( self._write_archive,
+            self.node.path, mtime_clamp ))
+
+    def _write_archive( self, archive_path: PosixPath, mtime_clamp: int,
+    ) -> None:
+        """
+        Write archive in a reproducible way.
+
+        Members are sorted by path, and their mtimes are clamped,
+        so the same content always results in the same archive bytes.
+        """
+        with archive_path.open('wb') as archive_file:
+            with self.Archiver( cast(BinaryIO, archive_file),
+                    mtime_clamp=mtime_clamp ) as archiver:
+                for path, node in sorted(self.node.archive_content.items()):
+                    archiver.add_member_node(path, node)
+
+    def _compute_manifest(self) -> ArchiveManifest:
+        known_digests = self.node.archive_digests
+        return { path: known_digests.get(path) or node_digest(node)
+            for path, node in sorted(self.node.archive_content.items()) }
+
+    def _check_sidecar(self, sidecar_text: str) -> bool:
+        """
+        Check if the existing archive was created from the same content
+        with the same mtime clamp.
+        """
+        if self.node.mtime is None:
+            return False
+        try:
+            old_sidecar_text = self.node.manifest_path.read_text(
+                encoding='utf-8' )
+        except FileNotFoundError:
+            return False
+        return old_sidecar_text == sidecar_text
+
+    def _write_sidecar(self, sidecar_text: str) -> None:
+        manifest_path = self.node.manifest_path
+        manifest_new_path = manifest_path.with_name(manifest_path.name + '.new')
+        manifest_new_path.write_text(sidecar_text, encoding='utf-8')
+        os.replace(str(manifest_new_path), str(manifest_path))
+
     class Archiver:
 
         _file_mode = 0o000644
+        # Members are copied in chunks of this size, so that large files
+        # (e.g. PDF figures) are never held in memory as a whole.
+        chunk_size = 1 << 16
+
+        _mtime_clamp: int
 
-        def __init__(self, archive_stream: BinaryIO) -> None:
-            pass
+        def __init__( self, archive_stream: BinaryIO,
+            *, mtime_clamp: int = DEFAULT_MTIME_CLAMP,
+        ) -> None:
+            self._mtime_clamp = mtime_clamp
 
         def __enter__(self) -> '_BaseArchiveCommand.Archiver':
             return self
@@ -69,10 +190,19 @@ class _BaseArchiveCommand(Command):
 
         def add_member_stream( self,
             path: PurePosixPath, mtime: ArchiveMTime,
-            content_stream: BinaryIO,
+            content_stream: BinaryIO, size: int,
         ) -> None:
+            """
+            Add member, reading its content from the stream.
+
+            Subclasses should override this to copy the content in chunks;
+            the default implementation reads the whole stream at once.
+            """
             content = content_stream.read()
             assert isinstance(content, bytes), type(content)
+            if len(content) != size:
+                raise RuntimeError(
+                    f"Member {path} size changed while archiving" )
             return self.add_member_bytes(path, mtime, content)
 
         def add_member_node( self,
@@ -83,7 +213,7 @@ class _BaseArchiveCommand(Command):
                 raise RuntimeError(node)
 
             if isinstance(node, (TextNode, SimpleTextNode)):
-                self.add_member_str(path, time.time(), node.text)
+                self.add_member_str(path, self._mtime_clamp, node.text)
                 return
 
             assert node.updated
@@ -92,8 +222,9 @@ class _BaseArchiveCommand(Command):
             with node.path.open(mode='rb') as content_stream:
                 self.add_member_stream(
                     path=path,
-                    mtime=node_stat.st_mtime,
+                    mtime=min(int(node_stat.st_mtime), self._mtime_clamp),
                     content_stream=cast(BinaryIO, content_stream),
+                    size=node_stat.st_size,
                 )
 
 
@@ -105,8 +236,10 @@ class _ZipArchiveCommand(_BaseArchiveCommand):
 
         _archive: zipfile.ZipFile
 
-        def __init__(self, archive_stream: BinaryIO) -> None:
-            super().__init__(archive_stream)
+        def __init__( self, archive_stream: BinaryIO,
+            *, mtime_clamp: int = DEFAULT_MTIME_CLAMP,
+        ) -> None:
+            super().__init__(archive_stream, mtime_clamp=mtime_clamp)
             self._archive = zipfile.ZipFile(archive_stream, mode='w')
 
         def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> bool:
@@ -118,23 +251,45 @@ class _ZipArchiveCommand(_BaseArchiveCommand):
         ) -> None:
             if not isinstance(content, bytes):
                 raise TypeError(type(content))
+            self._archive.writestr(self._member_info(path, mtime), content)
+
+        def add_member_stream( self,
+            path: PurePosixPath, mtime: ArchiveMTime,
+            content_stream: BinaryIO, size: int,
+        ) -> None:
+            info = self._member_info(path, mtime)
+            info.file_size = size
+            with self._archive.open(info, mode='w') as member_stream:
+                shutil.copyfileobj( content_stream, member_stream,
+                    self.chunk_size )
+
+        def _member_info( self,
+            path: PurePosixPath, mtime: ArchiveMTime,
+        ) -> zipfile.ZipInfo:
             info = zipfile.ZipInfo()
             info.filename = str(path)
-            info.date_time = \
-                datetime.datetime.fromtimestamp(mtime).timetuple()[:6]
+            # UTC, so that archive does not depend on local timezone
+            info.date_time = time.gmtime(max(mtime, ZIP_MIN_MTIME))[:6]
             info.external_attr = (self._file_mode | self._file_type) << 16
-            self._archive.writestr(info, content)
+            return info
 
 
-class _TgzArchiveCommand(_BaseArchiveCommand):
+class _TarArchiveCommand(_BaseArchiveCommand):
 
     class Archiver(_BaseArchiveCommand.Archiver):
 
         _archive: tarfile.TarFile
 
-        def __init__(self, archive_stream: BinaryIO) -> None:
-            super().__init__(archive_stream)
-            self._archive = tarfile.open(fileobj=archive_stream, mode='w:gz')
+        def __init__( self, archive_stream: BinaryIO,
+            *, mtime_clamp: int = DEFAULT_MTIME_CLAMP,
+        ) -> None:
+            super().__init__(archive_stream, mtime_clamp=mtime_clamp)
+            self._archive = tarfile.open(
+                fileobj=self._wrap_stream(archive_stream), mode='w',
+                format=tarfile.PAX_FORMAT, bufsize=self.chunk_size )
+
+        def _wrap_stream(self, archive_stream: BinaryIO) -> BinaryIO:
+            return archive_stream
 
         def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> bool:
             self._archive.close()
@@ -143,12 +298,97 @@ class _TgzArchiveCommand(_BaseArchiveCommand):
         def add_member_bytes( self,
             path: PurePosixPath, mtime: ArchiveMTime, content: bytes,
         ) -> None:
+            self._archive.addfile(
+                self._member_info(path, mtime, len(content)),
+                io.BytesIO(content) )
+
+        def add_member_stream( self,
+            path: PurePosixPath, mtime: ArchiveMTime,
+            content_stream: BinaryIO, size: int,
+        ) -> None:
+            # tarfile copies exactly info.size bytes, in bufsize chunks
+            self._archive.addfile(
+                self._member_info(path, mtime, size),
+                content_stream )
+
+        def _member_info( self,
+            path: PurePosixPath, mtime: ArchiveMTime, size: int,
+        ) -> tarfile.TarInfo:
             info = tarfile.TarInfo(str(path))
-            info.size = len(content)
-            info.mtime = mtime # type: ignore
+            info.size = size
+            info.mtime = int(mtime)
             info.mode = self._file_mode
             info.type = tarfile.REGTYPE
-            self._archive.addfile(info, io.BytesIO(content))
+            return info
+
+
+class _TgzArchiveCommand(_TarArchiveCommand):
+
+    class Archiver(_TarArchiveCommand.Archiver):
+
+        _gzip_stream: gzip.GzipFile
+
+        def _wrap_stream(self, archive_stream: BinaryIO) -> BinaryIO:
+            # Unlike tarfile.open(mode='w:gz'), this does not record
+            # the file name and current time in gzip header.
+            self._gzip_stream = gzip.GzipFile(
+                filename='', mode='wb', fileobj=archive_stream, mtime=0 )
+            return cast(BinaryIO, self._gzip_stream)
+
+        def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> bool:
+            result = super().__exit__(exc_type, exc_val, exc_tb)
+            self._gzip_stream.close()
+            return result
+
+
+class _CompressedTarArchiveCommand(_TarArchiveCommand):
+    """
+    Write an uncompressed tar archive and compress it with external program.
+
+    Compression is the expensive part of archive creation, so it is
+    delegated to a multi-threaded compressor, which is run as a subprocess
+    through the node updater (in parallel with other jobs) instead of
+    blocking the updater loop.
+    """
+
+    # Compressor must replace FILE with FILE + compressor_suffix.
+    compressor_callargs: ClassVar[Sequence[str]]
+    compressor_suffix: ClassVar[str]
+
+    _tar_path: PosixPath
+    _compressed_path: PosixPath
+    _compress_command: SubprocessCommand
+
+    def __init__(self, node: 'BaseArchiveNode') -> None:
+        super().__init__(node)
+        self._tar_path = node.path.with_name(f'.{node.path.name}.tar')
+        self._compressed_path = self._tar_path.with_name(
+            self._tar_path.name + self.compressor_suffix )
+        self._compress_command = SubprocessCommand( node,
+            [*self.compressor_callargs, self._tar_path.name],
+            cwd=node.path.parent )
+
+    async def _create_archive(self, mtime_clamp: int) -> None:
+        try:
+            await run_in_background( partial( self._write_archive,
+                self._tar_path, mtime_clamp ))
+            await self._compress_command.run()
+            os.replace(str(self._compressed_path), str(self.node.path))
+        finally:
+            for path in (self._tar_path, self._compressed_path):
+                if os.path.lexists(str(path)):
+                    path.unlink()
+
+
+class _TarXzArchiveCommand(_CompressedTarArchiveCommand):
+    compressor_callargs = ('xz', '--threads=0', '--force', '--quiet')
+    compressor_suffix = '.xz'
+
+
+class _TarZstArchiveCommand(_CompressedTarArchiveCommand):
+    compressor_callargs = ( 'zstd', '--threads=0', '--force', '--quiet',
+        '--rm' )
+    compressor_suffix = '.zst'
 
 
 class BaseArchiveNode(FileNode):
@@ -158,15 +398,42 @@ class BaseArchiveNode(FileNode):
 
     command: _BaseArchiveCommand
     archive_content: Dict[PurePosixPath, FilelikeNode]
+    archive_digests: Dict[PurePosixPath, str]
+    manifest_path: PosixPath
 
     def __init__( self, path: PosixPath,
         *, name: Optional[str] = None, needs: Iterable[Node] = (),
     ) -> None:
         super().__init__(path, name=name, needs=needs)
         self.archive_content = {}
+        # digests of members, that are already known when they are added
+        self.archive_digests = {}
+        # Sidecar file listing sha256 digests of archive members
+        # (and the mtime clamp they were archived with).
+        self.manifest_path = path.with_name(f'.{path.name}.sha256')
         self.command = self._Command(self)
 
-    def archive_add(self, path: PurePosixPath, node: FilelikeNode) -> None:
+    def _needs_build(self) -> bool:
+        if super()._needs_build():
+            return True
+        # archive created with another mtime clamp is to be recreated
+        try:
+            with self.manifest_path.open(encoding='utf-8') as sidecar_file:
+                sidecar_header = sidecar_file.readline()
+        except FileNotFoundError:
+            return True
+        return sidecar_header != _format_sidecar_header(_get_mtime_clamp())
+
+    def archive_add( self, path: PurePosixPath, node: FilelikeNode,
+        *, digest: Optional[str] = None,
+    ) -> None:
+        """
+        Add node to archive as path.
+
+        If digest (see node_digest()) is given, it is not computed again
+        for the archive manifest; it must stay valid until the archive is
+        updated.
+        """
         if not isinstance(node, FilelikeNode):
             raise TypeError(type(node))
         if path in self.archive_content:
@@ -176,6 +443,8 @@ class BaseArchiveNode(FileNode):
                 f"new_node: {node}")
         self.append_needs(node)
         self.archive_content[path] = node
+        if digest is not None:
+            self.archive_digests[path] = digest
 
     _skipped_nodes = (AutowrittenNeed, VarTextNode, ProxyNode)
 
@@ -218,3 +487,11 @@ class TgzArchiveNode(BaseArchiveNode):
     _Command = _TgzArchiveCommand
     default_suffix = '.tgz'
 
+
+class TarXzArchiveNode(BaseArchiveNode):
+    _Command = _TarXzArchiveCommand
+    default_suffix = '.tar.xz'
+
+class TarZstArchiveNode(BaseArchiveNode):
+    _Command = _TarZstArchiveCommand
+    default_suffix = '.tar.zst'
@@ -134,6 +134,10 @@ class CyclicNode(BuildableNode): # {{{1
         if isinstance(node, CyclicNeed):
             self.cyclic_needs.append(node)
 
+    def reset(self) -> None:
+        super().reset()
+        self.cycle = 0
+
     # Override
     async def update_self(self) -> None:
         if self.cycle == 0:
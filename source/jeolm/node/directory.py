@@ -126,6 +126,10 @@ class _CheckDirectoryNode(Node):
         rogue_names = self._rogue_names = tuple(self._find_rogue_names())
         return rogue_names
 
+    def reset(self) -> None:
+        super().reset()
+        self._rogue_names = None
+
     def root_relative(self, path: PosixPath) -> PurePosixPath:
         return self.dir_node.root_relative(path)
 
@@ -4,15 +4,17 @@ import io
 import os
 import fcntl
 import selectors
+import threading
 import subprocess
 
-from . import Node, NodeErrorReported, SubprocessCommand
+from . import Node, NodeErrorReported, SubprocessCommand, BackgroundCall
 
-from typing import ( cast, Union, Optional,
-    Tuple, List, Dict, Set,
+from typing import ( cast, Any, Union, Optional,
+    Iterable, Iterator, Tuple, List, Dict, Set,
     Coroutine, BinaryIO )
 # pylint: disable=invalid-name
-NodeCoroutine = Coroutine[SubprocessCommand, Union[None, bytes], None]
+NodeCoroutine = Coroutine[
+    Union[SubprocessCommand, BackgroundCall], Any, None ]
 # pylint: enable=invalid-name
 
 
@@ -114,10 +116,13 @@ class NodeUpdater: # {{{1
     _paused_coroutines: Dict[ Node,
         Union[
             Tuple[NodeCoroutine, None,  None],
-            Tuple[NodeCoroutine, bytes, None],
+            Tuple[NodeCoroutine, Any,   None],
             Tuple[NodeCoroutine, None,  Exception],
         ]
     ]
+    _running_calls: Dict[ Node,
+        Tuple[NodeCoroutine, threading.Thread, BinaryIO, List[Any]]
+    ]
     _error_occurred: bool
 
     def __init__(self, *, jobs: int) -> None:
@@ -132,6 +137,9 @@ class NodeUpdater: # {{{1
         # { node: (coroutine, process, pipe, output) }
         self._running_processes = {}
 
+        # { node: (coroutine, thread, pipe, [result, exception]) }
+        self._running_calls = {}
+
         # { node: (coroutine, value, exception) }
         self._paused_coroutines = {}
 
@@ -140,30 +148,64 @@ class NodeUpdater: # {{{1
     def update(self, node: Node) -> None:
         if node.updated:
             return
+        self.update_stream((node,))
+
+    def update_stream(self, nodes: Iterable[Node]) -> None:
+        """
+        Update nodes, which may be produced while the update is running.
+
+        Next node is taken from nodes only when there is a free job and
+        no ready node to start, so that already known nodes are being
+        built while the following ones are produced.  If producing nodes
+        raises, running jobs are waited for and the exception is
+        reraised.
+        """
         self._node_map.clear()
-        self._node_map.add_node(node)
         self._running_processes.clear()
+        self._running_calls.clear()
         self._paused_coroutines = {}
         self._error_occurred = False
+        node_iterator: Optional[Iterator[Node]] = iter(nodes)
+        stream_exception: Optional[Exception] = None
 
         while True:
             if self._paused_coroutines:
                 self._run_paused()
-            elif ( len(self._running_processes) < self.jobs and
+            elif ( self._running_jobs < self.jobs and
                     not self._error_occurred and self._node_map.ready_nodes ):
                 node = self._node_map.pop_ready_node()
                 # pylint: disable=assignment-from-no-return
                 coroutine = self._ready_node_update(node)
                 # pylint: enable=assignment-from-no-return
                 self._paused_coroutines[node] = (coroutine, None, None)
-            elif self._running_processes:
+            elif ( node_iterator is not None and
+                    self._running_jobs < self.jobs and
+                    not self._error_occurred ):
+                try:
+                    node = next(node_iterator)
+                except StopIteration:
+                    node_iterator = None
+                except Exception as exception: # pylint: disable=broad-except
+                    node_iterator = None
+                    stream_exception = exception
+                    self._error_occurred = True
+                else:
+                    if not node.updated:
+                        self._node_map.add_node(node)
+            elif self._running_jobs:
                 self._wait_running()
             else:
                 break
+        if stream_exception is not None:
+            raise stream_exception
         if self._error_occurred:
             raise NodeErrorReported
         self._node_map.check_finished_update()
 
+    @property
+    def _running_jobs(self) -> int:
+        return len(self._running_processes) + len(self._running_calls)
+
     def _run_paused(self) -> None:
         node, (coroutine, value, exception) = \
             self._paused_coroutines.popitem()
@@ -177,6 +219,9 @@ class NodeUpdater: # {{{1
         except NodeErrorReported:
             self._error_occurred = True
         else:
+            if isinstance(command, BackgroundCall):
+                self._start_call(node, coroutine, command)
+                return
             process = subprocess.Popen(
                 command.callargs, cwd=command.cwd,
                 stdin=subprocess.DEVNULL,
@@ -190,14 +235,50 @@ class NodeUpdater: # {{{1
             self._running_processes[node] = \
                 (coroutine, process, pipe, output)
 
+    def _start_call( self, node: Node, coroutine: NodeCoroutine,
+        call: BackgroundCall,
+    ) -> None:
+        # the pipe is closed by the thread when the call is finished,
+        # so that it is waited for together with processes
+        read_fd, write_fd = os.pipe()
+        outcome: List[Any] = [None, None]
+        def run_call() -> None:
+            try:
+                outcome[0] = call.function()
+            except Exception as exception: # pylint: disable=broad-except
+                outcome[1] = exception
+            finally:
+                os.close(write_fd)
+        thread = threading.Thread(
+            target=run_call, name=f'{node.name}:call', daemon=True )
+        pipe = cast(BinaryIO, os.fdopen(read_fd, 'rb', buffering=0))
+        self._running_calls[node] = (coroutine, thread, pipe, outcome)
+        thread.start()
+
+    def _finish_call(self, node: Node) -> None:
+        coroutine, thread, pipe, outcome = self._running_calls.pop(node)
+        pipe.close()
+        thread.join()
+        result, exception = outcome
+        if exception is None:
+            self._paused_coroutines[node] = (coroutine, result, None)
+        else:
+            self._paused_coroutines[node] = (coroutine, None, exception)
+
     def _wait_running(self) -> None:
         output_sel = selectors.DefaultSelector()
         for node, (coroutine, process, pipe, output) in \
                 self._running_processes.items():
             output_sel.register(pipe.fileno(), selectors.EVENT_READ, data=node)
+        for node, (coroutine, thread, pipe, outcome) in \
+                self._running_calls.items():
+            output_sel.register(pipe.fileno(), selectors.EVENT_READ, data=node)
         for key, events in output_sel.select():
             assert events == selectors.EVENT_READ
             node = key.data
+            if node in self._running_calls:
+                self._finish_call(node)
+                continue
             coroutine, process, pipe, output = self._running_processes[node]
             output_piece = pipe.read()
             if output_piece:
@@ -17,5 +17,11 @@ def _cache_node(key_function):
         return wrapper
     return decorator
 
+def _discard_nodes(nodes, stale_heads):
+    """Drop cached nodes with keys starting with any of stale_heads."""
+    stale_keys = [key for key in nodes if key[0] in stale_heads]
+    for key in stale_keys:
+        del nodes[key]
+
 # pylint: enable=protected-access
 
@@ -1,9 +1,11 @@
-from functools import partial
 from pathlib import PurePosixPath, PosixPath
 
 import jeolm.node
+import jeolm.node.directory
 import jeolm.node.symlink
+import jeolm.node.text
 import jeolm.node.archive
+from jeolm.utils.unique import unique
 
 from .document import DocumentNode, AsymptoteFigureNode
 from .figure import BuildableFigureNode
@@ -13,39 +15,44 @@ logger = logging.getLogger(__name__)
 
 import typing
 from typing import ( Type, Optional,
-    Iterable, Set )
+    Iterable, Set, Dict )
 
-class BaseDocumentArchiveNode(jeolm.node.archive.BaseArchiveNode):
+class DocumentArchiveMembers:
+    """
+    Collect source files of a built document.
 
-    def __init__( self,
-        path: PosixPath,
-        *, document_node: DocumentNode, source_dir: PosixPath,
-        name: Optional[str] = None, needs: Iterable[jeolm.node.Node] = (),
+    Files are named by their paths relative to the document build
+    directory; source files not linked into the build directory
+    are named 'extra/<source-path-with-dashes>'.
+    """
+
+    _skipped_nodes = jeolm.node.archive.BaseArchiveNode._skipped_nodes
+
+    def __init__( self, document_node: DocumentNode, source_dir: PosixPath,
     ) -> None:
-        super().__init__(path, name=name, needs=(*needs, document_node))
         self._document_node = document_node
         self._source_dir = source_dir
         self._document_output_dir = document_node.output_dir_node.path
         self._document_build_dir = document_node.build_dir_node.path
-        self._archive_filled = False
+        self.members: Dict[PurePosixPath, jeolm.node.FilelikeNode] = {}
+        self._seen_source_nodes: Set[jeolm.node.FilelikeNode] = set()
 
-    # Override
-    async def update_self(self) -> None:
-        if not self._archive_filled:
-            assert self._document_node.updated
-            seen_source_nodes: Set[jeolm.node.FilelikeNode] = set()
-            self._archive_add_document_tree( self._document_node,
-                seen_source_nodes=seen_source_nodes )
-            self._archive_add_extra_sources( self._document_node,
-                seen_source_nodes=seen_source_nodes )
-            self._archive_filled = True
-            assert not self.updated
-            return
-        await super().update_self()
+    def collect(self) -> Dict[PurePosixPath, jeolm.node.FilelikeNode]:
+        assert self._document_node.updated
+        self._add_document_tree(self._document_node)
+        self._add_extra_sources(self._document_node)
+        return self.members
 
-    def _archive_add_document_item( self, node: jeolm.node.Node,
-        *, seen_source_nodes: Set[jeolm.node.FilelikeNode],
+    def _add(self, path: PurePosixPath, node: jeolm.node.FilelikeNode
     ) -> None:
+        if path in self.members:
+            raise ValueError(
+                f"Path already added to archive: {path}, "
+                f"old_node: {self.members[path]}, "
+                f"new_node: {node}")
+        self.members[path] = node
+
+    def _add_document_item(self, node: jeolm.node.Node) -> None:
         if not isinstance(node, jeolm.node.FilelikeNode):
             return
         if isinstance(node, self._skipped_nodes):
@@ -53,49 +60,64 @@ class BaseDocumentArchiveNode(jeolm.node.archive.BaseArchiveNode):
         path: PosixPath = node.path
         if self._document_build_dir not in path.parents:
             return
-        recurse = partial( self._archive_add_document_tree, node,
-            seen_source_nodes=seen_source_nodes )
         if self._document_output_dir in path.parents:
-            recurse()
+            self._add_document_tree(node)
             return
         if isinstance(node, AsymptoteFigureNode):
             assert node.link_node is not None
-            self._archive_add_document_item( node.link_node,
-                seen_source_nodes=seen_source_nodes )
+            self._add_document_item(node.link_node)
             return
         archive_path: PurePosixPath = path.relative_to(self._document_build_dir)
-        self.archive_add(archive_path, node)
-        while isinstance(node, (jeolm.node.symlink.SymLinkNode, jeolm.node.symlink.ProxyNode)):
-            logger.debug('%s -> %s', node.name, node.source.name)
-            node = node.source
-        seen_source_nodes.add(node)
-        recurse()
-        return
-
-    def _archive_add_document_tree( self, node: jeolm.node.Node,
-        *, seen_source_nodes: Set[jeolm.node.FilelikeNode],
-    ) -> None:
+        self._add(archive_path, node)
+        source_node = node
+        while isinstance(source_node, (jeolm.node.symlink.SymLinkNode, jeolm.node.symlink.ProxyNode)):
+            logger.debug('%s -> %s', source_node.name, source_node.source.name)
+            source_node = source_node.source
+        self._seen_source_nodes.add(source_node)
+        self._add_document_tree(node)
+
+    def _add_document_tree(self, node: jeolm.node.Node) -> None:
         for need in node.needs:
-            self._archive_add_document_item( need,
-                seen_source_nodes=seen_source_nodes )
+            self._add_document_item(need)
 
-    def _archive_add_extra_sources( self, document_node: jeolm.node.FilelikeNode,
-        *, seen_source_nodes: Set[jeolm.node.FilelikeNode],
-    ) -> None:
+    def _add_extra_sources(self, document_node: jeolm.node.Node) -> None:
         source_dir = self._source_dir
-        def node_filter(node: jeolm.node.FilelikeNode) -> bool:
+        for node in document_node.iter_needs():
+            if not isinstance(node, jeolm.node.FilelikeNode):
+                continue
+            if isinstance(node, self._skipped_nodes):
+                continue
             if source_dir not in node.path.parents:
-                return False
-            if isinstance(node, jeolm.node.symlink.ProxyNode):
-                return False
-            if node in seen_source_nodes:
-                return False
-            return True
-        def path_namer(node: jeolm.node.FilelikeNode) -> PurePosixPath:
-            return PurePosixPath( 'extra',
-                '-'.join(node.path.relative_to(source_dir).parts) )
-        self.archive_add_tree( document_node,
-            node_filter=node_filter, path_namer=path_namer )
+                continue
+            if node in self._seen_source_nodes:
+                continue
+            self._add( PurePosixPath( 'extra',
+                '-'.join(node.path.relative_to(source_dir).parts) ), node )
+
+
+class BaseDocumentArchiveNode(jeolm.node.archive.BaseArchiveNode):
+
+    def __init__( self,
+        path: PosixPath,
+        *, document_node: DocumentNode, source_dir: PosixPath,
+        name: Optional[str] = None, needs: Iterable[jeolm.node.Node] = (),
+    ) -> None:
+        super().__init__(path, name=name, needs=(*needs, document_node))
+        self._document_node = document_node
+        self._source_dir = source_dir
+        self._archive_filled = False
+
+    # Override
+    async def update_self(self) -> None:
+        if not self._archive_filled:
+            members = DocumentArchiveMembers(
+                self._document_node, self._source_dir ).collect()
+            for path, node in members.items():
+                self.archive_add(path, node)
+            self._archive_filled = True
+            assert not self.updated
+            return
+        await super().update_self()
 
 
 class ZipDocumentArchiveNode(
@@ -106,3 +128,103 @@ class TgzDocumentArchiveNode(
         BaseDocumentArchiveNode, jeolm.node.archive.TgzArchiveNode ):
     pass
 
+class TarXzDocumentArchiveNode(
+        BaseDocumentArchiveNode, jeolm.node.archive.TarXzArchiveNode ):
+    pass
+
+class TarZstDocumentArchiveNode(
+        BaseDocumentArchiveNode, jeolm.node.archive.TarZstArchiveNode ):
+    pass
+
+
+class BaseBundleArchiveNode(jeolm.node.archive.BaseArchiveNode):
+    """
+    Single archive with sources of many documents.
+
+    Each distinct file is stored once, as 'objects/<sha256>'.
+    For each document, 'documents/<outname>.sha256' lists its files
+    (in sha256sum format, with paths as in a document archive),
+    so that the document sources can be restored from objects.
+    """
+
+    def __init__( self,
+        path: PosixPath,
+        *, document_nodes: Iterable[DocumentNode], source_dir: PosixPath,
+        manifest_dir_node: jeolm.node.directory.DirectoryNode,
+        name: Optional[str] = None, needs: Iterable[jeolm.node.Node] = (),
+    ) -> None:
+        self._document_nodes = list(document_nodes)
+        # manifests of documents are named after outnames
+        outname_nodes: Dict[str, DocumentNode] = {}
+        for document_node in self._document_nodes:
+            other_node = outname_nodes.setdefault(
+                document_node.outname, document_node )
+            if other_node is not document_node:
+                raise ValueError(
+                    f"Documents {other_node} and {document_node} "
+                    f"have the same outname {document_node.outname!r}, "
+                    f"cannot bundle both" )
+        super().__init__( path, name=name,
+            needs=(*needs, *self._document_nodes, manifest_dir_node) )
+        self._source_dir = source_dir
+        self._manifest_dir_node = manifest_dir_node
+        self._archive_filled = False
+
+    # Override
+    async def update_self(self) -> None:
+        if not self._archive_filled:
+            document_members = [
+                ( document_node, DocumentArchiveMembers(
+                    document_node, self._source_dir ).collect() )
+                for document_node in self._document_nodes ]
+            object_nodes = unique( node
+                for document_node, members in document_members
+                for path, node in sorted(members.items()) )
+            object_digests: Dict[jeolm.node.FilelikeNode, str] = \
+                await jeolm.node.run_in_background(
+                    lambda: { node: jeolm.node.archive.node_digest(node)
+                        for node in object_nodes } )
+            stored_digests: Set[str] = set()
+            for document_node, members in document_members:
+                manifest: jeolm.node.archive.ArchiveManifest = {}
+                for path, node in sorted(members.items()):
+                    digest = manifest[path] = object_digests[node]
+                    if digest not in stored_digests:
+                        # already hashed, no need to hash again
+                        self.archive_add( PurePosixPath('objects', digest),
+                            node, digest=digest )
+                        stored_digests.add(digest)
+                self._archive_add_manifest(document_node.outname, manifest)
+            self._archive_filled = True
+            assert not self.updated
+            return
+        await super().update_self()
+
+    def _archive_add_manifest( self, outname: str,
+        manifest: jeolm.node.archive.ArchiveManifest,
+    ) -> None:
+        manifest_name = f'{outname}.sha256'
+        manifest_node = jeolm.node.text.SimpleTextNode(
+            path=self._manifest_dir_node.path/manifest_name,
+            text=jeolm.node.archive.format_manifest(manifest),
+            name=f'{self.name}:manifest:{outname}',
+            needs=(self._manifest_dir_node,) )
+        self.archive_add(
+            PurePosixPath('documents', manifest_name), manifest_node )
+
+
+class ZipBundleArchiveNode(
+        BaseBundleArchiveNode, jeolm.node.archive.ZipArchiveNode ):
+    pass
+
+class TgzBundleArchiveNode(
+        BaseBundleArchiveNode, jeolm.node.archive.TgzArchiveNode ):
+    pass
+
+class TarXzBundleArchiveNode(
+        BaseBundleArchiveNode, jeolm.node.archive.TarXzArchiveNode ):
+    pass
+
+class TarZstBundleArchiveNode(
+        BaseBundleArchiveNode, jeolm.node.archive.TarZstArchiveNode ):
+    pass
@@ -12,8 +12,9 @@ import jeolm.node.latex
 from jeolm.records import RecordPath, NAME_PATTERN
 from jeolm.target import Target
 from jeolm.driver import DocumentRecipe
+from jeolm.driver.recipe_cache import record_dependencies, dependencies_hold
 
-from . import _cache_node
+from . import _cache_node, _discard_nodes
 from .figure import FigureNodeFactory, BuildableFigureNode
 
 import logging
@@ -32,6 +33,7 @@ class DocumentNode(jeolm.node.FileNode):
     build_dir_node: jeolm.node.directory.DirectoryNode
     output_dir_node: jeolm.node.directory.DirectoryNode
     outname: str
+    recipe: DocumentRecipe
     pass
 
 class DocumentNodeFactory:
@@ -65,16 +67,20 @@ class DocumentNodeFactory:
 
     def __init__(self, *, project, driver,
         build_dir_node,
-        source_node_factory, package_node_factory, figure_node_factory
+        source_node_factory, package_node_factory, figure_node_factory,
+        recipe_cache=None
     ):
         self.project = project
         self.driver = driver
+        self.recipe_cache = recipe_cache
         self.build_dir_node = build_dir_node
         self.source_node_factory = source_node_factory
         self.package_node_factory = package_node_factory
         self.figure_node_factory = figure_node_factory
 
         self._nodes = dict()
+        # records and recipes, that document nodes were produced from
+        self._sources = dict()
 
     @property
     def build_dir(self):
@@ -89,9 +95,47 @@ class DocumentNodeFactory:
         return target, 'pdf'
     # pylint: enable=no-self-use
 
+    def discard_stale_nodes(self, *, stale_packages, stale_figures):
+        """
+        Drop nodes of documents, which were produced from records changed
+        since then, or use packages or figures with dropped nodes.
+        """
+        stale_targets = set()
+        for target, (dependencies, recipe) in self._sources.items():
+            if not dependencies_hold(self.driver, dependencies):
+                stale_targets.add(target)
+                continue
+            for key in recipe.document.keys():
+                if isinstance(key, DocumentRecipe.PackageKey):
+                    if key.package_path in stale_packages:
+                        break
+                elif isinstance(key, DocumentRecipe.BaseFigureKey):
+                    if key.figure_path in stale_figures:
+                        break
+            else:
+                continue
+            stale_targets.add(target)
+        _discard_nodes(self._nodes, stale_targets)
+        for target in stale_targets:
+            del self._sources[target]
+
     @_cache_node(_document_node_key)
     def _get_document_node(self, target) -> DocumentNode:
-        recipe = self.driver.produce_document_recipe(target)
+        with self.driver.tracking_reads() as read_paths:
+            document_node = self._produce_document_node(target)
+        dependencies = set(record_dependencies(self.driver, read_paths))
+        if self.recipe_cache is not None:
+            # recipe may have been taken from the cache without reading
+            dependencies.update(self.recipe_cache.get_dependencies(target))
+        self._sources[target] = (
+            tuple(sorted(dependencies)), document_node.recipe )
+        return document_node
+
+    def _produce_document_node(self, target) -> DocumentNode:
+        if self.recipe_cache is not None:
+            recipe = self.recipe_cache.produce_document_recipe(target)
+        else:
+            recipe = self.driver.produce_document_recipe(target)
         build_dir_node = self._get_build_dir(target, recipe)
         output_dir_node = jeolm.node.directory.DirectoryNode(
             name='document:{}:output:dir'.format(target),
@@ -132,6 +176,7 @@ class DocumentNodeFactory:
         proxy_document_node.build_dir_node = build_dir_node
         proxy_document_node.output_dir_node = output_dir_node
         proxy_document_node.outname = recipe.outname
+        proxy_document_node.recipe = recipe
         # pylint: enable=attribute-defined-outside-init
         return proxy_document_node
 
@@ -460,6 +505,13 @@ class AsymptoteFigureNode(
         super()._append_needs(node)
         self._invariable_needs.append(node)
 
+    # Override
+    def reset(self):
+        super().reset()
+        self.sizefile_node.reset()
+        self.link_node = None
+        self.needs = list(self._invariable_needs)
+
     # update_self is called
     # - for the first time
     # - after relinking figure
@@ -9,14 +9,16 @@ import jeolm.node.cyclic
 from jeolm.node.text import text_hash
 
 from jeolm.driver import FigureRecipe
+from jeolm.driver.recipe_cache import ( Dependencies,
+    record_dependencies, dependencies_hold )
 
-from . import _cache_node
+from . import _cache_node, _discard_nodes
 
 import logging
 logger = logging.getLogger(__name__)
 
 import typing
-from typing import Any, Dict
+from typing import Any, Dict, FrozenSet, Tuple, Set
 if typing.TYPE_CHECKING:
     import jeolm.project
     from .source import SourceNodeFactory
@@ -47,6 +49,7 @@ class FigureNodeFactory: #{{{1
     build_dir_node: jeolm.node.directory.DirectoryNode
 
     _nodes: Dict[Any, jeolm.node.FilelikeNode]
+    _dependencies: Dict[Tuple[RecordPath, FrozenSet[str]], Dependencies]
 
     def __init__( self, *,
         project: 'jeolm.project.Project',
@@ -60,6 +63,8 @@ class FigureNodeFactory: #{{{1
         self.build_dir_node = build_dir_node
 
         self._nodes = dict()
+        # records, that figure recipes were produced from
+        self._dependencies = dict()
 
     @property
     def build_dir(self):
@@ -74,11 +79,33 @@ class FigureNodeFactory: #{{{1
     def _figure_node_key(self, figure_path, *, figure_types):
         return figure_path, figure_types
 
+    def discard_stale_nodes(self) -> Set[RecordPath]:
+        """
+        Drop nodes of figures, whose recipes were produced from records
+        changed since then.
+
+        Return paths of these figures.
+        """
+        stale_paths = {
+            figure_path
+            for (figure_path, figure_types), dependencies
+            in self._dependencies.items()
+            if not dependencies_hold(self.driver, dependencies) }
+        _discard_nodes(self._nodes, stale_paths)
+        for key in list(self._dependencies):
+            figure_path, figure_types = key
+            if figure_path in stale_paths:
+                del self._dependencies[key]
+        return stale_paths
+
     @_cache_node(_figure_node_key)
     def _get_figure_node(self, figure_path, *, figure_types):
-        figure_recipe: FigureRecipe = \
-            self.driver.produce_figure_recipe(
-                figure_path, figure_types=figure_types )
+        with self.driver.tracking_reads() as read_paths:
+            figure_recipe: FigureRecipe = \
+                self.driver.produce_figure_recipe(
+                    figure_path, figure_types=figure_types )
+        self._dependencies[figure_path, figure_types] = \
+            record_dependencies(self.driver, read_paths)
         source_type = figure_recipe.source_type
         figure_type = figure_recipe.figure_type
 
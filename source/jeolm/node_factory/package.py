@@ -1,7 +1,7 @@
 from string import Template
 from pathlib import PosixPath
 
-from . import _cache_node
+from . import _cache_node, _discard_nodes
 
 import jeolm.node
 import jeolm.node.directory
@@ -9,12 +9,14 @@ import jeolm.node.symlink
 import jeolm.node.text
 
 from jeolm.records import RecordPath
+from jeolm.driver.recipe_cache import ( Dependencies,
+    record_dependencies, dependencies_hold )
 
 import logging
 logger = logging.getLogger(__name__)
 
 import typing
-from typing import Any, Dict
+from typing import Any, Dict, Set
 if typing.TYPE_CHECKING:
     from .source import SourceNodeFactory
 
@@ -38,6 +40,7 @@ class PackageNodeFactory:
     build_dir_node: jeolm.node.directory.DirectoryNode
 
     _nodes: Dict[Any, jeolm.node.FilelikeNode]
+    _dependencies: Dict[RecordPath, Dependencies]
 
     def __init__(self, *, project, driver,
         build_dir_node,
@@ -49,6 +52,8 @@ class PackageNodeFactory:
         self.build_dir_node = build_dir_node
 
         self._nodes = dict()
+        # records, that package recipes were produced from
+        self._dependencies = dict()
 
     @property
     def build_dir(self):
@@ -63,9 +68,28 @@ class PackageNodeFactory:
         return package_path, 'sty'
     # pylint: enable=no-self-use,unused-argument,unused-variable
 
+    def discard_stale_nodes(self) -> Set[RecordPath]:
+        """
+        Drop nodes of packages, whose recipes were produced from records
+        changed since then.
+
+        Return paths of these packages.
+        """
+        stale_paths = {
+            package_path
+            for package_path, dependencies in self._dependencies.items()
+            if not dependencies_hold(self.driver, dependencies) }
+        _discard_nodes(self._nodes, stale_paths)
+        for package_path in stale_paths:
+            del self._dependencies[package_path]
+        return stale_paths
+
     @_cache_node(_package_node_key)
     def _get_package_node(self, package_path):
-        package_recipe = self.driver.produce_package_recipe(package_path)
+        with self.driver.tracking_reads() as read_paths:
+            package_recipe = self.driver.produce_package_recipe(package_path)
+        self._dependencies[package_path] = \
+            record_dependencies(self.driver, read_paths)
         package_type = package_recipe.source_type
 
         if package_type == 'dtx':
@@ -2,6 +2,8 @@ import jeolm.node
 import jeolm.node.directory
 import jeolm.node.symlink
 from jeolm.utils.unique import unique
+from jeolm.driver import DriverError
+from jeolm.driver.recipe_cache import RecipeCache
 
 from .source import SourceNodeFactory
 from .figure import FigureNodeFactory
@@ -14,16 +16,20 @@ logger = logging.getLogger(__name__)
 import typing
 from typing import Type
 if typing.TYPE_CHECKING:
-    from .archive import BaseDocumentArchiveNode
+    from .archive import BaseDocumentArchiveNode, BaseBundleArchiveNode
 
 class TargetNode(jeolm.node.Node):
     pass
 
 class TargetNodeFactory:
 
-    def __init__(self, *, project, driver):
+    def __init__(self, *, project, driver, persistent_recipes=True):
         self.project = project
         self.driver = driver
+        # recipe cache without path lives only as long as the factory
+        self.recipe_cache = RecipeCache( self.driver,
+            self.project.build_dir/'recipe.cache.pickle'
+                if persistent_recipes else None )
 
         self.source_node_factory = SourceNodeFactory(project=self.project)
         self.figure_node_factory = FigureNodeFactory(
@@ -48,11 +54,53 @@ class TargetNodeFactory:
             source_node_factory=self.source_node_factory,
             package_node_factory=self.package_node_factory,
             figure_node_factory=self.figure_node_factory,
+            recipe_cache=self.recipe_cache,
         )
 
+    def refresh(self):
+        """
+        Prepare nodes to be built again, after driver records may have
+        changed.
+
+        Nodes of documents, packages and figures, that were produced from
+        changed records, are dropped.  Other nodes (including source
+        nodes) are kept and reset, so that a document is constructed
+        anew only if its recipe may have changed.
+        """
+        self.recipe_cache.expire_checks()
+        stale_packages = self.package_node_factory.discard_stale_nodes()
+        stale_figures = self.figure_node_factory.discard_stale_nodes()
+        self.document_node_factory.discard_stale_nodes(
+            stale_packages=stale_packages, stale_figures=stale_figures )
+        # pylint: disable=protected-access
+        kept_nodes = [
+            *self.source_node_factory.nodes.values(),
+            *self.figure_node_factory._nodes.values(),
+            *self.package_node_factory._nodes.values(),
+            *self.document_node_factory._nodes.values(), ]
+        # pylint: enable=protected-access
+        seen_nodes = set()
+        for kept_node in kept_nodes:
+            for node in kept_node.iter_needs(_seen_nodes=seen_nodes):
+                node.reset()
+
     def __call__( self, targets, *,
-        delegate=True, archive=None, name='target'
+        delegate=True, archive=None, bundle=None, name='target'
     ):
+        *unused, target_node = self.generate_nodes( targets,
+            delegate=delegate, archive=archive, bundle=bundle, name=name )
+        return target_node
+
+    def generate_nodes( self, targets, *,
+        delegate=True, archive=None, bundle=None, name='target', jobs=1
+    ):
+        """
+        Yield nodes of documents as soon as they are constructed,
+        and the target node (needing all of them) at last.
+
+        If jobs is greater than one, document recipes are produced in
+        parallel, and documents are yielded in the order of completion.
+        """
         if delegate:
             targets = [
                 delegated_target.flags_clean_copy(origin='target')
@@ -60,11 +108,39 @@ class TargetNodeFactory:
                 in self.driver.list_delegated_targets(*targets)
             ]
 
+        # fail before any document is constructed
+        bundle_node_class = ( None if bundle is None
+            else self.get_bundle_node_class(bundle) )
         target_node = TargetNode(name=name)
-        for target in unique(targets):
+        document_nodes = []
+        try:
+            yield from self._generate_document_nodes( unique(targets),
+                target_node, document_nodes, archive=archive,
+                bundle=bundle is not None, jobs=jobs )
+        finally:
+            self.recipe_cache.save()
+        if bundle is not None:
+            target_node.append_needs( self._get_bundle_node( document_nodes,
+                bundle_path=bundle, bundle_node_class=bundle_node_class ))
+        yield target_node
+
+    def _generate_document_nodes( self, targets,
+        target_node, document_nodes, *, archive, bundle, jobs
+    ):
+        # bundled documents are named after outnames
+        outname_targets = {}
+        for target in self.recipe_cache.prefetch_document_recipes(
+                targets, jobs=jobs ):
             document_node = self.document_node_factory(target)
             outname = document_node.outname
             assert '/' not in outname
+            if bundle:
+                other_target = outname_targets.setdefault(outname, target)
+                if other_target != target:
+                    raise DriverError(
+                        f"Targets {other_target} and {target} "
+                        f"have the same outname {outname!r}, "
+                        f"cannot bundle both" )
             exposed_node = jeolm.node.symlink.SymLinkedFileNode(
                 name='document:{}:exposed'.format(target),
                 source=document_node,
@@ -72,11 +148,13 @@ class TargetNodeFactory:
                     document_node.path.suffix )
             )
             target_node.append_needs(exposed_node)
+            document_nodes.append(document_node)
+            yield exposed_node
             if archive is not None:
                 archive_node = self._get_archive_node( target,
                     document_node, archive_type=archive )
                 target_node.append_needs(archive_node)
-        return target_node
+                yield archive_node
 
     def _get_archive_node( self, target, document_node, archive_type
     ) -> 'BaseDocumentArchiveNode':
@@ -87,6 +165,12 @@ class TargetNodeFactory:
         elif archive_type == 'tgz':
             from .archive import TgzDocumentArchiveNode
             archive_node_class = TgzDocumentArchiveNode
+        elif archive_type == 'txz':
+            from .archive import TarXzDocumentArchiveNode
+            archive_node_class = TarXzDocumentArchiveNode
+        elif archive_type == 'tzst':
+            from .archive import TarZstDocumentArchiveNode
+            archive_node_class = TarZstDocumentArchiveNode
         else:
             raise RuntimeError(archive_type)
         archive_node = archive_node_class(
@@ -97,3 +181,37 @@ class TargetNodeFactory:
         )
         return archive_node
 
+
+    @staticmethod
+    def get_bundle_node_class(bundle_path
+    ) -> Type['BaseBundleArchiveNode']:
+        """
+        Return bundle archive node class, chosen by suffix of bundle_path.
+
+        Raise ValueError if the suffix is not recognized.
+        """
+        from .archive import ( ZipBundleArchiveNode, TgzBundleArchiveNode,
+            TarXzBundleArchiveNode, TarZstBundleArchiveNode )
+        bundle_node_class: Type['BaseBundleArchiveNode']
+        for bundle_node_class in ( ZipBundleArchiveNode, TgzBundleArchiveNode,
+            TarXzBundleArchiveNode, TarZstBundleArchiveNode
+        ):
+            assert bundle_node_class.default_suffix is not None
+            if bundle_path.name.endswith(bundle_node_class.default_suffix):
+                return bundle_node_class
+        raise ValueError(
+            f"Unrecognized bundle archive suffix: {bundle_path.name}" )
+
+    def _get_bundle_node( self, document_nodes, bundle_path,
+        bundle_node_class: Type['BaseBundleArchiveNode'],
+    ) -> 'BaseBundleArchiveNode':
+        bundle_node = bundle_node_class(
+            document_nodes=document_nodes,
+            source_dir=self.project.source_dir,
+            manifest_dir_node=jeolm.node.directory.DirectoryNode(
+                name='bundle:dir',
+                path=self.project.build_dir/'bundles', parents=True ),
+            name="bundle:{}".format(bundle_path.name),
+            path=bundle_path,
+        )
+        return bundle_node
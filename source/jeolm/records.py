@@ -1,19 +1,21 @@
 from functools import partial
 from collections import OrderedDict
-from contextlib import suppress
+from contextlib import contextmanager, suppress
 import re
+import hashlib
 from pathlib import PurePosixPath
 
 from jeolm.utils.unique import unique
 from jeolm.utils.ordering import ( natural_keyfunc, KeyFunc,
-    mapping_ordered_keys, mapping_ordered_items )
+    mapping_ordered_keys, mapping_ordered_items, OrderedMapping )
 
 import logging
 logger = logging.getLogger(__name__)
 
 from typing import ( NewType, Type, ClassVar, Any, Union, Optional, cast,
-    Callable, Iterable, Container, Sequence, Mapping,
-    Tuple, List, Dict,
+    Callable, Iterable, Iterator, Container, Sequence,
+    Mapping, MutableMapping,
+    Tuple, List, Dict, Set,
     Pattern )
 
 NAME_PATTERN = r'\w+(?:-\w+)*'
@@ -36,15 +38,70 @@ class RecordPathError(ValueError):
 Name = NewType('Name', str)
 
 class RecordPath:
-    __slots__ = ['_parts', '_parent']
+    """
+    Path of a record.
+
+    Paths are interned: constructing a path from the same parts again
+    returns the same object, which caches its parent, children and
+    sorting key.
+    """
+    __slots__ = ['_parts', '_parent', '_children', '_sorting_key']
 
     _parts: Tuple[Name, ...]
     _parent: Optional['RecordPath']
+    _children: Optional[Dict[str, 'RecordPath']]
+    _sorting_key: Optional[Tuple[Any, ...]]
+
+    _interned: ClassVar[Dict[Tuple[Name, ...], 'RecordPath']] = {}
+    _sorting_keyfunc: ClassVar[KeyFunc] = natural_keyfunc
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._interned = {}
+
+    def __new__(cls, *parts: Union[str, 'RecordPath']) -> 'RecordPath':
+        if not parts:
+            # Root is not interned, since unpickling of paths pickled
+            # before interning calls __new__() without arguments.
+            return cls._create(())
+        if len(parts) == 2:
+            base, name = parts
+            if type(base) is cls and base._children is not None:
+                with suppress(KeyError):
+                    return base._children[name] # type: ignore
+        return cls._intern(tuple(cls._digest_parts(parts)))
 
     def __init__(self, *parts: Union[str, 'RecordPath']) -> None:
+        # parts are digested by __new__()
         super().__init__()
-        self._parts = tuple(self._digest_parts(parts))
+
+    @classmethod
+    def _intern(cls, parts: Tuple[Name, ...]) -> 'RecordPath':
+        interned = cls._interned
+        with suppress(KeyError):
+            return interned[parts]
+        path = interned[parts] = cls._create(parts)
+        return path
+
+    @classmethod
+    def _create(cls, parts: Tuple[Name, ...]) -> 'RecordPath':
+        path = super().__new__(cls)
+        path._parts = parts
+        path._parent = None
+        path._children = None
+        path._sorting_key = None
+        return path
+
+    def __reduce__(self) -> Any:
+        return (type(self), self._parts)
+
+    def __setstate__(self, state: Any) -> None:
+        # Paths pickled before interning.
+        dict_state, slots_state = state
+        self._parts = tuple(slots_state['_parts'])
         self._parent = None
+        self._children = None
+        self._sorting_key = None
 
     @classmethod
     def _digest_parts( cls, parts: Iterable[Union[str, 'RecordPath']]
@@ -93,6 +150,8 @@ class RecordPath:
         return not self._parts
 
     def __eq__(self, other: Any) -> bool:
+        if self is other:
+            return True
         if not isinstance(other, RecordPath):
             return NotImplemented
         return self.parts == other.parts
@@ -125,15 +184,42 @@ class RecordPath:
             return NotImplemented
         return self.sorting_key() >= other.sorting_key()
 
-    def sorting_key(self, keyfunc: KeyFunc = natural_keyfunc) -> Any:
-        return [keyfunc(part) for part in self.parts]
+    def sorting_key(self, keyfunc: Optional[KeyFunc] = None) -> Any:
+        """
+        Return key for sorting paths.
+
+        Key for the default keyfunc of the class is computed only once.
+        """
+        default_keyfunc = type(self)._sorting_keyfunc
+        if keyfunc is not None and keyfunc is not default_keyfunc:
+            return tuple(keyfunc(part) for part in self.parts)
+        sorting_key = self._sorting_key
+        if sorting_key is None:
+            if not self.parts:
+                sorting_key = ()
+            else:
+                sorting_key = ( *self.parent.sorting_key(),
+                    default_keyfunc(self.name) )
+            self._sorting_key = sorting_key
+        return sorting_key
 
     def __truediv__(self, other: Any) -> 'RecordPath':
         if not isinstance(other, str):
             return NotImplemented
+        children = self._children
+        if children is not None:
+            with suppress(KeyError):
+                return children[other]
         if other.startswith('/'):
             raise ValueError(other)
-        return type(self)(self, other)
+        child = type(self)(self, other)
+        if '/' not in other and other not in {'', '.', '..'}:
+            if children is None:
+                children = self._children = {}
+            children[other] = child
+            if child._parent is None:
+                child._parent = self
+        return child
 
     @property
     def parent(self) -> 'RecordPath':
@@ -180,15 +266,147 @@ class RecordError(Exception):
 class RecordNotFoundError(RecordError, LookupError):
     pass
 
-Record = Dict[str, Any]
+Record = MutableMapping[str, Any]
+
+class DerivedRecord(MutableMapping[str, Any]):
+    """
+    Record derived from an original record (see Records._derive_record).
+
+    The original record is shared, not copied: only the values changed
+    by derivation are stored in the derived record itself.
+    Once derived, the record is frozen and may not be modified.
+    Values computed from a frozen record may be kept in its frozen_cache.
+    """
+    __slots__ = ['_original', '_overlay', '_removed', '_frozen',
+        '_frozen_cache']
+
+    _original: Mapping[str, Any]
+    _overlay: Dict[str, Any]
+    _removed: Optional[Set[str]]
+    _frozen: bool
+    _frozen_cache: Optional[Dict[Any, Any]]
+
+    def __init__(self, original: Mapping[str, Any]) -> None:
+        super().__init__()
+        self._original = original
+        self._overlay = {}
+        self._removed = None
+        self._frozen = False
+        self._frozen_cache = None
+
+    def freeze(self) -> None:
+        self._frozen = True
+
+    @property
+    def frozen_cache(self) -> Optional[Dict[Any, Any]]:
+        """
+        Dictionary for values computed from the record, or None if the
+        record is not frozen yet.
+        """
+        if not self._frozen:
+            return None
+        frozen_cache = self._frozen_cache
+        if frozen_cache is None:
+            frozen_cache = self._frozen_cache = {}
+        return frozen_cache
+
+    def __getitem__(self, key: str) -> Any:
+        overlay = self._overlay
+        if key in overlay:
+            return overlay[key]
+        if self._removed is not None and key in self._removed:
+            raise KeyError(key)
+        return self._original[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        overlay = self._overlay
+        if key in overlay:
+            return overlay[key]
+        if self._removed is not None and key in self._removed:
+            return default
+        return self._original.get(key, default)
+
+    def __contains__(self, key: Any) -> bool:
+        if key in self._overlay:
+            return True
+        if self._removed is not None and key in self._removed:
+            return False
+        return key in self._original
+
+    def __iter__(self) -> Iterator[str]:
+        removed = self._removed or ()
+        original = self._original
+        for key in original:
+            if key not in removed:
+                yield key
+        for key in self._overlay:
+            if key not in original:
+                yield key
+
+    def __len__(self) -> int:
+        return (
+            len(self._original) - len(self._removed or ()) +
+            len(self._overlay.keys() - self._original.keys()) )
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self._frozen:
+            raise TypeError("Derived record is read-only")
+        self._overlay[key] = value
+        if self._removed is not None:
+            self._removed.discard(key)
+
+    def __delitem__(self, key: str) -> None:
+        if self._frozen:
+            raise TypeError("Derived record is read-only")
+        if key not in self:
+            raise KeyError(key)
+        self._overlay.pop(key, None)
+        if key in self._original:
+            if self._removed is None:
+                self._removed = set()
+            self._removed.add(key)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        overlay = self._overlay
+        if key in overlay:
+            return overlay[key]
+        original = self._original
+        if key in original and (
+                self._removed is None or key not in self._removed ):
+            return original[key]
+        self[key] = default
+        return default
+
+    def copy(self) -> Dict[str, Any]:
+        """Return a mutable (shallow) copy of the same type as original."""
+        original = self._original
+        while isinstance(original, DerivedRecord):
+            original = original._original
+        return cast(Dict[str, Any], type(original)(self.items()))
+
+    def __repr__(self) -> str:
+        return '{cls.__qualname__}({record!r})'.format(
+            cls=type(self), record=dict(self.items()) )
+
+class OrderedDerivedRecord(DerivedRecord):
+    """Derived record, which keys are ordered as keys of original."""
+    __slots__ = []
+
+OrderedMapping.register(OrderedDerivedRecord)
 
 class Records:
 
     _records: Record
     _records_cache: Dict[Tuple[RecordPath, bool], Record]
+    _child_names_cache: Dict[Tuple[RecordPath, bool], List[Name]]
+    _digest_cache: Dict[Tuple[RecordPath, bool], bytes]
+    _fingerprint_cache: Dict[RecordPath, bytes]
     _cache_is_clear: bool
+    _attribute_index: Dict[str, Set[RecordPath]]
+    _read_paths: Optional[Set[RecordPath]]
 
     _Dict: ClassVar[Type[Dict]] = OrderedDict
+    _DerivedRecord: ClassVar[Type[DerivedRecord]] = OrderedDerivedRecord
     _Path: ClassVar[Type[RecordPath]] = RecordPath
     name_regex: ClassVar[Pattern] = re.compile(r'(?!\$).+')
     ordering_keyfunc: ClassVar[KeyFunc] = natural_keyfunc
@@ -206,11 +424,47 @@ class Records:
     def __init__(self) -> None:
         self._records = self._Dict()
         self._records_cache = {}
+        self._child_names_cache = {}
+        self._digest_cache = {}
+        self._fingerprint_cache = {}
         self._cache_is_clear = True
+        self._attribute_index = {}
+        self._read_paths = None
 
-    def _clear_cache(self) -> None:
-        self._records_cache.clear()
-        self._cache_is_clear = True
+    def _clear_cache(self, path: Optional[RecordPath] = None) -> None:
+        """
+        Drop cached records that may be affected by a change at path.
+
+        These are the records of path and its descendants, and also
+        records of its ancestors (their sets of children may change).
+        If path is None, drop all cached records.
+
+        Subclasses maintaining their own caches should extend this.
+        """
+        if path is None or path.is_root():
+            self._records_cache.clear()
+            self._child_names_cache.clear()
+            self._digest_cache.clear()
+            self._fingerprint_cache.clear()
+            self._cache_is_clear = True
+            return
+        ancestry = frozenset(path.parent.ancestry)
+        parts = path.parts
+        depth = len(parts)
+        caches: Tuple[Dict[Tuple[RecordPath, bool], Any], ...] = (
+            self._records_cache, self._child_names_cache, self._digest_cache )
+        for cache in caches:
+            stale_keys = [
+                key for key in cache
+                if key[0] in ancestry or key[0].parts[:depth] == parts ]
+            for key in stale_keys:
+                del cache[key]
+        fingerprint_cache = self._fingerprint_cache
+        for stale_path in [
+                cached_path for cached_path in fingerprint_cache
+                if cached_path in ancestry or
+                    cached_path.parts[:depth] == parts ]:
+            del fingerprint_cache[stale_path]
 
     def absorb( self, data: Record, path: RecordPath = None,
         *, overwrite: bool = True
@@ -225,7 +479,7 @@ class Records:
         self._absorb_into( data, self._Path(), self._records,
             overwrite=overwrite )
         if not self._cache_is_clear:
-            self._clear_cache()
+            self._clear_cache(path)
 
     def _absorb_into( self, data: Record,
         path: RecordPath, record: Record, *, overwrite: bool = True
@@ -268,6 +522,8 @@ class Records:
     ) -> None:
         if overwrite or key not in record:
             record[key] = value
+            self._attribute_index.setdefault(
+                self._get_attribute_stem(key), set() ).add(path)
         else:
             pass # discard value
 
@@ -286,7 +542,7 @@ class Records:
             raise TypeError(type(path))
         self._clear_record(path)
         if not self._cache_is_clear:
-            self._clear_cache()
+            self._clear_cache(path)
 
     def delete(self, path: RecordPath) -> None:
         if not isinstance(path, self._Path):
@@ -295,7 +551,7 @@ class Records:
             raise RuntimeError("Deleting root is impossible")
         self._delete_record(path)
         if not self._cache_is_clear:
-            self._clear_cache()
+            self._clear_cache(path)
 
     def _clear_record( self, path: RecordPath,
         record: Optional[Record]=None
@@ -305,9 +561,73 @@ class Records:
         while record:
             key, subrecord = record.popitem()
             if key.startswith('$'):
+                self._unindex_attribute(key, path)
                 continue
             self._delete_record(path/key, popped_record=subrecord)
 
+    def _unindex_attribute(self, key: str, path: RecordPath) -> None:
+        stem = self._get_attribute_stem(key)
+        stem_paths = self._attribute_index.get(stem)
+        if stem_paths is None:
+            return
+        stem_paths.discard(path)
+        if not stem_paths:
+            del self._attribute_index[stem]
+
+    def _load_records( self, records: Record,
+        attribute_index: Optional[Dict[str, Set[RecordPath]]] = None,
+    ) -> None:
+        """
+        Replace records with trusted ones (no validation).
+
+        If attribute_index is not given, it is rebuilt from records.
+        """
+        self.clear()
+        self._records = records
+        if attribute_index is None:
+            self._index_attributes(self._Path(), records)
+        else:
+            self._attribute_index = attribute_index
+
+    def _index_attributes(self, path: RecordPath, record: Record) -> None:
+        """Index attributes of record and its subrecords."""
+        attribute_index = self._attribute_index
+        for key, value in record.items():
+            if key.startswith('$'):
+                attribute_index.setdefault(
+                    self._get_attribute_stem(key), set() ).add(path)
+            else:
+                self._index_attributes(path/key, value)
+
+    @classmethod
+    def _get_attribute_stem(cls, key: str) -> str:
+        """Return the part of attribute key, by which it is indexed."""
+        return key
+
+    def query( self, *stems: str, path: Optional[RecordPath] = None,
+    ) -> List[RecordPath]:
+        """
+        Return paths of records having attributes with all given stems.
+
+        Only attributes of original records are considered, not those
+        set by derivation.  If path is given, only path and its
+        descendants are returned.  Paths are sorted.
+        """
+        if not stems:
+            raise ValueError("At least one attribute stem is required")
+        stem_path_sets = sorted(
+            ( self._attribute_index.get(stem, frozenset())
+                for stem in stems ),
+            key=len )
+        found = set(stem_path_sets[0]).intersection(*stem_path_sets[1:])
+        if path is not None and not path.is_root():
+            parts = path.parts
+            depth = len(parts)
+            found = {
+                found_path for found_path in found
+                if found_path.parts[:depth] == parts }
+        return sorted(found)
+
     def _delete_record( self, path: RecordPath,
         parent_record: Optional[Record] = None,
         popped_record: Optional[Record] = None,
@@ -324,6 +644,8 @@ class Records:
     def get(self, path: RecordPath, *, original: bool = False) -> Record:
         if not isinstance(path, self._Path):
             raise TypeError(type(path))
+        if self._read_paths is not None:
+            self._read_paths.add(path)
         with suppress(KeyError):
             return self._records_cache[path, original]
 
@@ -348,8 +670,10 @@ class Records:
     def _get_root(self, original: bool = False) -> Record:
         record = self._records
         if not original:
-            record = record.copy()
-            self._derive_record({}, record, path=RecordPath())
+            derived_record = self._DerivedRecord(record)
+            self._derive_record({}, derived_record, path=RecordPath())
+            derived_record.freeze()
+            record = derived_record
         return record
 
     def _get_child( self, parent_record: Record, path: RecordPath,
@@ -361,10 +685,12 @@ class Records:
             child_record = parent_record[name]
         except KeyError:
             raise RecordNotFoundError from None
-        assert isinstance(child_record, dict), child_record
+        assert isinstance(child_record, (dict, DerivedRecord)), child_record
         if not original:
-            child_record = child_record.copy()
-            self._derive_record(parent_record, child_record, path)
+            derived_record = self._DerivedRecord(child_record)
+            self._derive_record(parent_record, derived_record, path)
+            derived_record.freeze()
+            child_record = derived_record
         return child_record
 
     # pylint: disable=unused-argument
@@ -377,24 +703,141 @@ class Records:
     def items( self, path: Optional[RecordPath] = None
     ) -> Iterable[Tuple[RecordPath, Record]]:
         """Yield (path, record) pairs."""
+        return self.walk(path)
+
+    def walk( self, path: Optional[RecordPath] = None,
+        *, original: bool = False
+    ) -> Iterable[Tuple[RecordPath, Record]]:
+        """
+        Yield (path, record) pairs for path and all its descendants.
+
+        Each record is derived directly from its already yielded parent,
+        so the subtree is materialized in one pass.
+        """
         if path is None:
             path = self._Path()
-        record = self.get(path)
+        yield from self._walk(path, self.get(path, original=original),
+            original=original )
+
+    def _walk( self, path: RecordPath, record: Record,
+        *, original: bool
+    ) -> Iterable[Tuple[RecordPath, Record]]:
         yield path, record
-        assert all(isinstance(key, str) for key in record)
-        for key in mapping_ordered_keys( record,
-                keyfunc=type(self).ordering_keyfunc ):
-            if key.startswith('$'):
+        records_cache = self._records_cache
+        read_paths = self._read_paths
+        for key in self._get_child_names(path, record, original=original):
+            child_path = path/key
+            if read_paths is not None:
+                read_paths.add(child_path)
+            try:
+                child_record = records_cache[child_path, original]
+            except KeyError:
+                child_record = self._get_child( record, child_path,
+                    original=original )
+                records_cache[child_path, original] = child_record
+                self._cache_is_clear = False
+            yield from self._walk(child_path, child_record, original=original)
+
+    def _get_child_names( self, path: RecordPath, record: Record,
+        *, original: bool
+    ) -> List[Name]:
+        """
+        Return names of children of record, in order.
+
+        The order is cached along with the record itself.
+        """
+        try:
+            return self._child_names_cache[path, original]
+        except KeyError:
+            pass
+        child_names = [
+            key for key in mapping_ordered_keys( record,
+                keyfunc=type(self).ordering_keyfunc )
+            if not key.startswith('$') ]
+        self._child_names_cache[path, original] = child_names
+        self._cache_is_clear = False
+        return child_names
+
+    def digest( self, path: Optional[RecordPath] = None,
+        *, original: bool = False
+    ) -> bytes:
+        """
+        Return content hash of the subtree at path.
+
+        The hash covers attributes of the record (in their order) and
+        digests of its children, and is cached until the subtree or any
+        of its ancestors change.  Equal digests mean equal subtrees.
+        Attribute values are hashed through their repr().
+        """
+        if path is None:
+            path = self._Path()
+        try:
+            return self._digest_cache[path, original]
+        except KeyError:
+            pass
+        record = self.get(path, original=original)
+        hasher = hashlib.sha256()
+        for key, value in record.items():
+            if not key.startswith('$'):
                 continue
-            yield from self.items(path=path/key)
+            hasher.update(repr((key, value)).encode())
+        for key in self._get_child_names(path, record, original=original):
+            hasher.update(repr(key).encode())
+            hasher.update(self.digest(path/key, original=original))
+        digest = self._digest_cache[path, original] = hasher.digest()
+        self._cache_is_clear = False
+        return digest
+
+    def fingerprint(self, path: RecordPath) -> bytes:
+        """
+        Return hash of the original record at path, excluding subrecords.
+
+        The hash covers attributes of the record and names of its
+        children (but not their content), and is cached until the record
+        changes.  Absent record has empty hash.
+        """
+        try:
+            return self._fingerprint_cache[path]
+        except KeyError:
+            pass
+        try:
+            record = self.get(path, original=True)
+        except RecordNotFoundError:
+            return b''
+        hasher = hashlib.sha256()
+        for key, value in record.items():
+            if key.startswith('$'):
+                hasher.update(repr((key, value)).encode())
+            else:
+                hasher.update(repr(key).encode())
+        fingerprint = self._fingerprint_cache[path] = hasher.digest()
+        self._cache_is_clear = False
+        return fingerprint
+
+    @contextmanager
+    def tracking_reads(self) -> Iterator[Set[RecordPath]]:
+        """
+        Return a context manager collecting paths of records read.
+
+        The yielded set is filled with paths passed to get() and paths
+        produced by walk() while the context is active.  Nested contexts
+        propagate their paths to the outer ones.
+        """
+        outer_read_paths = self._read_paths
+        read_paths: Set[RecordPath] = set()
+        self._read_paths = read_paths
+        try:
+            yield read_paths
+        finally:
+            self._read_paths = outer_read_paths
+            if outer_read_paths is not None:
+                outer_read_paths.update(read_paths)
 
     # pylint: disable=unused-variable
 
     def paths(self, path: RecordPath=None) -> Iterable[RecordPath]:
         """Yield paths."""
-        if path is None:
-            path = self._Path()
-        for subpath, subrecord in self.items(path=path):
+        for subpath, subrecord in self.walk(path):
             yield subpath
 
     # pylint: enable=unused-variable
@@ -412,15 +855,23 @@ class Records:
     @classmethod
     def compare_items( cls, records1: 'Records', records2: 'Records',
         path: Optional[RecordPath] = None,
-        *, original: bool = False
+        *, original: bool = False, skip_equal: bool = False
     ) -> Iterable[Tuple[RecordPath, Optional[Record], Optional[Record]]]:
         """
         Yield (path, record1, record2) triples.
+
+        If skip_equal is set, subtrees with equal digests are skipped
+        altogether (including their roots).
         """
         if path is None:
             _path = cls._Path()
         else:
             _path = path
+        if skip_equal:
+            with suppress(RecordNotFoundError):
+                if ( records1.digest(_path, original=original) ==
+                        records2.digest(_path, original=original) ):
+                    return
 
         def maybe_get_record_and_keys( records: 'Records',
         ) -> Tuple[Optional[Record], Sequence[str]]:
@@ -432,8 +883,10 @@ class Records:
                 record = None
                 keys = ()
             else:
-                keys = mapping_ordered_keys( record,
-                    keyfunc=type(records).ordering_keyfunc )
+                # pylint: disable=protected-access
+                keys = records._get_child_names( _path, record,
+                    original=original )
+                # pylint: enable=protected-access
             return record, keys
 
         record1, keys1 = maybe_get_record_and_keys(records1)
@@ -442,9 +895,7 @@ class Records:
         yield _path, record1, record2
 
         for key in unique(keys1, keys2):
-            if key.startswith('$'):
-                continue
             yield from cls.compare_items(records1, records2, _path/key,
-                original=original )
+                original=original, skip_equal=skip_equal )
 
 
@@ -63,7 +63,7 @@ done
 if [[ $COMP_CWORD == $inspected_index ]];
 then
     COMPREPLY=( $(compgen \
-        -W 'build buildline review init list spell makefile excerpt clean' \
+        -W 'build buildline review init list query spell makefile excerpt clean' \
         -- $inspected) )
     return 0
 fi
@@ -108,7 +108,7 @@ fi
 # By that time, we must have found a $jeolm_root
 
 local targets_cache=$jeolm_root/build/targets.cache.list
-local metadata_cache=$jeolm_root/build/metadata.cache.pickle
+local metadata_cache=$jeolm_root/build/metadata.cache
 
 if [[ "$targets_cache" -ot "$metadata_cache" ]];
 then
@@ -0,0 +1,115 @@
+"""
+Compare interpreted and compiled evaluation of flag conditions.
+
+Usage:
+    python -m jeolm.scripts.benchmark_conditions [--items N] [--targets M]
+
+A large list of content-like items with random nested conditions is
+evaluated against flag containers of many targets: by straightforward
+interpretation of conditions, and by FlagContainer.check_condition()
+(with cold and warm cache of compiled conditions). Results and utilized
+flags are checked to be equal.
+"""
+
+import argparse
+import random
+import time
+
+import jeolm.target
+from jeolm.target import FlagContainer, FlagError
+
+
+def interpret_condition(flags, condition):
+    if isinstance(condition, bool):
+        return condition
+    elif isinstance(condition, str):
+        return condition in flags
+    elif isinstance(condition, list):
+        return all(interpret_condition(flags, item) for item in condition)
+    elif isinstance(condition, dict):
+        if len(condition) > 1:
+            raise FlagError('Condition, if a dict, must be of length 1')
+        (key, value), = condition.items()
+        if key == 'or':
+            if not isinstance(value, list):
+                raise FlagError("'or' condition value must be a list")
+            return any(interpret_condition(flags, item) for item in value)
+        elif key == 'and':
+            if not isinstance(value, list):
+                raise FlagError("'and' condition value must be a list")
+            return all(interpret_condition(flags, item) for item in value)
+        elif key == 'not':
+            return not interpret_condition(flags, value)
+        else:
+            raise FlagError(
+                "Condition, if a dict, must have key 'not' or 'or'" )
+    else:
+        raise FlagError(type(condition))
+
+def random_condition(rng, vocabulary, depth=0):
+    choice = rng.random()
+    if depth >= 3 or choice < 0.4:
+        flag = rng.choice(vocabulary)
+        return flag if rng.random() < 0.8 else '-' + flag
+    elif choice < 0.6:
+        return {'not': random_condition(rng, vocabulary, depth+1)}
+    elif choice < 0.8:
+        return { rng.choice(('or', 'and')): [
+            random_condition(rng, vocabulary, depth+1)
+            for _ in range(rng.randint(2, 4)) ] }
+    else:
+        return [ random_condition(rng, vocabulary, depth+1)
+            for _ in range(rng.randint(1, 3)) ]
+
+def evaluate(check, containers, conditions):
+    results = []
+    for flags in containers:
+        results.append([check(flags, condition) for condition in conditions])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--targets', type=int, default=200)
+    parser.add_argument('--flags', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = ['flag{}'.format(index) for index in range(args.flags)]
+    conditions = [ random_condition(rng, vocabulary)
+        for _ in range(args.items) ]
+    flag_sets = [ rng.sample(vocabulary, rng.randint(1, 8))
+        for _ in range(args.targets) ]
+    print( "{} conditions, {} targets"
+        .format(len(conditions), len(flag_sets)) )
+
+    def make_containers():
+        return [ FlagContainer(flags, origin='benchmark')
+            for flags in flag_sets ]
+
+    # pylint: disable=protected-access
+    jeolm.target._compiled_conditions.clear()
+    # pylint: enable=protected-access
+    timings = []
+    reference = None
+    reference_utilized = None
+    for name, check in [
+        ('interpreted', interpret_condition),
+        ('compiled (cold)', FlagContainer.check_condition),
+        ('compiled (warm)', FlagContainer.check_condition),
+    ]:
+        containers = make_containers()
+        start = time.perf_counter()
+        results = evaluate(check, containers, conditions)
+        timings.append((name, time.perf_counter() - start))
+        utilized = [flags.utilized_flags for flags in containers]
+        if reference is None:
+            reference, reference_utilized = results, utilized
+        elif results != reference or utilized != reference_utilized:
+            print("{}: results differ from interpretation".format(name))
+    for name, elapsed in timings:
+        print("{:<16} {:9.4f} s".format(name, elapsed))
+
+if __name__ == '__main__':
+    main()
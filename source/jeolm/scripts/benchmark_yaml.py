@@ -0,0 +1,95 @@
+"""
+Compare YAML loaders on metadata of a jeolm project.
+
+Usage (from the project root):
+    python -m jeolm.scripts.benchmark_yaml [--repeat N]
+
+All YAML files of the source directory and all metadata pieces embedded
+in TeX sources are loaded with pure-Python JeolmLoader, libyaml-based
+CJeolmLoader (if available) and through LoadCache (warm). Results of the
+loaders are checked to be equal.
+"""
+
+import argparse
+import time
+import io
+from pathlib import Path, PurePosixPath
+
+import jeolm.yaml
+
+
+def collect_documents(project):
+    metadata = project.metadata_class(project=project)
+    documents = []
+    for path in sorted(project.source_dir.rglob('*')):
+        if not path.is_file():
+            continue
+        source_path = PurePosixPath(path.relative_to(project.source_dir))
+        if path.suffix == '.yaml':
+            documents.append((source_path, path.read_text(encoding='utf-8')))
+        elif path.suffix in {'.tex', '.dtx'}:
+            # pylint: disable=protected-access
+            metadata_pieces = metadata._scan_tex_content(
+                path.read_text(encoding='utf-8') )[-1]
+            if metadata_pieces:
+                documents.append((source_path, ''.join(
+                    metadata._tex_piece_as_item(piece)
+                    for extend, piece in metadata_pieces )))
+            # pylint: enable=protected-access
+    return documents
+
+def time_loading(load, documents, *, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for source_path, text in documents:
+            load(source_path, text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def loader_load(loader_class):
+    def load(source_path, text):
+        stream = io.StringIO(text)
+        stream.name = str(source_path)
+        return jeolm.yaml.load(stream, Loader=loader_class)
+    return load
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from jeolm.project import Project
+    project = Project(root=Path.cwd())
+    documents = collect_documents(project)
+    total_size = sum(len(text) for source_path, text in documents)
+    print( "{} documents, {} characters"
+        .format(len(documents), total_size) )
+
+    loaders = [('JeolmLoader', jeolm.yaml.JeolmLoader)]
+    if jeolm.yaml.CJeolmLoader is not None:
+        loaders.append(('CJeolmLoader', jeolm.yaml.CJeolmLoader))
+    else:
+        print("CJeolmLoader: unavailable (PyYAML is built without libyaml)")
+    reference = None
+    for loader_name, loader_class in loaders:
+        load = loader_load(loader_class)
+        results = [load(*document) for document in documents]
+        if reference is None:
+            reference = results
+        elif results != reference:
+            print("{}: results differ from JeolmLoader".format(loader_name))
+        elapsed = time_loading(load, documents, repeat=args.repeat)
+        print("{:<16} {:9.4f} s".format(loader_name, elapsed))
+
+    cache = jeolm.yaml.LoadCache()
+    def cache_load(source_path, text):
+        return cache.load(text, name=str(source_path))
+    for document in documents:
+        cache_load(*document)
+    elapsed = time_loading(cache_load, documents, repeat=args.repeat)
+    print("{:<16} {:9.4f} s".format('LoadCache (warm)', elapsed))
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from functools import partial, wraps
 from collections.abc import Container
+import sys
 import re
 import traceback
 
@@ -75,43 +76,280 @@ class UnutilizedFlagError(FlagError):
         super().__init__(message)
 
 
+class FlagTable:
+    """
+    Table of all flags seen (in the process), assigning a bit to each.
+
+    Sets of flags are represented by integers with the corresponding
+    bits set.  Sets of flags constructed back from integers are interned.
+    """
+
+    _bits: Dict[str, int]
+    _flags: List[Flag]
+    _frozensets: Dict[int, FrozenSet[Flag]]
+    _relative_bits: Dict[FrozenSet[str], Tuple[int, int]]
+
+    def __init__(self) -> None:
+        self._bits = {}
+        self._flags = []
+        self._frozensets = {0: frozenset()}
+        self._relative_bits = {}
+
+    def bit(self, flag: Flag) -> int:
+        """Return the bit of flag, assigning one if necessary."""
+        try:
+            return self._bits[flag]
+        except KeyError:
+            pass
+        bit = self._bits[flag] = 1 << len(self._flags)
+        self._flags.append(flag)
+        return bit
+
+    def find_bit(self, flag: str) -> int:
+        """Return the bit of flag, or zero if the flag was never seen."""
+        return self._bits.get(flag, 0)
+
+    def bits(self, flags: Iterable[Flag]) -> int:
+        bits = 0
+        for flag in flags:
+            bits |= self.bit(flag)
+        return bits
+
+    def flag(self, bit: int) -> Flag:
+        """Return the flag of a single bit."""
+        return self._flags[bit.bit_length() - 1]
+
+    def to_frozenset(self, bits: int) -> FrozenSet[Flag]:
+        try:
+            return self._frozensets[bits]
+        except KeyError:
+            pass
+        flags = self._frozensets[bits] = frozenset(
+            flag for index, flag in enumerate(self._flags)
+            if bits >> index & 1 )
+        return flags
+
+    def relative_bits(self, flags: Iterable[str]) -> Tuple[int, int]:
+        """
+        Return bits of positive flags and of negated flags.
+
+        Results are cached for frozensets.
+        """
+        if isinstance(flags, frozenset):
+            try:
+                return self._relative_bits[flags]
+            except KeyError:
+                pass
+        positive = negative = 0
+        for flag in flags:
+            if not flag.startswith('-'):
+                positive |= self.bit(Flag(flag))
+                continue
+            anti_flag = flag[1:]
+            if anti_flag.startswith('-'):
+                raise FlagError(flag)
+            negative |= self.bit(Flag(anti_flag))
+        if isinstance(flags, frozenset):
+            self._relative_bits[flags] = (positive, negative)
+        return positive, negative
+
+flag_table = FlagTable()
+
+
+# pylint: disable=invalid-name
+ConditionPredicate = Callable[['FlagContainer'], bool]
+# pylint: enable=invalid-name
+
+# compiled conditions, keyed by id() of condition (which is kept alive)
+_compiled_conditions: Dict[int, Tuple[Any, ConditionPredicate]] = {}
+_compiled_conditions_limit = 4096
+
+def get_compiled_condition(condition: Any) -> ConditionPredicate:
+    """
+    Return predicate equivalent to FlagContainer.check_condition().
+
+    Predicates are cached by identity of condition, so condition must
+    not be modified afterwards (which holds for records).
+    """
+    try:
+        cached_condition, predicate = _compiled_conditions[id(condition)]
+    except KeyError:
+        pass
+    else:
+        if cached_condition is condition:
+            return predicate
+    predicate = compile_condition(condition)
+    if len(_compiled_conditions) >= _compiled_conditions_limit:
+        _compiled_conditions.clear()
+    _compiled_conditions[id(condition)] = (condition, predicate)
+    return predicate
+
+def compile_condition(condition: Any) -> ConditionPredicate:
+    """
+    Compile condition into a predicate on flag containers.
+
+    Flags are checked (and utilized) in the same order and with the same
+    short-circuiting as by the interpretation of condition.  Items of
+    'and' and 'or' lists are compiled only when first reached, so that
+    malformed parts raise errors only when reached.
+    """
+    if isinstance(condition, bool):
+        return lambda flags: condition
+    elif isinstance(condition, str):
+        return _compile_flag(condition)
+    elif isinstance(condition, list):
+        return _compile_all(condition)
+    elif isinstance(condition, dict):
+        if len(condition) > 1:
+            return _compile_error(
+                'Condition, if a dict, must be of length 1' )
+        (key, value), = condition.items()
+        if key == 'or':
+            if not isinstance(value, list):
+                return _compile_error("'or' condition value must be a list")
+            return _compile_any(value)
+        elif key == 'and':
+            if not isinstance(value, list):
+                return _compile_error(
+                    "'and' condition value must be a list" )
+            return _compile_all(value)
+        elif key == 'not':
+            predicate = compile_condition(value)
+            return lambda flags: not predicate(flags)
+        else:
+            return _compile_error(
+                "Condition, if a dict, must have key 'not' or 'or'" )
+    else:
+        return _compile_error(type(condition))
+
+# pylint: disable=protected-access
+
+def _compile_flag(condition: str) -> ConditionPredicate:
+    # same as FlagContainer._contains_indefinite(), but parsed once
+    if not condition.startswith('-'):
+        flag = Flag(condition)
+        return lambda flags: flags._contains(flag)
+    anti_flag = Flag(condition[1:])
+    if anti_flag.startswith('-'):
+        return _compile_error(condition)
+    return lambda flags: not flags._contains(anti_flag)
+
+# pylint: enable=protected-access
+
+def _compile_all(conditions: List[Any]) -> ConditionPredicate:
+    if len(conditions) == 1:
+        return compile_condition(conditions[0])
+    predicates: List[Optional[ConditionPredicate]] = [None] * len(conditions)
+    def predicate_all(flags: 'FlagContainer') -> bool:
+        for index, predicate in enumerate(predicates):
+            if predicate is None:
+                predicate = predicates[index] = \
+                    compile_condition(conditions[index])
+            if not predicate(flags):
+                return False
+        return True
+    return predicate_all
+
+def _compile_any(conditions: List[Any]) -> ConditionPredicate:
+    if len(conditions) == 1:
+        return compile_condition(conditions[0])
+    predicates: List[Optional[ConditionPredicate]] = [None] * len(conditions)
+    def predicate_any(flags: 'FlagContainer') -> bool:
+        for index, predicate in enumerate(predicates):
+            if predicate is None:
+                predicate = predicates[index] = \
+                    compile_condition(conditions[index])
+            if predicate(flags):
+                return True
+        return False
+    return predicate_any
+
+def _compile_error(message: Any) -> ConditionPredicate:
+    def predicate(flags: 'FlagContainer') -> bool:
+        raise FlagError(message)
+    return predicate
+
+
+def _extract_stack(frame: Any) -> List[Tuple[str, int, str]]:
+    """Return (filename, lineno, name) of frames, outermost first."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
 class FlagContainer(Container):
     """
     An immutable set-like container, which tracks usage of its elements.
+
+    Flags are also kept as bits of flag_table, so that queries without
+    utilization and set operations are cheap.
     """
 
     flags: FrozenSet[Flag]
 
     utilized_flags: Set[Flag]
     children: List['FlagContainer']
-    origin: str
-    _as_frozenset: Optional[FrozenSet[Flag]]
-    _contains_cache: Dict[Tuple[Flag, bool], bool]
+    _origin: Optional[str]
+    _origin_stack: Optional[List[Tuple[str, int, str]]]
+    _bits: int
+    _as_bits: Optional[int]
+    _contains_cache: Dict[Flag, bool]
 
     def __init__( self, iterable: Iterable[Flag] = (),
         *, origin: Optional[str] = None,
     ) -> None:
         super().__init__()
-        self.flags = flags = frozenset(iterable)
+        flags = frozenset(iterable)
         if any(flag.startswith('-') for flag in flags):
             raise ValueError(flags)
-        self._as_frozenset = None
+        self._bits = bits = flag_table.bits(flags)
+        self.flags = flag_table.to_frozenset(bits)
+        self._as_bits = None
         self._contains_cache = dict()
         self.utilized_flags = set()
         self.children = []
+        self._origin = origin
         if origin is None:
-            self.origin = ( '(traceback):\n' +
-                ''.join(traceback.format_stack()) )
+            # formatted only if the origin is reported
+            self._origin_stack = _extract_stack(sys._getframe(1))
         else:
-            self.origin = origin
+            self._origin_stack = None
+
+    @property
+    def origin(self) -> str:
+        if self._origin is None:
+            assert self._origin_stack is not None
+            # source lines are looked up while formatting
+            self._origin = ( '(traceback):\n' + ''.join(
+                traceback.format_list([
+                    (filename, lineno, name, None)
+                    for filename, lineno, name in self._origin_stack ])
+            ))
+            self._origin_stack = None
+        return self._origin
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # bits are only meaningful with the flag table of this process
+        state = self.__dict__.copy()
+        del state['_bits']
+        state['_as_bits'] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._bits = flag_table.bits(self.flags)
 
     def __hash__(self) -> Any:
-        return hash(self.as_frozenset)
+        return hash(self.as_bits)
 
     def __eq__(self, other: Any) -> bool:
         if not isinstance(other, FlagContainer):
             return NotImplemented
-        return self.as_frozenset == other.as_frozenset
+        return self.as_bits == other.as_bits
 
     def __contains__(self, flag: Any) -> bool:
         if not isinstance(flag, str):
@@ -128,12 +366,13 @@ class FlagContainer(Container):
             return not self._contains(Flag(anti_flag), utilize=utilize)
 
     def _contains(self, flag: Flag, *, utilize: bool = True) -> bool:
-        key = (flag, utilize)
+        if not utilize:
+            return bool(self.as_bits & flag_table.find_bit(flag))
         try:
-            return self._contains_cache[key]
+            return self._contains_cache[flag]
         except KeyError:
             pass
-        answer = self._contains_cache[key] = \
+        answer = self._contains_cache[flag] = \
             self._contains_compute(flag, utilize=utilize)
         return answer
 
@@ -151,6 +390,10 @@ class FlagContainer(Container):
 
     def issuperset( self, iterable: Iterable[Flag], utilize: bool = True
     ) -> bool:
+        if not utilize:
+            positive, negative = flag_table.relative_bits(iterable)
+            bits = self.as_bits
+            return not (positive & ~bits or negative & bits)
         contains = partial(self._contains_indefinite, utilize=utilize)
         return all([contains(flag) for flag in iterable])
 
@@ -159,6 +402,24 @@ class FlagContainer(Container):
         contains = partial(self._contains_indefinite, utilize=utilize)
         return {flag for flag in iterable if contains(flag)}
 
+    def _single_missing_flag( self, flagset: FrozenSet[Flag]
+    ) -> Optional[str]:
+        """
+        Return the only (relative) flag of flagset that does not hold,
+        or None if there are several.  Flags are not utilized.
+        """
+        positive, negative = flag_table.relative_bits(flagset)
+        bits = self.as_bits
+        missing_positive = positive & ~bits
+        missing_negative = negative & bits
+        missing = missing_positive | missing_negative
+        if missing & (missing - 1):
+            return None
+        if missing_positive:
+            return flag_table.flag(missing_positive)
+        else:
+            return '-' + flag_table.flag(missing_negative)
+
     def utilize(self, flag: Flag) -> None:
         """
         Ensure that flag is present in the container and utilized.
@@ -180,62 +441,49 @@ class FlagContainer(Container):
         for flag in iterable:
             self.utilize_missing(flag)
 
+    @property
+    def as_bits(self) -> int:
+        as_bits = self._as_bits
+        if as_bits is None:
+            as_bits = self._as_bits = self.reconstruct_as_bits()
+        return as_bits
+
     @property
     def as_frozenset(self) -> FrozenSet[Flag]:
-        as_frozenset = self._as_frozenset
-        if as_frozenset is None:
-            as_frozenset = self._as_frozenset = \
-                self.reconstruct_as_frozenset()
-        return as_frozenset
+        return flag_table.to_frozenset(self.as_bits)
 
     #@property
     #def as_set(self):
     #    return set(self.as_frozenset)
 
-    def reconstruct_as_frozenset(self) -> FrozenSet[Flag]:
-        return self.flags
+    def reconstruct_as_bits(self) -> int:
+        return self._bits
 
     def check_condition(self, condition: Any) -> bool:
+        """
+        Evaluate condition, utilizing the flags it checks.
+
+        Compound conditions are compiled once per condition object.
+        """
         if isinstance(condition, bool):
             return condition
         elif isinstance(condition, str):
             return condition in self
-        elif isinstance(condition, list):
-            return all(self.check_condition(item) for item in condition)
-        elif isinstance(condition, dict):
-            if len(condition) > 1:
-                raise FlagError('Condition, if a dict, must be of length 1')
-            (key, value), = condition.items()
-            if key == 'or':
-                if not isinstance(value, list):
-                    raise FlagError("'or' condition value must be a list")
-                return any(self.check_condition(item) for item in value)
-            elif key == 'and':
-                if not isinstance(value, list):
-                    raise FlagError("'and' condition value must be a list")
-                return all(self.check_condition(item) for item in value)
-            elif key == 'not':
-                return not self.check_condition(value)
-            else:
-                raise FlagError(
-                    "Condition, if a dict, must have key 'not' or 'or'" )
         else:
-            raise FlagError(type(condition))
+            return get_compiled_condition(condition)(self)
 
     def select_matching_value( self,
         flagset_mapping: Mapping[FrozenSet[Flag], T]
     ) -> T:
         issuperset = partial(self.issuperset, utilize=False)
-        intersection = partial(self.intersection, utilize=False)
         matched_items: Dict[FrozenSet[Flag], Any] = dict()
         for flagset, value in flagset_mapping.items():
             if not isinstance(flagset, frozenset):
                 raise RuntimeError(type(flagset))
             if not issuperset(flagset):
-                missing_flags = flagset - intersection(flagset)
-                if len(missing_flags) < 2:
-                    missing_flag, = missing_flags
-                    self.utilize_missing(missing_flag)
+                missing_flag = self._single_missing_flag(flagset)
+                if missing_flag is not None:
+                    self.utilize_missing(Flag(missing_flag))
                 continue
             lesser_flagsets = { other_flagset
                 for other_flagset in matched_items
@@ -440,8 +688,8 @@ class PositiveFlagContainer(ChildFlagContainer):
 
     # pylint: enable=protected-access
 
-    def reconstruct_as_frozenset(self) -> FrozenSet[Flag]:
-        return self.parent.as_frozenset.union(self.flags)
+    def reconstruct_as_bits(self) -> int:
+        return self.parent.as_bits | self._bits
 
 class NegativeFlagContainer(ChildFlagContainer):
     constructor_name = 'difference'
@@ -464,8 +712,8 @@ class NegativeFlagContainer(ChildFlagContainer):
     def unutilized_flags(self) -> Set[str]:
         return {'-' + flag for flag in self.flags - self.utilized_flags}
 
-    def reconstruct_as_frozenset(self) -> FrozenSet[Flag]:
-        return self.parent.as_frozenset.difference(self.flags)
+    def reconstruct_as_bits(self) -> int:
+        return self.parent.as_bits & ~self._bits
 
 
 class TargetError(Exception):
@@ -0,0 +1,23 @@
+import os
+from pathlib import PosixPath
+
+def write_atomically(path: PosixPath, data: bytes) -> None:
+    """
+    Replace contents of path with data.
+
+    Data is written to a temporary file, which is then renamed to path,
+    so that readers never see a partially written file.  The temporary
+    file is named after the process id, so that concurrent writers do
+    not share it.
+    """
+    new_path = path.with_name('.{}.{}.new'.format(path.name, os.getpid()))
+    try:
+        with new_path.open('wb') as new_file:
+            new_file.write(data)
+        new_path.rename(path)
+    except BaseException:
+        try:
+            new_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,32 @@
+import os
+import sys
+from types import ModuleType
+
+from typing import Any, Iterable, Tuple, List, Type
+
+def get_code_version( cls: Type[Any], modules: Iterable[ModuleType] = (),
+) -> Tuple[str, Tuple[Tuple[str, Any], ...]]:
+    """
+    Return key identifying the code of cls.
+
+    The key consists of the qualified name of cls, and size and
+    modification time of files of modules defining cls and its bases,
+    and of additional modules.  Cached results of cls should be
+    discarded when the key changes.
+    """
+    module_versions: List[Tuple[str, Any]] = []
+    all_modules = [
+        *(sys.modules.get(base.__module__) for base in cls.__mro__),
+        *modules ]
+    for module in all_modules:
+        module_file = getattr(module, '__file__', None)
+        if module_file is None:
+            continue
+        try:
+            stat = os.stat(module_file)
+        except OSError:
+            continue
+        module_versions.append(
+            (module_file, (stat.st_size, stat.st_mtime_ns)) )
+    return ( '{0.__module__}.{0.__qualname__}'.format(cls),
+        tuple(sorted(set(module_versions))) )
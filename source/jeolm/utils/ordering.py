@@ -1,5 +1,6 @@
 import re
 from collections import OrderedDict
+import collections.abc
 
 import logging
 logger = logging.getLogger(__name__)
@@ -34,8 +35,18 @@ def filename_keyfunc( string: str, *,
         return ( basename_keyfunc(string[:dot]),
             extension_keyfunc(string[dot+1:]) )
 
+class OrderedMapping(collections.abc.Mapping):
+    """
+    Abstract base class for mappings with meaningful order of keys.
+
+    Keys of such mappings are not sorted by mapping_ordered_keys().
+    """
+    __slots__ = ()
+
+OrderedMapping.register(OrderedDict)
+
 def mapping_is_ordered(mapping: Mapping) -> bool:
-    return isinstance(mapping, OrderedDict) or len(mapping) <= 1
+    return isinstance(mapping, OrderedMapping) or len(mapping) <= 1
 
 def mapping_ordered_keys( mapping: Mapping[str, Any],
     *, keyfunc: KeyFunc = natural_keyfunc
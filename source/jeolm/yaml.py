@@ -10,22 +10,35 @@ Features:
 
 Additionally, dump() enables unicode serializing by default.
 
+load() uses libyaml-based CJeolmLoader if PyYAML was built with libyaml,
+and pure-Python JeolmLoader otherwise; both construct the same values.
+LoadCache keeps loaded documents by their content hash.
+
 """
 
 from collections import OrderedDict
+import io
 import re
+import hashlib
+import pickle
 
 import yaml
+from yaml import YAMLError # pylint: disable=unused-import
 from yaml.nodes import SequenceNode, MappingNode
+try:
+    from yaml import CSafeLoader
+except ImportError:
+    CSafeLoader = None
 
 from jeolm.records import RecordPath
 from jeolm.date import Period
+from jeolm.utils.atomic_write import write_atomically
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-class JeolmLoader(yaml.loader.SafeLoader):
+class _JeolmConstructorMixin:
 
     def construct_yaml_omap(self, node):
         omap = OrderedDict()
@@ -63,22 +76,43 @@ class JeolmLoader(yaml.loader.SafeLoader):
     def construct_date(self, node):
         return Period.from_string(self.construct_scalar(node))
 
-JeolmLoader.add_constructor(
-    'tag:yaml.org,2002:omap',
-    JeolmLoader.construct_yaml_omap )
+class JeolmLoader(_JeolmConstructorMixin, yaml.loader.SafeLoader):
+    pass
+
+if CSafeLoader is not None:
+    class CJeolmLoader(_JeolmConstructorMixin, CSafeLoader):
+        pass
+    DefaultLoader = CJeolmLoader
+else:
+    CJeolmLoader = None
+    DefaultLoader = JeolmLoader
+
+def _setup_loader(loader_class):
+    loader_class.add_constructor(
+        'tag:yaml.org,2002:omap',
+        loader_class.construct_yaml_omap )
 
-JeolmLoader.add_constructor(
-    '!path',
-    JeolmLoader.construct_path )
+    loader_class.add_constructor(
+        '!path',
+        loader_class.construct_path )
 
-JeolmLoader.add_constructor(
-    '!period',
-    JeolmLoader.construct_date )
+    loader_class.add_constructor(
+        '!period',
+        loader_class.construct_date )
 
-JeolmLoader.add_implicit_resolver(
-    '!period',
-    re.compile(r'^(?:[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9][ \-]p[0-9]+)$'),
-    list('0123456789') )
+    loader_class.add_implicit_resolver(
+        '!period',
+        re.compile(
+            r'^(?:[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9][ \-]p[0-9]+)$' ),
+        list('0123456789') )
+
+for _loader_class in (JeolmLoader, CJeolmLoader):
+    if _loader_class is not None:
+        _setup_loader(_loader_class)
+
+# Must be increased on any change of constructors or resolvers above,
+# since values loaded by older versions are kept by LoadCache.
+LOADER_VERSION = 1
 
 class JeolmDumper(yaml.dumper.SafeDumper):
     def represent_OrderedDict(self, data):
@@ -103,7 +137,9 @@ JeolmDumper.add_representer( RecordPath,
 JeolmDumper.add_representer( Period,
         JeolmDumper.represent_Period )
 
-def load(stream, Loader=JeolmLoader):
+def load(stream, Loader=None):
+    if Loader is None:
+        Loader = DefaultLoader
     return yaml.load(stream, Loader=Loader)
 
 def dump(data, Dumper=JeolmDumper, allow_unicode=True, **kwargs):
@@ -111,3 +147,75 @@ def dump(data, Dumper=JeolmDumper, allow_unicode=True, **kwargs):
         Dumper=Dumper, allow_unicode=allow_unicode,
         **kwargs )
 
+
+class LoadCache:
+    """
+    Cache of loaded YAML documents, keyed by their content hash.
+
+    Values are kept pickled, so every load() returns a fresh copy that
+    the caller is free to modify.  If path is given, the cache is read
+    from it on first use and written back by save().  Cached values are
+    discarded if the loader (or its version) changes.
+    """
+
+    format_version = 2
+    loader_key = ( '{0.__module__}.{0.__qualname__}'.format(DefaultLoader),
+        LOADER_VERSION, yaml.__version__ )
+    max_entries = 1 << 14
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = None
+        self._modified = False
+
+    def load(self, text, *, name=None):
+        key = hashlib.sha256(text.encode()).digest()
+        entries = self._get_entries()
+        try:
+            pickled_value = entries[key]
+        except KeyError:
+            pass
+        else:
+            entries.move_to_end(key)
+            return pickle.loads(pickled_value)
+        stream = io.StringIO(text)
+        if name is not None:
+            stream.name = name
+        value = load(stream)
+        entries[key] = pickle.dumps(value)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self._modified = True
+        return value
+
+    def _get_entries(self):
+        if self._entries is None:
+            self._entries = self._read_entries()
+        return self._entries
+
+    def _read_entries(self):
+        if self.path is None:
+            return OrderedDict()
+        try:
+            with self.path.open('rb') as cache_file:
+                format_version, *content = pickle.load(cache_file)
+        except FileNotFoundError:
+            return OrderedDict()
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            logger.warning("YAML cache is corrupted, discarding it")
+            return OrderedDict()
+        if format_version != self.format_version:
+            # cache of older version has different content
+            return OrderedDict()
+        loader_key, entries = content
+        if loader_key != self.loader_key:
+            logger.debug("YAML loader changed, cache discarded")
+            return OrderedDict()
+        return entries
+
+    def save(self):
+        if self.path is None or not self._modified:
+            return
+        write_atomically( self.path, pickle.dumps(
+            (self.format_version, self.loader_key, self._entries) ))
+        self._modified = False
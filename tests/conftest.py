@@ -0,0 +1,32 @@
+import sys
+import shutil
+from pathlib import Path, PurePosixPath
+
+import pytest
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY / 'source'))
+
+EXAMPLE_PROJECT = REPOSITORY / 'test'
+
+
+@pytest.fixture
+def project(tmp_path):
+    """
+    Example project documents with the style resources, and metadata
+    reviewed.
+    """
+    import jeolm.project
+    root = tmp_path / 'project'
+    shutil.copytree( str(EXAMPLE_PROJECT / 'source' / 'test'),
+        str(root / 'source' / 'test') )
+    shutil.copy( str(EXAMPLE_PROJECT / 'source' / '_style.yaml'),
+        str(root / 'source') )
+    (root / '.jeolm').mkdir()
+    jeolm.project.InitProject(root, resources=['style'])
+    project = jeolm.project.Project(root=root)
+    metadata = project.metadata_class(project=project)
+    metadata.load_metadata_cache()
+    metadata.review(PurePosixPath('.'))
+    metadata.dump_metadata_cache()
+    return project
@@ -0,0 +1,135 @@
+import io
+import gzip
+import lzma
+import time
+import shutil
+import tarfile
+import hashlib
+import zipfile
+import subprocess
+from pathlib import PurePosixPath
+
+import pytest
+
+import jeolm.node
+import jeolm.node.archive
+from jeolm.node.updater import NodeUpdater
+
+
+def make_archive(tmp_path, contents):
+    source_dir = tmp_path / 'source'
+    source_dir.mkdir()
+    archive_node = jeolm.node.archive.ZipArchiveNode(tmp_path / 'a.zip')
+    source_nodes = {}
+    for name, content in contents.items():
+        path = source_dir / name
+        path.write_bytes(content)
+        source_nodes[name] = jeolm.node.SourceFileNode(path)
+    return archive_node, source_nodes
+
+def read_archive(archive_node):
+    with zipfile.ZipFile(str(archive_node.path)) as archive:
+        return {name: archive.read(name) for name in archive.namelist()}
+
+
+def test_known_digests_are_not_recomputed(tmp_path, monkeypatch):
+    archive_node, source_nodes = make_archive( tmp_path,
+        {'known': b'known content', 'unknown': b'unknown content'} )
+    known_digest = hashlib.sha256(b'known content').hexdigest()
+    archive_node.archive_add( PurePosixPath('known'), source_nodes['known'],
+        digest=known_digest )
+    archive_node.archive_add( PurePosixPath('unknown'),
+        source_nodes['unknown'] )
+    hashed_nodes = []
+    node_digest = jeolm.node.archive.node_digest
+    def recording_node_digest(node):
+        hashed_nodes.append(node)
+        return node_digest(node)
+    monkeypatch.setattr( jeolm.node.archive, 'node_digest',
+        recording_node_digest )
+    NodeUpdater(jobs=1).update(archive_node)
+    assert hashed_nodes == [source_nodes['unknown']]
+    assert read_archive(archive_node) == {
+        'known': b'known content', 'unknown': b'unknown content' }
+    assert archive_node.manifest_path.read_text().endswith(
+        f'{known_digest}  known\n'
+        f'{hashlib.sha256(b"unknown content").hexdigest()}  unknown\n' )
+
+
+ARCHIVE_NODE_CLASSES = [ jeolm.node.archive.ZipArchiveNode,
+    jeolm.node.archive.TgzArchiveNode, jeolm.node.archive.TarXzArchiveNode,
+    jeolm.node.archive.TarZstArchiveNode ]
+
+def build_archive(tmp_path, archive_node_class, contents):
+    source_dir = tmp_path / 'source'
+    source_dir.mkdir(exist_ok=True)
+    archive_node = archive_node_class(
+        tmp_path / f'a{archive_node_class.default_suffix}' )
+    for name, content in sorted(contents.items()):
+        path = source_dir / name
+        path.write_bytes(content)
+        archive_node.archive_add( PurePosixPath(name),
+            jeolm.node.SourceFileNode(path) )
+    NodeUpdater(jobs=1).update(archive_node)
+    return archive_node
+
+def read_any_archive(archive_node):
+    if isinstance(archive_node, jeolm.node.archive.ZipArchiveNode):
+        return read_archive(archive_node)
+    if isinstance(archive_node, jeolm.node.archive.TarXzArchiveNode):
+        compressed = lzma.decompress(archive_node.path.read_bytes())
+        archive_stream = io.BytesIO(compressed)
+    elif isinstance(archive_node, jeolm.node.archive.TarZstArchiveNode):
+        archive_stream = io.BytesIO(subprocess.run(
+            ['zstd', '--decompress', '--stdout', str(archive_node.path)],
+            stdout=subprocess.PIPE, check=True ).stdout)
+    else:
+        archive_stream = io.BytesIO(
+            gzip.decompress(archive_node.path.read_bytes()) )
+    with tarfile.open(fileobj=archive_stream) as archive:
+        return { member.name: archive.extractfile(member).read()
+            for member in archive.getmembers() }
+
+@pytest.mark.parametrize('archive_node_class', ARCHIVE_NODE_CLASSES)
+def test_members_are_streamed_in_chunks( tmp_path, monkeypatch,
+    archive_node_class,
+):
+    if archive_node_class.default_suffix == '.tar.zst' and \
+            shutil.which('zstd') is None:
+        pytest.skip("zstd is not available")
+    if archive_node_class.default_suffix == '.tar.xz' and \
+            shutil.which('xz') is None:
+        pytest.skip("xz is not available")
+    monkeypatch.setattr( jeolm.node.archive._BaseArchiveCommand.Archiver,
+        'chunk_size', 16 )
+    contents = { 'large': bytes(range(256)) * 10, 'small': b'small',
+        'empty': b'' }
+    archive_node = build_archive(tmp_path, archive_node_class, contents)
+    assert read_any_archive(archive_node) == contents
+
+def test_archive_is_reproducible(tmp_path):
+    contents = {'a': b'a content', 'b': b'b content'}
+    archive_paths = []
+    for name in ('first', 'second'):
+        (tmp_path / name).mkdir()
+        archive_paths.append(build_archive( tmp_path / name,
+            jeolm.node.archive.TgzArchiveNode, contents ).path)
+        time.sleep(0.01)
+    first_path, second_path = archive_paths
+    assert first_path.read_bytes() == second_path.read_bytes()
+
+def test_unchanged_archive_is_not_rewritten(tmp_path, monkeypatch):
+    contents = {'a': b'a content'}
+    archive_node = build_archive( tmp_path,
+        jeolm.node.archive.ZipArchiveNode, contents )
+    archive_bytes = archive_node.path.read_bytes()
+    def write_archive(self, archive_path, mtime_clamp):
+        raise AssertionError("archive rewritten")
+    monkeypatch.setattr( jeolm.node.archive._BaseArchiveCommand,
+        '_write_archive', write_archive )
+    # same content, but newer than the archive
+    time.sleep(0.01)
+    rebuilt_archive_node = build_archive( tmp_path,
+        jeolm.node.archive.ZipArchiveNode, contents )
+    assert rebuilt_archive_node.updated
+    assert rebuilt_archive_node.path.read_bytes() == archive_bytes
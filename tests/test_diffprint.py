@@ -0,0 +1,63 @@
+import logging
+from pathlib import PurePosixPath
+
+import pytest
+
+import jeolm.commands
+from jeolm.commands.diffprint import log_metadata_diff
+from jeolm.records import RecordPath
+
+
+@pytest.fixture
+def metadata(project):
+    metadata = project.metadata_class(project=project)
+    metadata.load_metadata_cache()
+    return metadata
+
+def review_changes(project, metadata):
+    source_dir = project.source_dir
+    (source_dir / 'test' / 'added.tex').write_text(
+        '% $date: 2020-01-01\n' )
+    mathfont_path = source_dir / 'test' / 'mathfont.tex'
+    mathfont_path.write_text(
+        '% $date: 2021-02-03\n' + mathfont_path.read_text() )
+    for inpath in ('test/added.tex', 'test/mathfont.tex'):
+        metadata.review(PurePosixPath(inpath))
+
+def test_log_metadata_diff(project, metadata, caplog):
+    with caplog.at_level(logging.INFO, logger='test'):
+        with log_metadata_diff(metadata, logger=logging.getLogger('test')):
+            review_changes(project, metadata)
+    headers = [ record.getMessage().splitlines()[0]
+        for record in caplog.records if record.name == 'test' ]
+    assert headers == [
+        '<BOLD><YELLOW>/test/<NOCOLOUR> metarecord changed<REGULAR>',
+        '<BOLD><YELLOW>/test/mathfont/<NOCOLOUR> metarecord changed<REGULAR>',
+        '<BOLD><GREEN>/test/added/<NOCOLOUR> metarecord added<REGULAR>',
+    ]
+
+def test_fed_records_are_refed(project, metadata, monkeypatch):
+    driver = project.driver_class()
+    metadata.feed_metadata(driver)
+    digests = {
+        path: driver.digest(path, original=True)
+        for path in (RecordPath('_style'), RecordPath('test', 'figures')) }
+    def feed_metadata(records):
+        raise AssertionError("whole metadata fed")
+    monkeypatch.setattr(metadata, 'feed_metadata', feed_metadata)
+    with log_metadata_diff(metadata, fed_records=driver):
+        review_changes(project, metadata)
+    monkeypatch.undo()
+    # digests of unchanged subtrees are kept
+    for path, digest in digests.items():
+        assert driver._digest_cache[path, True] == digest
+    fresh_driver = project.driver_class()
+    metadata.feed_metadata(fresh_driver)
+    assert list(driver.items()) == list(fresh_driver.items())
+
+def test_no_changes(project, metadata, caplog):
+    with caplog.at_level(logging.INFO, logger='test'):
+        with log_metadata_diff(metadata, logger=logging.getLogger('test')):
+            metadata.review(PurePosixPath('test'))
+    assert not [ record for record in caplog.records
+        if record.name == 'test' ]
@@ -0,0 +1,64 @@
+from pathlib import PurePosixPath
+
+import pytest
+
+from jeolm.records import RecordPath
+from jeolm.driver.recipe_cache import RecipeCache
+
+
+def load_fed_driver(project):
+    metadata = project.metadata_class(project=project)
+    metadata.load_metadata_cache()
+    return metadata, metadata.load_fed_driver(project.driver_class)
+
+def forbid_feeding(monkeypatch, project):
+    def feed_metadata(self, records):
+        raise AssertionError("metadata fed")
+    monkeypatch.setattr(project.metadata_class, 'feed_metadata', feed_metadata)
+
+
+def test_fed_snapshot_is_reused(project, monkeypatch):
+    unused, driver = load_fed_driver(project)
+    assert project.build_dir.joinpath('driver.cache.pickle').exists()
+    forbid_feeding(monkeypatch, project)
+    unused, reloaded_driver = load_fed_driver(project)
+    assert list(reloaded_driver.items()) == list(driver.items())
+    assert ( reloaded_driver._attribute_index.keys() ==
+        driver._attribute_index.keys() )
+
+def test_fed_snapshot_follows_metadata_changes(project, monkeypatch):
+    load_fed_driver(project)
+    (project.source_dir / 'test' / 'added.tex').write_text('added\n')
+    metadata = project.metadata_class(project=project)
+    metadata.load_metadata_cache()
+    metadata.review(PurePosixPath('test/added.tex'))
+    # unsaved changes are not covered by the snapshot
+    forbid_feeding(monkeypatch, project)
+    with pytest.raises(AssertionError):
+        metadata.load_fed_driver(project.driver_class)
+    monkeypatch.undo()
+    metadata.dump_metadata_cache()
+    unused, driver = load_fed_driver(project)
+    assert RecordPath('test', 'added') in driver
+
+def test_broken_fed_snapshot_is_replaced(project):
+    unused, driver = load_fed_driver(project)
+    project.build_dir.joinpath('driver.cache.pickle').write_bytes(b'garbage')
+    unused, reloaded_driver = load_fed_driver(project)
+    assert list(reloaded_driver.items()) == list(driver.items())
+
+def test_fed_snapshot_follows_code_changes(project, monkeypatch):
+    load_fed_driver(project)
+    get_driver_key = RecipeCache.get_driver_key.__func__
+    monkeypatch.setattr( RecipeCache, 'get_driver_key',
+        classmethod(lambda cls, driver_class:
+            ('changed', get_driver_key(cls, driver_class)) ) )
+    feedings = []
+    feed_metadata = project.metadata_class.feed_metadata
+    def counting_feed_metadata(self, records):
+        feedings.append(records)
+        return feed_metadata(self, records)
+    monkeypatch.setattr( project.metadata_class, 'feed_metadata',
+        counting_feed_metadata )
+    load_fed_driver(project)
+    assert len(feedings) == 1
@@ -0,0 +1,65 @@
+import pickle
+
+import pytest
+
+import jeolm.target
+from jeolm.target import FlagContainer, FlagTable, FlagError
+
+
+def test_equal_flag_sets_are_equal():
+    flags = FlagContainer(['a', 'b'])
+    derived_flags = FlagContainer(['a', 'c']).union(['b']).difference(['c'])
+    assert derived_flags == flags
+    assert hash(derived_flags) == hash(flags)
+    assert derived_flags.as_frozenset is flags.as_frozenset
+    assert derived_flags != FlagContainer(['a'])
+
+def test_query_without_utilization():
+    flags = FlagContainer(['a', 'b']).difference(['b'])
+    assert flags.issuperset(['a', '-b', '-never-seen'], utilize=False)
+    assert not flags.issuperset(['b'], utilize=False)
+    assert not flags.issuperset(['never-seen'], utilize=False)
+    with pytest.raises(FlagError):
+        flags.issuperset(['--a'], utilize=False)
+    with pytest.raises(jeolm.target.UnutilizedFlagError):
+        flags.check_unutilized_flags()
+
+def test_query_with_utilization():
+    parent_flags = FlagContainer(['a', 'b'])
+    flags = parent_flags.difference(['b'])
+    assert 'a' in flags
+    assert '-b' in flags
+    parent_flags.check_unutilized_flags()
+
+@pytest.mark.parametrize('flags, expected', [
+    (['a'], 'a'),
+    (['a', 'b'], 'ab'),
+    (['a', 'c'], 'a-c'),
+    ([], 'none'),
+])
+def test_select_matching_value(flags, expected):
+    mapping = { frozenset(): 'none', frozenset(['a']): 'a',
+        frozenset(['a', 'b']): 'ab', frozenset(['a', '-b', 'c']): 'a-c' }
+    container = FlagContainer(flags)
+    assert container.select_matching_value(mapping) == expected
+    container.check_unutilized_flags()
+
+def test_pickled_flags_follow_flag_table(monkeypatch):
+    flags = FlagContainer(['a', 'b']).union(['c'])
+    pickled_flags = pickle.dumps(flags)
+    # bits of another process
+    flag_table = FlagTable()
+    flag_table.bits(['c', 'unrelated', 'b'])
+    monkeypatch.setattr(jeolm.target, 'flag_table', flag_table)
+    unpickled_flags = pickle.loads(pickled_flags)
+    assert unpickled_flags == FlagContainer(['a', 'b', 'c'])
+    assert unpickled_flags.as_frozenset == frozenset(['a', 'b', 'c'])
+    assert 'unrelated' not in unpickled_flags
+
+def test_flag_table_interns_frozensets():
+    flag_table = FlagTable()
+    bits = flag_table.bits(['x', 'y'])
+    assert flag_table.to_frozenset(bits) == frozenset(['x', 'y'])
+    assert flag_table.to_frozenset(bits) is flag_table.to_frozenset(bits)
+    assert flag_table.relative_bits(frozenset(['x', '-y'])) == (
+        flag_table.bit('x'), flag_table.bit('y') )
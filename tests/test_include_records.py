@@ -0,0 +1,40 @@
+from jeolm.records import RecordPath
+from jeolm.driver.include import IncludingRecords
+
+
+def make_records():
+    records = IncludingRecords()
+    records.absorb({
+        'lib': {'$a': 1,
+            'x': {'$b': 2, '$include': ['../y']},
+            'y': {'$c': 3, 'z': {'$d': 4}} },
+        'doc': {'$a': 5, '$include': ['../lib'],
+            'x': {'$e': 6}, 'w': {'$f': 7}},
+    })
+    return records
+
+def test_include_subrecords_are_tracked():
+    records = make_records()
+    with records.tracking_reads() as read_paths:
+        record = records.get(RecordPath('doc', 'x'))
+    assert record['$b'] == 2 and record['$e'] == 6
+    for path in ( RecordPath('lib'), RecordPath('lib', 'x'),
+            RecordPath('lib', 'y'), RecordPath('lib', 'y', 'z') ):
+        assert path in read_paths, path
+
+def test_include_tracked_on_cache_hit():
+    records = make_records()
+    records.get(RecordPath('doc', 'w'))
+    with records.tracking_reads() as read_paths:
+        records.get(RecordPath('doc', 'w'))
+    assert RecordPath('lib', 'x') in read_paths
+
+def test_include_fingerprints_change():
+    records = make_records()
+    with records.tracking_reads() as read_paths:
+        records.get(RecordPath('doc'))
+    fingerprints = {path: records.fingerprint(path) for path in read_paths}
+    records.absorb({'$b': 20}, RecordPath('lib', 'x'))
+    assert records.get(RecordPath('doc', 'x'))['$b'] == 20
+    assert any( records.fingerprint(path) != fingerprint
+        for path, fingerprint in fingerprints.items() )
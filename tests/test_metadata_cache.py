@@ -0,0 +1,56 @@
+import pickle
+import shutil
+from pathlib import PurePosixPath
+
+import jeolm.metadata_store
+from jeolm.metadata import MetadataPath
+
+
+def load_metadata(project):
+    metadata = project.metadata_class(project=project)
+    metadata.load_metadata_cache()
+    return metadata
+
+def record_saves(monkeypatch):
+    saves = []
+    save = jeolm.metadata_store.MetadataStore.save
+    def recording_save(self, records, changed_parts):
+        changed_parts = list(changed_parts)
+        saves.append(changed_parts)
+        return save(self, records, changed_parts)
+    monkeypatch.setattr( jeolm.metadata_store.MetadataStore, 'save',
+        recording_save )
+    return saves
+
+
+def test_cache_round_trip(project):
+    metadata = load_metadata(project)
+    metadata.absorb( {'$extra': 'value'},
+        MetadataPath('test', 'extra.yaml') )
+    metadata.dump_metadata_cache()
+    reloaded_metadata = load_metadata(project)
+    assert list(reloaded_metadata.items()) == list(metadata.items())
+    assert ( reloaded_metadata._attribute_index ==
+        metadata._attribute_index )
+
+def test_only_changed_paths_are_saved(project, monkeypatch):
+    saves = record_saves(monkeypatch)
+    metadata = load_metadata(project)
+    metadata.dump_metadata_cache()
+    (project.source_dir / 'test' / 'added.tex').write_text('added\n')
+    metadata.review(PurePosixPath('test/added.tex'))
+    metadata.dump_metadata_cache()
+    assert saves == [[], [('test', 'added.tex')]]
+    assert MetadataPath('test', 'added.tex') in load_metadata(project)
+
+def test_legacy_cache_is_migrated(project):
+    records = list(load_metadata(project).items())
+    legacy_path = project.build_dir / 'metadata.cache.pickle'
+    metadata = load_metadata(project)
+    legacy_path.write_bytes(pickle.dumps(metadata._records))
+    shutil.rmtree(str(project.build_dir / 'metadata.cache'))
+    metadata = load_metadata(project)
+    assert list(metadata.items()) == records
+    metadata.dump_metadata_cache()
+    assert not legacy_path.exists()
+    assert list(load_metadata(project).items()) == records
@@ -0,0 +1,162 @@
+import os
+import pickle
+import shutil
+import logging
+import multiprocessing
+from pathlib import PosixPath
+
+import pytest
+
+import jeolm.metadata_store
+from jeolm.metadata_store import MetadataStore
+
+
+def make_records():
+    return {
+        '$root': {'$attr': 'root'},
+        'alpha': {'$attr': 'a', 'sub': {'$attr': 'a/sub'}},
+        'beta': {'$attr': 'b'},
+    }
+
+def current_generation(store):
+    return store._read_current()
+
+@pytest.fixture
+def store(tmp_path):
+    store = MetadataStore(tmp_path / 'metadata.cache')
+    store.save(make_records(), [()])
+    return store
+
+
+def test_absent_store_loads_none(tmp_path):
+    assert MetadataStore(tmp_path / 'metadata.cache').load() is None
+
+def test_full_save_writes_empty_journal(store):
+    generation = current_generation(store)
+    assert store._journal_path(generation).stat().st_size == 0
+    assert MetadataStore(store.path).load() == make_records()
+
+def test_journal_replay(store):
+    generation = current_generation(store)
+    shard_path = store._shard_path(generation, 'alpha')
+    shard_mtime = shard_path.stat().st_mtime_ns
+    records = make_records()
+    records['alpha']['sub']['$attr'] = 'changed'
+    del records['beta']
+    records['gamma'] = {'$attr': 'g'}
+    store.save( records,
+        [('alpha', 'sub'), ('alpha', 'sub', '$attr'), ('beta',), ('gamma',)] )
+    assert current_generation(store) == generation
+    assert store._journal_path(generation).stat().st_size > 0
+    assert shard_path.stat().st_mtime_ns == shard_mtime
+    assert MetadataStore(store.path).load() == records
+
+def test_compaction(store):
+    store.journal_size_limit = 0
+    old_generation = current_generation(store)
+    records = make_records()
+    records['beta']['$attr'] = 'changed'
+    store.save(records, [('beta',)])
+    generation = current_generation(store)
+    assert generation != old_generation
+    assert not (store.path / old_generation).exists()
+    assert store._journal_path(generation).stat().st_size == 0
+    assert MetadataStore(store.path).load() == records
+
+def test_concurrent_writers_merge(store):
+    first = MetadataStore(store.path)
+    second = MetadataStore(store.path)
+    first_records = first.load()
+    second_records = second.load()
+    first_records['alpha']['$attr'] = 'first'
+    second_records['beta']['$attr'] = 'second'
+    first.save(first_records, [('alpha',)])
+    second.save(second_records, [('beta',)])
+    records = MetadataStore(store.path).load()
+    assert records['alpha']['$attr'] == 'first'
+    assert records['beta']['$attr'] == 'second'
+
+def _save_name(path, name):
+    store = MetadataStore(path)
+    records = store.load()
+    records[name] = {'$attr': name}
+    store.save(records, [(name,)])
+
+def test_concurrent_save_processes(store):
+    names = ['writer{}'.format(index) for index in range(8)]
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=_save_name, args=(store.path, name))
+        for name in names ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    records = MetadataStore(store.path).load()
+    for name in names:
+        assert records[name] == {'$attr': name}
+    assert records['alpha'] == make_records()['alpha']
+
+def test_crash_mid_append(store, caplog):
+    records = make_records()
+    records['beta']['$attr'] = 'saved'
+    store.save(records, [('beta',)])
+    journal_path = store._journal_path(current_generation(store))
+    valid_size = journal_path.stat().st_size
+    # the writer was killed in the middle of an entry
+    entry = store._format_journal_entry(('alpha',), {'$attr': 'lost'})
+    with journal_path.open('ab') as journal_file:
+        journal_file.write(entry[:len(entry) // 2])
+
+    assert MetadataStore(store.path).load() == records
+
+    records['alpha']['$attr'] = 'after crash'
+    with caplog.at_level(logging.WARNING, logger='jeolm.metadata_store'):
+        store.save(records, [('alpha',)])
+    assert 'incomplete entry' in caplog.text
+    assert journal_path.stat().st_size == valid_size + len(
+        store._format_journal_entry(('alpha',), records['alpha']) )
+    assert MetadataStore(store.path).load() == records
+
+def test_missing_journal(store, caplog):
+    os.unlink(str(store._journal_path(current_generation(store))))
+    with caplog.at_level(logging.WARNING, logger='jeolm.metadata_store'):
+        assert MetadataStore(store.path).load() is None
+    assert 'is broken' in caplog.text
+    records = make_records()
+    records['beta']['$attr'] = 'rewritten'
+    store.save(records, [('beta',)])
+    assert MetadataStore(store.path).load() == records
+
+def test_generation_removed_while_loading(store, monkeypatch):
+    records = make_records()
+    for index in range(4):
+        records['extra{}'.format(index)] = {'$attr': index}
+    store.save(records, [()])
+    writer = MetadataStore(store.path)
+    writer.journal_size_limit = 0
+    records['beta']['$attr'] = 'compacted'
+    compacted = []
+    original_load = pickle.load
+    original_rmtree = shutil.rmtree
+    def partial_rmtree(path, **kwargs):
+        # the writer is still removing the old generation, when the
+        # reader lists its shards
+        shard_paths = sorted((PosixPath(path) / 'shards').iterdir())
+        for shard_path in shard_paths[:len(shard_paths) // 2]:
+            shard_path.unlink()
+    def load_during_compaction(file):
+        value = original_load(file)
+        if file.name.endswith('root.pickle') and not compacted:
+            compacted.append(True)
+            monkeypatch.setattr( jeolm.metadata_store.shutil, 'rmtree',
+                partial_rmtree )
+            writer.save(records, [('beta',)])
+            monkeypatch.setattr( jeolm.metadata_store.shutil, 'rmtree',
+                original_rmtree )
+        return value
+    monkeypatch.setattr( jeolm.metadata_store.pickle, 'load',
+        load_during_compaction )
+    assert MetadataStore(store.path).load() == records
+    assert compacted
@@ -0,0 +1,58 @@
+from pathlib import PurePosixPath
+
+import pytest
+
+from jeolm.node_factory.target import TargetNodeFactory
+from jeolm.target import Target
+
+
+MATHFONT = Target.from_string('/test/mathfont')
+OTHER = Target.from_string('/test/other')
+
+@pytest.fixture
+def metadata(project):
+    metadata = project.metadata_class(project=project)
+    metadata.load_metadata_cache()
+    (project.source_dir / 'test' / 'other.tex').write_text('Other.\n')
+    metadata.review(PurePosixPath('test/other.tex'))
+    return metadata
+
+@pytest.fixture
+def target_node_factory(project, metadata):
+    driver = project.driver_class()
+    metadata.feed_metadata(driver)
+    return TargetNodeFactory( project=project, driver=driver,
+        persistent_recipes=False )
+
+def change_source(project, metadata, driver, source_path, text):
+    (project.source_dir / source_path).write_text(text)
+    metadata.review(source_path)
+    metadata.refeed_metadata(driver, [source_path])
+
+
+def test_unchanged_nodes_are_reused(target_node_factory):
+    document_node_factory = target_node_factory.document_node_factory
+    document_nodes = { target: document_node_factory(target)
+        for target in (MATHFONT, OTHER) }
+    for node in document_nodes.values():
+        node.updated = True
+    target_node_factory.refresh()
+    for target, node in document_nodes.items():
+        assert target_node_factory.document_node_factory(target) is node
+        assert not node.updated
+
+def test_changed_nodes_are_discarded( project, metadata,
+    target_node_factory,
+):
+    document_node_factory = target_node_factory.document_node_factory
+    document_nodes = { target: document_node_factory(target)
+        for target in (MATHFONT, OTHER) }
+    source_path = PurePosixPath('test/mathfont.tex')
+    change_source( project, metadata, target_node_factory.driver,
+        source_path,
+        (project.source_dir / source_path).read_text() + '% $caption: X\n' )
+    target_node_factory.refresh()
+    assert ( target_node_factory.document_node_factory(MATHFONT) is not
+        document_nodes[MATHFONT] )
+    assert ( target_node_factory.document_node_factory(OTHER) is
+        document_nodes[OTHER] )
@@ -0,0 +1,43 @@
+import threading
+
+import pytest
+
+from jeolm.node import Node, NodeErrorReported, run_in_background
+from jeolm.node.updater import NodeUpdater
+
+
+class CallingNode(Node):
+
+    def __init__(self, function, *, name=None, needs=()):
+        super().__init__(name=name, needs=needs)
+        self.function = function
+        self.result = None
+
+    async def update_self(self):
+        self.result = await run_in_background(self.function)
+        self.updated = True
+
+
+def test_background_call_result():
+    node = CallingNode(lambda: 42)
+    NodeUpdater(jobs=1).update(node)
+    assert node.updated
+    assert node.result == 42
+
+def test_background_call_exception():
+    def fail():
+        raise RuntimeError("failed")
+    node = CallingNode(fail)
+    with pytest.raises(NodeErrorReported):
+        NodeUpdater(jobs=1).update(node)
+    assert not node.updated
+
+def test_background_calls_run_in_parallel():
+    # each call waits for the other one, so they must run simultaneously
+    barrier = threading.Barrier(2, timeout=10)
+    calling_nodes = [ CallingNode(barrier.wait, name=f'calling:{index}')
+        for index in range(2) ]
+    target_node = Node(name='target', needs=calling_nodes)
+    NodeUpdater(jobs=2).update(target_node)
+    assert all(node.updated for node in calling_nodes)
+    assert not barrier.broken
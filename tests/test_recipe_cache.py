@@ -0,0 +1,129 @@
+import logging
+import threading
+
+import pytest
+
+import jeolm.commands
+import jeolm.driver.recipe_cache
+from jeolm.driver.recipe_cache import RecipeCache
+from jeolm.records import RecordPath
+from jeolm.target import Target
+
+
+TARGET = Target.from_string('/test/mathfont')
+
+@pytest.fixture
+def driver(project):
+    return jeolm.commands.simple_load_driver(project)
+
+@pytest.fixture
+def cache_path(project):
+    return project.build_dir / 'recipe.cache.pickle'
+
+@pytest.fixture
+def many_cpus(monkeypatch):
+    monkeypatch.setattr(jeolm.driver.recipe_cache.os, 'cpu_count', lambda: 4)
+
+def forbid_production(monkeypatch):
+    def produce_recipe(driver, target):
+        raise AssertionError("recipe produced")
+    monkeypatch.setattr( jeolm.driver.recipe_cache, '_produce_recipe',
+        produce_recipe )
+
+
+def test_saved_recipe_is_reused(driver, cache_path, monkeypatch):
+    cache = RecipeCache(driver, cache_path)
+    recipe = cache.produce_document_recipe(TARGET)
+    cache.save()
+    forbid_production(monkeypatch)
+    reloaded = RecipeCache(driver, cache_path)
+    assert reloaded.produce_document_recipe(TARGET).outname == recipe.outname
+
+def test_record_change_invalidates(driver, cache_path):
+    cache = RecipeCache(driver, cache_path)
+    cache.produce_document_recipe(TARGET)
+    dependency_paths = {
+        path for path, fingerprint in cache.get_dependencies(TARGET) }
+    assert RecordPath('test', 'mathfont') in dependency_paths
+    assert cache._lookup(str(TARGET)) is not None
+    driver.absorb({'$changed': True}, RecordPath('test', 'mathfont'))
+    # checked entries are trusted until checks expire
+    assert cache._lookup(str(TARGET)) is not None
+    cache.expire_checks()
+    assert cache._lookup(str(TARGET)) is None
+
+def test_unrelated_change_keeps_recipe(driver, cache_path):
+    cache = RecipeCache(driver, cache_path)
+    cache.produce_document_recipe(TARGET)
+    driver.absorb({'$changed': True}, RecordPath('test', 'figures'))
+    cache.expire_checks()
+    assert cache._lookup(str(TARGET)) is not None
+
+def test_driver_change_discards_cache(driver, cache_path, monkeypatch):
+    cache = RecipeCache(driver, cache_path)
+    cache.produce_document_recipe(TARGET)
+    cache.save()
+    monkeypatch.setattr( RecipeCache, 'get_driver_key',
+        classmethod(lambda cls, driver_class: 'other driver') )
+    assert RecipeCache(driver, cache_path)._lookup(str(TARGET)) is None
+
+def test_driver_key_covers_dependency_modules(driver):
+    driver_key = RecipeCache.get_driver_key(type(driver))
+    module_files = {module_file for module_file, version in driver_key[1]}
+    for module in RecipeCache._dependency_modules:
+        assert module.__file__ in module_files
+
+def test_prefetch_in_workers(
+    driver, cache_path, monkeypatch, many_cpus
+):
+    targets = [TARGET, Target.from_string('/test/figures')]
+    cache = RecipeCache(driver, cache_path)
+    prefetched = list(cache.prefetch_document_recipes(targets, jobs=2))
+    assert sorted(map(str, prefetched)) == sorted(map(str, targets))
+    forbid_production(monkeypatch)
+    for target in targets:
+        cache.produce_document_recipe(target)
+
+def test_prefetch_worker_error_is_logged(
+    driver, cache_path, monkeypatch, caplog, many_cpus
+):
+    def produce_recipe(driver, target):
+        raise RuntimeError("worker failure")
+    monkeypatch.setattr( jeolm.driver.recipe_cache, '_produce_recipe',
+        produce_recipe )
+    targets = [TARGET, Target.from_string('/test/figures')]
+    cache = RecipeCache(driver, cache_path)
+    with caplog.at_level(logging.WARNING, logger='jeolm.driver.recipe_cache'):
+        prefetched = list(cache.prefetch_document_recipes(targets, jobs=2))
+    assert len(prefetched) == 2
+    assert 'worker failure' in caplog.text
+
+def test_prefetch_does_not_fork_with_threads(
+    driver, cache_path, monkeypatch, many_cpus
+):
+    monkeypatch.setattr( jeolm.driver.recipe_cache, 'ProcessPoolExecutor',
+        None )
+    targets = [TARGET, Target.from_string('/test/figures')]
+    cache = RecipeCache(driver, cache_path)
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        prefetched = list(cache.prefetch_document_recipes(targets, jobs=2))
+    finally:
+        stop.set()
+        thread.join()
+    assert prefetched == targets
+
+def test_prefetch_unpicklable_recipe(
+    driver, cache_path, monkeypatch, many_cpus
+):
+    def produce_recipe(driver, target):
+        return (lambda: target), ()
+    monkeypatch.setattr( jeolm.driver.recipe_cache, '_produce_recipe',
+        produce_recipe )
+    targets = [TARGET, Target.from_string('/test/figures')]
+    cache = RecipeCache(driver, cache_path)
+    prefetched = list(cache.prefetch_document_recipes(targets, jobs=2))
+    assert len(prefetched) == 2
+    assert all(cache._lookup(str(target)) is None for target in targets)
@@ -0,0 +1,47 @@
+from pathlib import PurePosixPath
+
+
+def load_metadata(project):
+    metadata = project.metadata_class(project=project)
+    metadata.load_metadata_cache()
+    return metadata
+
+def record_queries(monkeypatch, project):
+    queried = []
+    query_file = project.metadata_class._query_file
+    def recording_query_file(self, source_path):
+        queried.append(source_path)
+        return query_file(self, source_path)
+    monkeypatch.setattr( project.metadata_class, '_query_file',
+        recording_query_file )
+    return queried
+
+
+def test_unchanged_files_are_not_queried(project, monkeypatch):
+    queried = record_queries(monkeypatch, project)
+    metadata = load_metadata(project)
+    metadata.review(PurePosixPath('.'))
+    assert queried == []
+    assert metadata.find_stale_paths() == []
+
+def test_changed_file_is_queried(project, monkeypatch):
+    source_path = PurePosixPath('test/mathfont.tex')
+    with (project.source_dir / source_path).open('a') as source_file:
+        source_file.write('% changed\n')
+    queried = record_queries(monkeypatch, project)
+    metadata = load_metadata(project)
+    assert metadata.find_stale_paths() == [source_path]
+    metadata.review(PurePosixPath('.'))
+    assert queried == [source_path]
+
+def test_files_are_queried_after_code_changes(project, monkeypatch):
+    reviewed_paths = load_metadata(project).find_stale_paths()
+    monkeypatch.setattr( project.metadata_class, '_get_query_version',
+        lambda self: 'changed' )
+    queried = record_queries(monkeypatch, project)
+    metadata = load_metadata(project)
+    stale_paths = metadata.find_stale_paths()
+    assert stale_paths
+    metadata.review(PurePosixPath('.'))
+    assert sorted(queried) == sorted(stale_paths)
+    assert metadata.find_stale_paths() == reviewed_paths == []
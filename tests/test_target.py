@@ -0,0 +1,22 @@
+import pytest
+
+from jeolm.target import FlagContainer, FlagError
+
+
+@pytest.mark.parametrize('condition, expected', [
+    ({'or': ['a', {}]}, True),
+    (['-a', {'not': 'x', 'or': []}], False),
+    ({'or': ['b', ['a', {'not': 'c'}]]}, True),
+    ({'and': ['b', {'bad': 'key'}]}, False),
+])
+def test_unreached_malformed_branch(condition, expected):
+    assert FlagContainer(['a']).check_condition(condition) is expected
+
+@pytest.mark.parametrize('condition', [
+    {'or': ['b', {'bad': 'key'}]},
+    ['a', {'not': 'x', 'or': []}],
+    ['a', '--a'],
+])
+def test_reached_malformed_branch(condition):
+    with pytest.raises(FlagError):
+        FlagContainer(['a']).check_condition(condition)
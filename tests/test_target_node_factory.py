@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import pytest
+
+import jeolm.commands
+import jeolm.node
+import jeolm.node.symlink
+from jeolm.driver import DriverError
+from jeolm.node_factory.target import TargetNodeFactory
+from jeolm.node_factory.archive import ZipBundleArchiveNode
+from jeolm.target import Target
+
+
+TARGETS = [ Target.from_string('/test/mathfont'),
+    Target.from_string('/test/figures') ]
+
+@pytest.fixture
+def target_node_factory(project, monkeypatch):
+    driver = jeolm.commands.simple_load_driver(project)
+    factory = TargetNodeFactory( project=project, driver=driver,
+        persistent_recipes=False )
+    # all documents share the outname
+    constructed = []
+    def document_node_factory(target):
+        document_node = jeolm.node.FileNode(
+            project.build_dir / f'{len(constructed)}.pdf' )
+        document_node.outname = 'same'
+        constructed.append(target)
+        return document_node
+    monkeypatch.setattr( factory, 'document_node_factory',
+        document_node_factory )
+    factory.constructed = constructed
+    return factory
+
+
+def test_bundle_node_class_follows_suffix():
+    assert ( TargetNodeFactory.get_bundle_node_class(Path('a.zip')) is
+        ZipBundleArchiveNode )
+    with pytest.raises(ValueError):
+        TargetNodeFactory.get_bundle_node_class(Path('a.rar'))
+
+def test_bad_bundle_suffix_fails_before_documents(target_node_factory):
+    nodes = target_node_factory.generate_nodes( TARGETS,
+        delegate=False, bundle=Path('a.rar') )
+    with pytest.raises(ValueError):
+        next(nodes)
+    assert target_node_factory.constructed == []
+
+def test_duplicate_outnames_fail_bundle(target_node_factory):
+    nodes = target_node_factory.generate_nodes( TARGETS,
+        delegate=False, bundle=Path('a.zip') )
+    first_node = next(nodes)
+    assert isinstance(first_node, jeolm.node.symlink.SymLinkedFileNode)
+    with pytest.raises(DriverError, match="same outname 'same'"):
+        next(nodes)
+
+def test_duplicate_outnames_without_bundle(target_node_factory):
+    nodes = list(target_node_factory.generate_nodes( TARGETS,
+        delegate=False ))
+    assert len(target_node_factory.constructed) == 2
+    assert len(nodes) == 3
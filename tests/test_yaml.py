@@ -0,0 +1,53 @@
+import logging
+import pickle
+
+import pytest
+
+import jeolm.yaml
+from jeolm.yaml import LoadCache
+from jeolm.records import RecordPath
+
+
+TEXT = 'a: !path /x\nb: [1, 2]\n'
+
+def forbid_loading(monkeypatch):
+    def load(stream, Loader=None):
+        raise AssertionError("text loaded")
+    monkeypatch.setattr(jeolm.yaml, 'load', load)
+
+
+def test_load_returns_fresh_copies():
+    cache = LoadCache()
+    value = cache.load(TEXT)
+    assert value == {'a': RecordPath('x'), 'b': [1, 2]}
+    value['b'].append(3)
+    assert cache.load(TEXT) == {'a': RecordPath('x'), 'b': [1, 2]}
+
+def test_saved_cache_is_reused(tmp_path, monkeypatch):
+    cache = LoadCache(tmp_path / 'yaml.cache.pickle')
+    value = cache.load(TEXT)
+    cache.save()
+    forbid_loading(monkeypatch)
+    assert LoadCache(tmp_path / 'yaml.cache.pickle').load(TEXT) == value
+
+def test_loader_change_discards_cache(tmp_path, monkeypatch):
+    cache = LoadCache(tmp_path / 'yaml.cache.pickle')
+    cache.load(TEXT)
+    cache.save()
+    monkeypatch.setattr( LoadCache, 'loader_key',
+        ('OtherLoader', jeolm.yaml.LOADER_VERSION + 1) )
+    forbid_loading(monkeypatch)
+    with pytest.raises(AssertionError):
+        LoadCache(tmp_path / 'yaml.cache.pickle').load(TEXT)
+
+@pytest.mark.parametrize('content', [
+    b'garbage',
+    pickle.dumps((LoadCache.format_version - 1, {})),
+])
+def test_broken_or_old_cache_is_discarded(tmp_path, content):
+    path = tmp_path / 'yaml.cache.pickle'
+    path.write_bytes(content)
+    cache = LoadCache(path)
+    assert cache.load(TEXT) == {'a': RecordPath('x'), 'b': [1, 2]}
+    cache.save()
+    assert LoadCache(path)._get_entries()